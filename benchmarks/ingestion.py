@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the parse -> transform -> persist path of the log ingestion.
+
+Every benchmark runs in a fresh process on a generated access.log of
+the chosen scale and records its lines/sec and peak RSS. The results
+are compared with the stored baseline (benchmarks/baseline.json), a
+regression beyond the tolerance or a benchmark without a baseline
+exits with status 1.
+
+Run it from the project root:
+
+    python -m benchmarks.ingestion --scale 10k
+    python -m benchmarks.ingestion --scale 1m --only batch --only copy
+    python -m benchmarks.ingestion --scale 10k --save-baseline
+
+The persisting benchmarks drop and create all tables of --database-url
+(default: a temporary sqlite file), so only point it at a scratch
+database. The copy mode needs PostgreSQL.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from itertools import cycle, islice
+from os import path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from nydata.log_parser.generator import generate_nginx_log
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Parsing benchmarks cycle through this many lines kept in memory
+SAMPLE_SIZE = 100_000
+
+# Every benchmark is run this often and the fastest run is kept
+REPEAT = 3
+
+# Allowed relative slowdown (lines/sec) and growth (peak RSS) vs. the baseline
+TOLERANCE = 0.2
+
+BASELINE_PATH = path.join(path.dirname(path.abspath(__file__)), "baseline.json")
+
+# Seed of the generated access.log, the same log for every run
+SEED = 2016
+
+# Several lines share a second like on a busy server
+LINES_PER_SECOND = 20
+
+
+class BenchmarkConfig:
+    """Flask settings of the benchmark app"""
+
+    ENV = "production"
+    SECRET_KEY = "benchmark"
+    JWT_SECRET_KEY = "benchmark"
+    CACHE_TYPE = "null"
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_DATABASE_URI = None
+
+
+def sample_lines(file_path: str, num_lines: int) -> Iterator[str]:
+    """
+    Yield num_lines lines cycling through the first SAMPLE_SIZE lines.
+    """
+    with open(file_path) as file_conn:
+        sample = list(islice(file_conn, SAMPLE_SIZE))
+
+    return islice(cycle(sample), num_lines)
+
+
+# Every benchmark prepares its input (untimed) and returns the timed
+# run, which returns the number of processed lines.
+
+
+def bench_parse_nginx_log_line(file_path: str, num_lines: int) -> Callable[[], int]:
+    from nydata.log_parser.parser.parser import parse_nginx_log_line
+
+    lines = sample_lines(file_path, num_lines)
+    return lambda: sum(1 for line in lines if parse_nginx_log_line(line))
+
+
+def bench_extract_and_transform(file_path: str, num_lines: int) -> Callable[[], int]:
+    from nydata.log_parser.parser.pattern import get_nginx_log_regex
+    from nydata.log_parser.parser.transform import transform_nginx
+    from nydata.utils import extract_and_transform
+
+    pattern = get_nginx_log_regex()
+    lines = sample_lines(file_path, num_lines)
+    return lambda: sum(
+        1 for line in lines if extract_and_transform(pattern, transform_nginx, line)
+    )
+
+
+def bench_transform_nginx(file_path: str, num_lines: int) -> Callable[[], int]:
+    from nydata.log_parser.parser.pattern import get_nginx_log_regex
+    from nydata.log_parser.parser.transform import transform_nginx
+
+    pattern = get_nginx_log_regex()
+    matches = (
+        pattern.match(line)
+        for line in sample_lines(file_path, min(num_lines, SAMPLE_SIZE))
+    )
+    extracted = [matched.groupdict() for matched in matches if matched]
+    values = islice(cycle(extracted), num_lines)
+    return lambda: sum(1 for log_entry in values if transform_nginx(log_entry))
+
+
+def bench_save_logs_to_database(file_path: str, num_lines: int) -> Callable[[], int]:
+    from nydata.log_parser.data import NGINX
+    from nydata.log_parser.models import save_logs_to_database
+    from nydata.log_parser.parser.parser import parse_nginx_log_line
+
+    def run() -> int:
+        with open(file_path) as file_conn:
+            entries = (parse_nginx_log_line(line) for line in file_conn)
+            assert save_logs_to_database(NGINX, entries)
+        return num_lines
+
+    return run
+
+
+def ingestion_mode(mode: str, **options) -> Callable:
+    """
+    Benchmark parse_and_save_nginx_logs with one ingestion mode.
+    """
+
+    def bench(file_path: str, num_lines: int) -> Callable[[], int]:
+        from nydata.log_parser.log import parse_and_save_nginx_logs
+
+        def run() -> int:
+            assert parse_and_save_nginx_logs(file_path, mode=mode, **options)
+            return num_lines
+
+        return run
+
+    return bench
+
+
+# name -> (benchmark, needs a database)
+BENCHMARKS = {
+    "parse_nginx_log_line": (bench_parse_nginx_log_line, False),
+    "extract_and_transform": (bench_extract_and_transform, False),
+    "transform_nginx": (bench_transform_nginx, False),
+    "save_logs_to_database": (bench_save_logs_to_database, True),
+    "batch": (ingestion_mode("batch"), True),
+    "orm": (ingestion_mode("orm"), True),
+    "copy": (ingestion_mode("copy"), True),
+    "incremental": (ingestion_mode("batch", incremental=True), True),
+    "parallel": (ingestion_mode("batch", workers=4), True),
+}
+
+
+def peak_rss_in_mb() -> float:
+    """
+    Peak resident memory of this process and its (parsing) children.
+    """
+    peak_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak_kb / 1024
+
+
+def run_benchmark(
+    name: str, file_path: str, num_lines: int, database_url: str
+) -> Optional[Dict]:
+    """
+    Run one benchmark, in a fresh process started by measure.
+    """
+    from nydata.app import create_app
+    from nydata.database import db
+
+    benchmark, needs_database = BENCHMARKS[name]
+
+    BenchmarkConfig.SQLALCHEMY_DATABASE_URI = database_url
+    app = create_app(BenchmarkConfig)
+
+    with app.app_context():
+        if needs_database:
+            if name == "copy" and db.engine.dialect.name != "postgresql":
+                return None
+
+            db.drop_all()
+            db.create_all()
+
+        run = benchmark(file_path, num_lines)
+
+        start = time.perf_counter()
+        num_processed = run()
+        seconds = time.perf_counter() - start
+
+        db.session.remove()
+
+    return {
+        "lines": num_processed,
+        "seconds": round(seconds, 3),
+        "lines_per_sec": round(num_processed / seconds),
+        "peak_rss_mb": round(peak_rss_in_mb(), 1),
+    }
+
+
+def _run_in_child(results, *args):
+    results.put(run_benchmark(*args))
+
+
+def measure(
+    name: str, file_path: str, num_lines: int, database_url: str
+) -> Optional[Dict]:
+    """
+    Run a benchmark in a fresh (spawned) process, so the peak RSS
+    only covers this benchmark.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+
+    process = context.Process(
+        target=_run_in_child, args=(results, name, file_path, num_lines, database_url)
+    )
+    process.start()
+    process.join()
+
+    if process.exitcode != 0:
+        raise RuntimeError(f"[-] Benchmark {name} failed, exitcode={process.exitcode}")
+
+    return results.get()
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Get the regressions of a result compared to its baseline.
+    """
+    regressions = []
+    if result["lines_per_sec"] < baseline["lines_per_sec"] * (1 - tolerance):
+        regressions.append(
+            f"lines/sec {result['lines_per_sec']:,} "
+            f"< baseline {baseline['lines_per_sec']:,}"
+        )
+    if result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(
+            f"peak RSS {result['peak_rss_mb']} MB "
+            f"> baseline {baseline['peak_rss_mb']} MB"
+        )
+    return regressions
+
+
+def load_baselines() -> Dict:
+    if not path.exists(BASELINE_PATH):
+        return {}
+
+    with open(BASELINE_PATH) as file_conn:
+        return json.load(file_conn)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument(
+        "--only", action="append", choices=BENCHMARKS, help="Run only these benchmarks"
+    )
+    parser.add_argument("--database-url", help="Scratch database, it is wiped!")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as baseline"
+    )
+    args = parser.parse_args(argv)
+
+    num_lines = SCALES[args.scale]
+    baselines = load_baselines()
+    results = {}
+    regressions = 0
+    missing = 0
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        database_url = args.database_url or f"sqlite:///{work_dir}/benchmark.db"
+
+        file_path = path.join(work_dir, "access.log")
+        generate_nginx_log(
+            file_path,
+            num_lines=num_lines,
+            seed=SEED,
+            span_in_days=num_lines / LINES_PER_SECOND / 86400,
+        )
+        size_in_mb = os.path.getsize(file_path) / 1_000_000
+        print(f"[+] Benchmarking {num_lines:,} lines ({size_in_mb:,.0f} MB)")
+
+        for name in args.only or BENCHMARKS:
+            runs = [
+                measure(name, file_path, num_lines, database_url)
+                for _ in range(args.repeat)
+            ]
+            if runs[0] is None:
+                print(f"{name:<24} skipped, needs PostgreSQL")
+                continue
+
+            result = max(runs, key=lambda run: run["lines_per_sec"])
+            results[name] = result
+            print(
+                f"{name:<24} {result['seconds']:9.2f}s "
+                f"{result['lines_per_sec']:12,} lines/sec "
+                f"{result['peak_rss_mb']:9.1f} MB peak RSS"
+            )
+
+            baseline = baselines.get(args.scale, {}).get(name)
+            if baseline is None:
+                # without a baseline the benchmark could never regress
+                if not args.save_baseline:
+                    print(f"[-] NO BASELINE {name} for scale={args.scale}")
+                    missing += 1
+                continue
+
+            for regression in compare(result, baseline, args.tolerance):
+                print(f"[-] REGRESSION {name}: {regression}")
+                regressions += 1
+
+    if args.save_baseline:
+        baselines.setdefault(args.scale, {}).update(results)
+        with open(BASELINE_PATH, "w") as file_conn:
+            json.dump(baselines, file_conn, indent=2, sort_keys=True)
+        print(f"[+] Saved the baseline to path={BASELINE_PATH}")
+
+    if regressions:
+        print(
+            f"[-] {regressions} regressions beyond a tolerance of {args.tolerance:.0%}"
+        )
+    if missing:
+        print(f"[-] {missing} benchmarks without a baseline, run with --save-baseline")
+
+    if regressions or missing:
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the nginx time parsers with dateutil's fuzzy parser.
+
+Run it from the project root:
+
+    python -m benchmarks.time_parser
+"""
+import timeit
+from datetime import datetime, timedelta
+
+from dateutil import parser
+
+from nydata.log_parser.parser.transform import parse_fixed_nginx_time, parse_nginx_time
+
+NUM_LINES = 100_000
+LINES_PER_SECOND = 20
+
+
+def time_values(num_lines: int, lines_per_second: int):
+    """
+    $time_local values of a busy server: several lines share a second.
+    """
+    start = datetime(2016, 12, 7, 10, 34, 43)
+    return [
+        (start + timedelta(seconds=i // lines_per_second)).strftime(
+            "%d/%b/%Y:%H:%M:%S +0100"
+        )
+        for i in range(num_lines)
+    ]
+
+
+def measure(name: str, parse, values) -> float:
+    """
+    Parse all values once and print the lines per second.
+    """
+    seconds = timeit.timeit(lambda: [parse(value) for value in values], number=1)
+    print(f"{name:<28} {seconds:8.3f}s {len(values) / seconds:14,.0f} lines/sec")
+    return seconds
+
+
+def main():
+    values = time_values(NUM_LINES, LINES_PER_SECOND)
+    print(f"[+] Parsing {NUM_LINES} time values, {LINES_PER_SECOND} lines per second")
+
+    baseline = measure("dateutil fuzzy", lambda v: parser.parse(v, fuzzy=True), values)
+    fixed = measure("fixed layout", parse_fixed_nginx_time, values)
+
+    parse_nginx_time.cache_clear()
+    cached = measure("fixed layout + cache", parse_nginx_time, values)
+
+    print(f"[+] Speedup fixed layout: {baseline / fixed:.1f}x")
+    print(f"[+] Speedup fixed layout + cache: {baseline / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
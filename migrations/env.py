@@ -1,6 +1,7 @@
 from __future__ import with_statement
 
 import logging
+import re
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -27,6 +28,19 @@ config.set_main_option(
         'SQLALCHEMY_DATABASE_URI').replace('%', '%%'))
 target_metadata = current_app.extensions['migrate'].db.metadata
 
+# The monthly partitions of log_lines are managed by
+# `flask partition-logs` and not by the models.
+LOG_LINE_PARTITION = re.compile(r'^log_lines_(y\d{4}m\d{2}|default)$')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and LOG_LINE_PARTITION.match(name):
+        return False
+    if type_ == 'index' and LOG_LINE_PARTITION.match(object.table.name):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -83,6 +97,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
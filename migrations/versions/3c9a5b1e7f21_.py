@@ -0,0 +1,88 @@
+"""stable log line digests with a unique hash_code
+
+Revision ID: 3c9a5b1e7f21
+Revises: da4430a3f8f7
+Create Date: 2020-01-14 20:41:12.318904
+
+"""
+from hashlib import blake2b
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a5b1e7f21'
+down_revision = 'da4430a3f8f7'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 10000
+DIGEST_LENGTH = 64
+
+log_lines = sa.table(
+    'log_lines',
+    sa.column('id', sa.Integer),
+    sa.column('hostIP', sa.String),
+    sa.column('timestamp', sa.Integer),
+    sa.column('verb', sa.String),
+    sa.column('path', sa.String),
+    sa.column('code', sa.Integer),
+    sa.column('userAgent', sa.Text),
+    sa.column('hash_code', sa.String),
+)
+
+
+def digest(host_ip, timestamp, verb, path, code, user_agent):
+    """Frozen copy of nydata.log_parser.models.log_line_digest"""
+    fields = (host_ip, timestamp, verb, path, code, user_agent)
+    payload = '\x1f'.join('' if field is None else str(field) for field in fields)
+    return blake2b(payload.encode('utf-8'), digest_size=DIGEST_LENGTH // 2).hexdigest()
+
+
+def rehash(connection):
+    """
+    Rehash all rows which were not backfilled by `flask rehash-logs` yet.
+    """
+    c = log_lines.c
+    stale = sa.or_(c.hash_code.is_(None), sa.func.length(c.hash_code) != DIGEST_LENGTH)
+    update = (
+        log_lines.update()
+        .where(c.id == sa.bindparam('_id'))
+        .values(hash_code=sa.bindparam('_hash_code'))
+    )
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([c.id, c.hostIP, c.timestamp, c.verb, c.path, c.code, c.userAgent])
+            .where(sa.and_(c.id > last_id, stale))
+            .order_by(c.id)
+            .limit(CHUNK_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+
+        connection.execute(
+            update, [{'_id': row[0], '_hash_code': digest(*row[1:])} for row in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    connection = op.get_bind()
+    rehash(connection)
+
+    # keep the first copy of every line which was inserted more than once
+    connection.execute(
+        'DELETE FROM log_lines WHERE id NOT IN '
+        '(SELECT min(id) FROM log_lines GROUP BY hash_code)'
+    )
+
+    op.drop_index('ix_log_lines_hash_code', table_name='log_lines')
+    op.create_index(op.f('ix_log_lines_hash_code'), 'log_lines', ['hash_code'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_log_lines_hash_code'), table_name='log_lines')
+    op.create_index('ix_log_lines_hash_code', 'log_lines', ['hash_code'], unique=False)
@@ -0,0 +1,102 @@
+"""monthly range partitions of log_lines
+
+Revision ID: c41d8b6e2f93
+Revises: a7c3e9f1b254
+Create Date: 2020-01-21 09:48:19.602718
+
+"""
+from calendar import timegm
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d8b6e2f93'
+down_revision = 'a7c3e9f1b254'
+branch_labels = None
+depends_on = None
+
+# Frozen copy of nydata.log_parser.partitions at the time of this
+# migration. Use `flask partition-logs` to create future partitions.
+MONTHS_AHEAD = 3
+
+CONSTRAINTS = (
+    'ALTER TABLE log_lines ADD CONSTRAINT log_lines_pkey PRIMARY KEY (id, timestamp)',
+    'CREATE UNIQUE INDEX ix_log_lines_hash_code ON log_lines (hash_code, timestamp)',
+    'CREATE INDEX ix_log_lines_date ON log_lines (date)',
+    'ALTER TABLE log_lines ADD CONSTRAINT log_lines_log_source_id_fkey '
+    'FOREIGN KEY (log_source_id) REFERENCES log_sources (id)',
+    'ALTER TABLE log_lines ADD CONSTRAINT log_lines_request_path_id_fkey '
+    'FOREIGN KEY (request_path_id) REFERENCES request_paths (id)',
+    'ALTER TABLE log_lines ADD CONSTRAINT log_lines_user_agent_id_fkey '
+    'FOREIGN KEY (user_agent_id) REFERENCES user_agents (id)',
+)
+
+
+def add_months(month, num_months):
+    index = month.year * 12 + month.month - 1 + num_months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def to_month(timestamp):
+    return datetime.utcfromtimestamp(timestamp).date().replace(day=1)
+
+
+def create_partition(month):
+    start = timegm(month.timetuple())
+    end = timegm(add_months(month, 1).timetuple())
+    op.execute(
+        f'CREATE TABLE log_lines_y{month.year:04d}m{month.month:02d} '
+        f'PARTITION OF log_lines FOR VALUES FROM ({start}) TO ({end})'
+    )
+
+
+def upgrade():
+    op.alter_column('log_lines', 'timestamp', existing_type=sa.Integer(), nullable=False)
+
+    first, last = op.get_bind().execute(
+        'SELECT min(timestamp), max(timestamp) FROM log_lines'
+    ).first()
+
+    op.execute('ALTER TABLE log_lines RENAME TO log_lines_heap')
+    op.execute(
+        'CREATE TABLE log_lines (LIKE log_lines_heap INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (timestamp)'
+    )
+    op.execute('CREATE TABLE log_lines_default PARTITION OF log_lines DEFAULT')
+
+    this_month = datetime.utcnow().date().replace(day=1)
+    months = {add_months(this_month, offset) for offset in range(MONTHS_AHEAD + 1)}
+    if first is not None:
+        month = to_month(first)
+        while month <= to_month(last):
+            months.add(month)
+            month = add_months(month, 1)
+
+    for month in sorted(months):
+        create_partition(month)
+
+    op.execute('INSERT INTO log_lines SELECT * FROM log_lines_heap')
+    op.execute('ALTER SEQUENCE log_lines_id_seq OWNED BY log_lines.id')
+    op.execute('DROP TABLE log_lines_heap')
+
+    # the indexes are built after the copy, which is a lot faster
+    for statement in CONSTRAINTS:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute('ALTER TABLE log_lines RENAME TO log_lines_partitioned')
+    op.execute('CREATE TABLE log_lines (LIKE log_lines_partitioned INCLUDING DEFAULTS)')
+    op.execute('INSERT INTO log_lines SELECT * FROM log_lines_partitioned')
+    op.execute('ALTER SEQUENCE log_lines_id_seq OWNED BY log_lines.id')
+    op.execute('DROP TABLE log_lines_partitioned')
+
+    op.execute('ALTER TABLE log_lines ADD CONSTRAINT log_lines_pkey PRIMARY KEY (id)')
+    op.execute('CREATE UNIQUE INDEX ix_log_lines_hash_code ON log_lines (hash_code)')
+    for statement in CONSTRAINTS[2:]:
+        op.execute(statement)
+
+    op.alter_column('log_lines', 'timestamp', existing_type=sa.Integer(), nullable=True)
@@ -6,6 +6,8 @@ import sys
 from flask import Flask
 
 from nydata import auth, commands, log_parser, user
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.parser.pattern import register_log_format
 from nydata.extensions import (
     bcrypt,
     cache,
@@ -30,6 +32,7 @@ def create_app(config_object="nydata.settings"):
     register_errorhandlers(app)
     register_shellcontext(app)
     register_commands(app)
+    register_log_formats(app)
     configure_logger(app)
 
     print("[+] App successfully created and configured!")
@@ -53,6 +56,8 @@ def register_blueprints(app):
     """Register Flask blueprints."""
     app.register_blueprint(auth.views.blueprint)
     app.register_blueprint(log_parser.views.blueprint)
+    app.register_blueprint(log_parser.views.export_blueprint)
+    app.register_blueprint(log_parser.views.metrics_blueprint)
     return None
 
 
@@ -103,9 +108,23 @@ def register_commands(app):
     app.cli.add_command(commands.test)
     app.cli.add_command(commands.add_user)
     app.cli.add_command(commands.read_nginx)
+    app.cli.add_command(commands.ingest_logs)
+    app.cli.add_command(commands.rehash_logs)
+    app.cli.add_command(commands.partition_logs)
+    app.cli.add_command(commands.drop_partitions)
+    app.cli.add_command(commands.archive_logs)
+    app.cli.add_command(commands.replay_rejects)
+    app.cli.add_command(commands.gen_nginx)
     app.cli.add_command(commands.create_db)
 
 
+def register_log_formats(app):
+    """Parse the access log with its configured nginx log_format."""
+    log_format = app.config.get("NGINX_LOG_FORMAT")
+    if log_format:
+        register_log_format(NGINX, log_format)
+
+
 def configure_logger(app):
     """
     Configure loggers.
@@ -116,3 +135,9 @@ def configure_logger(app):
     handler = logging.StreamHandler(sys.stdout)
     if not app.logger.handlers:
         app.logger.addHandler(handler)
+
+    # The progress of the log ingestion, see log_parser.progress. It is
+    # written by the handlers of the app logger ("nydata") only.
+    ingest_logger = logging.getLogger("nydata.ingest")
+    level_name = app.config.get("LOG_LEVEL", "info").upper()
+    ingest_logger.setLevel(getattr(logging, level_name, logging.INFO))
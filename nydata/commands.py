@@ -1,16 +1,48 @@
 # -*- coding: utf-8 -*-
 """Click commands."""
 import os
+import random
 import sys
-from os import path
+import time
 
 import click
 from flask.cli import with_appcontext
 
+from .extensions import db
+from .log_parser.archive import archive_log_lines
+from .log_parser.generator import (
+    DEFAULT_ERROR_RATE,
+    DEFAULT_MALFORMED_RATE,
+    DEFAULT_NUM_IPS,
+    DEFAULT_NUM_PATHS,
+    DEFAULT_NUM_USER_AGENTS,
+    DEFAULT_SKEW,
+    DEFAULT_SPAN_IN_DAYS,
+    DISTRIBUTION_ZIPF,
+    DISTRIBUTIONS,
+    average_line_size,
+    generate_nginx_log,
+)
 from .log_parser import parse_and_save_nginx_logs
+from .log_parser.log import INGESTION_MODES, MODE_BATCH
+from .log_parser.models import INSERT_BATCH_SIZE, REHASH_CHUNK_SIZE, rehash_log_lines
+from .log_parser.parallel import CHUNK_SIZE_IN_MB
+from .log_parser.partitions import (
+    MONTHS_AHEAD,
+    drop_log_partitions,
+    partition_log_lines,
+)
+from .log_parser.reader import expand_log_paths
+from .log_parser.rejects import REPLAY_BATCH_SIZE, replay_rejected_lines
+from .log_parser.worker import run_ingest_worker
 from .user.models import add_user as add_user_to_model
 from .utils import eprint
-from .settings import SQLALCHEMY_DATABASE_URI
+from .settings import (
+    INGEST_INTERVAL_IN_SECONDS,
+    LOG_ARCHIVE_PATH,
+    NGINX_ACCESS_LOG_PATH,
+    SQLALCHEMY_DATABASE_URI,
+)
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 PROJECT_ROOT = os.path.join(HERE, os.pardir)
@@ -41,25 +73,373 @@ def add_user(username, password, email, is_admin):
 
 @click.command("read-nginx")
 @click.argument("location", required=True, type=str)
+@click.option(
+    "--mode",
+    type=click.Choice(INGESTION_MODES),
+    default=MODE_BATCH,
+    show_default=True,
+    help="How the parsed lines are written to the database",
+)
+@click.option(
+    "--batch-size",
+    default=INSERT_BATCH_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of log lines written and committed at once",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only read the lines appended since the last incremental run",
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes parsing the file in parallel "
+    "(a single uncompressed file only)",
+)
+@click.option(
+    "--chunk-mb",
+    default=CHUNK_SIZE_IN_MB,
+    show_default=True,
+    type=click.FloatRange(min=0.001),
+    help="Size of the file chunks handed to the parsing processes",
+)
 @with_appcontext
-def read_nginx(location):
+def read_nginx(location, mode, batch_size, incremental, workers, chunk_mb):
     """
-    Read a certain nginx access.log file
+    Read a nginx access.log file, a directory or a glob of (gzipped) log files
     """
 
-    if not path.exists(location):
-        eprint(f"[-] Location does not exist {location}!")
+    if not expand_log_paths(location):
+        eprint(f"[-] No log files found at location {location}!")
         eprint(f"[-] Exiting!")
         sys.exit(1)
 
     try:
-        parse_and_save_nginx_logs(location)
+        parse_and_save_nginx_logs(
+            location,
+            mode=mode,
+            batch_size=batch_size,
+            incremental=incremental,
+            workers=workers,
+            chunk_mb=chunk_mb,
+        )
     except Exception as error:
         eprint(f"[-] Could not parse logs from location=`{location}`")
         eprint(f"[-] Error {error}")
         sys.exit(1)
 
 
+@click.command("ingest-logs")
+@click.option(
+    "--location",
+    default=NGINX_ACCESS_LOG_PATH,
+    show_default=True,
+    type=str,
+    help="The nginx access.log file to follow",
+)
+@click.option(
+    "--interval",
+    default=INGEST_INTERVAL_IN_SECONDS,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Seconds between two polls of the log file",
+)
+@click.option(
+    "--batch-size",
+    default=INSERT_BATCH_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of log lines written and committed at once",
+)
+@click.option(
+    "--once", is_flag=True, default=False, help="Poll the log file only once"
+)
+@with_appcontext
+def ingest_logs(location, interval, batch_size, once):
+    """
+    Ingestion worker which follows a nginx access.log until it is stopped.
+
+    It runs as its own supervisord program next to gunicorn, so the
+    web workers never parse the log.
+    """
+    max_polls = 1 if once else None
+    num_rows = run_ingest_worker(location, interval, batch_size, max_polls)
+    print(f"[+] SUCCESS: Ingested {num_rows} log lines!")
+
+
+@click.command("rehash-logs")
+@click.option(
+    "--chunk-size",
+    default=REHASH_CHUNK_SIZE,
+    show_default=True,
+    type=int,
+    help="Number of log lines updated per transaction",
+)
+@with_appcontext
+def rehash_logs(chunk_size):
+    """
+    Backfill stable hash codes of stored log lines.
+
+    Run it before `flask db upgrade` adds the unique hash_code
+    index, so the migration has little left to do.
+    """
+    try:
+        num_rows = rehash_log_lines(chunk_size)
+        print(f"[+] SUCCESS: Rehashed {num_rows} log lines!")
+
+    except Exception as error:
+        eprint(f"[-] Could not rehash log lines!")
+        eprint(f"[-] Error {error}")
+        sys.exit(1)
+
+
+@click.command("partition-logs")
+@click.option(
+    "--months-ahead",
+    default=MONTHS_AHEAD,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Number of future months which get a partition",
+)
+@with_appcontext
+def partition_logs(months_ahead):
+    """
+    Partition log_lines by month and pre-create future partitions.
+
+    Converts log_lines to a partitioned table if it is none yet,
+    so run it regularly (e.g. monthly with cron).
+    """
+    try:
+        num_partitions = partition_log_lines(months_ahead)
+        db.session.commit()
+        print(f"[+] SUCCESS: Created {num_partitions} partitions!")
+
+    except Exception as error:
+        db.session.rollback()
+        eprint(f"[-] Could not partition log lines!")
+        eprint(f"[-] Error {error}")
+        sys.exit(1)
+
+
+@click.command("drop-log-partitions")
+@click.option(
+    "--before",
+    required=True,
+    type=click.DateTime(formats=["%Y-%m-%d", "%Y-%m"]),
+    help="Drop the log lines of all months before this month",
+)
+@with_appcontext
+def drop_partitions(before):
+    """
+    Delete old log lines by dropping their monthly partitions, and
+    their daily and hourly counts.
+    """
+    try:
+        dropped = drop_log_partitions(before.date())
+        db.session.commit()
+        print(f"[+] SUCCESS: Dropped partitions={dropped}!")
+
+    except Exception as error:
+        db.session.rollback()
+        eprint(f"[-] Could not drop partitions before={before:%Y-%m}!")
+        eprint(f"[-] Error {error}")
+        sys.exit(1)
+
+
+@click.command("archive-logs")
+@click.option(
+    "--before",
+    required=True,
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Archive the log lines of all days before this date",
+)
+@click.option(
+    "--path",
+    "archive_path",
+    default=LOG_ARCHIVE_PATH,
+    required=LOG_ARCHIVE_PATH is None,
+    show_default=True,
+    type=click.Path(file_okay=False),
+    help="Directory of the Parquet archive",
+)
+@with_appcontext
+def archive_logs(before, archive_path):
+    """
+    Move old log lines to date partitioned Parquet files.
+
+    Log queries on archived dates read the files, so the path
+    has to be the LOG_ARCHIVE_PATH of the web app.
+    """
+    try:
+        num_rows = archive_log_lines(archive_path, before.date())
+        print(f"[+] SUCCESS: Archived {num_rows} log lines to path={archive_path}!")
+
+    except Exception as error:
+        db.session.rollback()
+        eprint(f"[-] Could not archive log lines before={before:%Y-%m-%d}!")
+        eprint(f"[-] Error {error}")
+        sys.exit(1)
+
+
+@click.command("replay-rejects")
+@click.option("--source", default=None, help="Only replay the lines of this source")
+@click.option(
+    "--batch-size",
+    default=REPLAY_BATCH_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of rejected lines parsed per transaction",
+)
+@with_appcontext
+def replay_rejects(source, batch_size):
+    """
+    Parse the rejected log lines again, e.g. after a pattern was fixed.
+
+    The lines which match now move to the log lines, the others
+    stay in the quarantine.
+    """
+    try:
+        num_replayed, num_rows = replay_rejected_lines(source, batch_size)
+        print(
+            f"[+] SUCCESS: Replayed {num_replayed} rejected lines, "
+            f"added {num_rows} log lines!"
+        )
+
+    except Exception as error:
+        db.session.rollback()
+        eprint(f"[-] Could not replay rejected log lines!")
+        eprint(f"[-] Error {error}")
+        sys.exit(1)
+
+
+@click.command("gen-nginx")
+@click.argument("location", required=True, type=click.Path(dir_okay=False))
+@click.option(
+    "--lines",
+    "num_lines",
+    default=1_000_000,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of log lines",
+)
+@click.option(
+    "--size-mb",
+    type=click.FloatRange(min=0.001),
+    help="Approximate file size, overrides --lines",
+)
+@click.option("--seed", type=int, help="Seed of a reproducible log [default: random]")
+@click.option(
+    "--start",
+    default="2016-12-01",
+    show_default=True,
+    type=click.DateTime(formats=["%Y-%m-%d", "%Y-%m-%dT%H:%M:%S"]),
+    help="UTC time of the first line",
+)
+@click.option(
+    "--days",
+    "span_in_days",
+    default=DEFAULT_SPAN_IN_DAYS,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Time span of the log",
+)
+@click.option(
+    "--ips",
+    "num_ips",
+    default=DEFAULT_NUM_IPS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of distinct client IPs",
+)
+@click.option(
+    "--paths",
+    "num_paths",
+    default=DEFAULT_NUM_PATHS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of distinct request paths",
+)
+@click.option(
+    "--user-agents",
+    "num_user_agents",
+    default=DEFAULT_NUM_USER_AGENTS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of distinct user agents",
+)
+@click.option(
+    "--distribution",
+    type=click.Choice(DISTRIBUTIONS),
+    default=DISTRIBUTION_ZIPF,
+    show_default=True,
+    help="How often the IPs, paths and user agents occur",
+)
+@click.option(
+    "--skew",
+    default=DEFAULT_SKEW,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Exponent of the Zipf distribution, higher means fewer hot values",
+)
+@click.option(
+    "--error-rate",
+    default=DEFAULT_ERROR_RATE,
+    show_default=True,
+    type=click.FloatRange(0, 1),
+    help="Share of 4xx and 5xx responses",
+)
+@click.option(
+    "--malformed-rate",
+    default=DEFAULT_MALFORMED_RATE,
+    show_default=True,
+    type=click.FloatRange(0, 1),
+    help="Share of lines which do not match the nginx pattern",
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes creating the lines",
+)
+def gen_nginx(location, num_lines, size_mb, seed, workers, **options):
+    """
+    Write a synthetic nginx access.log (gzipped if LOCATION ends with .gz)
+
+    The same --seed and options always write the same log, e.g. for
+    reproducible benchmarks of the ingestion and the GraphQL queries.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    if size_mb is not None:
+        line_size = average_line_size(seed=seed, **options)
+        num_lines = max(1, int(size_mb * 1_000_000 / line_size))
+
+    print(f"[+] Writing {num_lines} log lines with seed={seed} to path={location}")
+    started = time.monotonic()
+
+    try:
+        num_bytes = generate_nginx_log(
+            location, workers, num_lines=num_lines, seed=seed, **options
+        )
+    except Exception as error:
+        eprint(f"[-] Could not write the log to path={location}")
+        eprint(f"[-] Error {error}")
+        sys.exit(1)
+
+    seconds = time.monotonic() - started
+    print(
+        f"[+] SUCCESS: Wrote {num_bytes / 1_000_000:,.0f} MB in {seconds:.1f}s "
+        f"({num_bytes / 1_000_000 / seconds:,.0f} MB/sec)"
+    )
+
+
 @click.command("test")
 def test():
     """Run the tests."""
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar archive of old log lines in date partitioned Parquet files.
+
+Archived lines are moved out of the log_lines table into files below
+LOG_ARCHIVE_PATH/log_lines/date=YYYY-MM-DD/. The repeated values are
+dictionary encoded and the files are compressed. Log queries read the
+files of their dates only and just the selected columns.
+"""
+import heapq
+import os
+from calendar import timegm
+from datetime import date, timedelta
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from flask import current_app
+from sqlalchemy import func
+
+from ..extensions import db
+from .cache import reset_watermarks_on_commit
+from .export import EXPORT_COLUMNS, iter_log_line_chunks
+from .models import SECONDS_PER_HOUR, LogLine, utc_date
+from .partitions import drop_log_partitions, first_of_month, is_partitioned
+
+# Number of log lines per row group of a file
+ARCHIVE_CHUNK_SIZE = 100_000
+
+# Number of log lines read from a file at once
+ARCHIVE_READ_BATCH_SIZE = 10_000
+
+ARCHIVE_COMPRESSION = "zstd"
+
+ARCHIVE_TABLE_DIR = "log_lines"
+
+# The date is not stored in the files, it is the partition directory
+ARCHIVE_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("log_source_id", pa.int32()),
+        ("hostIP", pa.string()),
+        ("timestamp", pa.int64()),
+        ("verb", pa.string()),
+        ("path", pa.string()),
+        ("code", pa.int32()),
+        ("userAgent", pa.string()),
+    ]
+)
+DICTIONARY_COLUMNS = ["hostIP", "verb", "path", "userAgent"]
+
+
+def get_archive_path() -> Optional[str]:
+    """
+    Get the archive directory of the current app, None if archiving is off.
+    """
+    return current_app.config.get("LOG_ARCHIVE_PATH")
+
+
+def day_directory(archive_path: str, day: date) -> str:
+    return os.path.join(archive_path, ARCHIVE_TABLE_DIR, f"date={day.isoformat()}")
+
+
+def write_archive_file(
+    archive_path: str, day: date, chunk_size: int = ARCHIVE_CHUNK_SIZE
+) -> Tuple[int, Optional[int]]:
+    """
+    Write the log lines of a (UTC) day to a new Parquet file.
+
+    The file is named after the smallest and biggest id, so writing
+    the same lines again replaces the file. Returns the number of
+    lines and the biggest id.
+    """
+    directory = day_directory(archive_path, day)
+    start = timegm(day.timetuple())
+    end = start + 86400
+
+    indexes = [EXPORT_COLUMNS.index(name) for name in ARCHIVE_SCHEMA.names]
+    temp_path = os.path.join(directory, f".{uuid4().hex}.tmp")
+    writer = None
+    first_id = last_id = None
+    num_rows = 0
+
+    try:
+        for rows in iter_log_line_chunks(start, end, chunk_size):
+            if writer is None:
+                os.makedirs(directory, exist_ok=True)
+                writer = pq.ParquetWriter(
+                    temp_path,
+                    ARCHIVE_SCHEMA,
+                    compression=ARCHIVE_COMPRESSION,
+                    use_dictionary=DICTIONARY_COLUMNS,
+                )
+
+            columns = list(zip(*rows))
+            arrays = [
+                pa.array(columns[index], type=field.type)
+                for index, field in zip(indexes, ARCHIVE_SCHEMA)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=ARCHIVE_SCHEMA))
+
+            # the lines are ordered by timestamp, not by id
+            ids = columns[EXPORT_COLUMNS.index("id")]
+            first_id = min(ids) if first_id is None else min(first_id, min(ids))
+            last_id = max(ids) if last_id is None else max(last_id, max(ids))
+            num_rows += len(rows)
+
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(temp_path)
+        raise
+
+    if writer is None:
+        return 0, None
+
+    writer.close()
+    file_name = f"part-{first_id}-{last_id}.parquet"
+    os.replace(temp_path, os.path.join(directory, file_name))
+    return num_rows, last_id
+
+
+def archive_log_lines(archive_path: str, before: date) -> int:
+    """
+    Move the log lines of all days before `before` to the archive.
+
+    Every day is written to its file and then deleted from the table
+    and committed. On a partitioned table the lines of whole months are
+    deleted by dropping their partitions instead, so there are no dead
+    rows to vacuum. The rollup tables are kept. Returns the number of
+    archived lines.
+    """
+    end = timegm(before.timetuple())
+    first = (
+        db.session.query(func.min(LogLine.timestamp))
+        .filter(LogLine.timestamp < end)
+        .scalar()
+    )
+    if first is None:
+        return 0
+
+    # months before this one are dropped with their partition
+    drop_months_before = first_of_month(before) if is_partitioned() else date.min
+
+    num_rows = 0
+    day = utc_date(first)
+    while day < before:
+        num_day, last_id = write_archive_file(archive_path, day)
+
+        if num_day and day >= drop_months_before:
+            start = timegm(day.timetuple())
+            LogLine.query.filter(
+                LogLine.timestamp >= start,
+                LogLine.timestamp < start + 86400,
+                LogLine.id <= last_id,
+            ).delete(synchronize_session=False)
+
+            db.session.commit()
+
+        if num_day:
+            print(f"[+] Archived {num_day} log lines of date={day}")
+
+        num_rows += num_day
+        day += timedelta(days=1)
+
+    if drop_months_before > date.min:
+        drop_log_partitions(before, keep_rollups=True)
+
+    reset_watermarks_on_commit()
+    db.session.commit()
+    return num_rows
+
+
+def archived_days(archive_path: str, date_from: date, date_to: date) -> List[date]:
+    """
+    Get the archived dates from date_from to date_to (inclusive) in order.
+    """
+    table_path = os.path.join(archive_path, ARCHIVE_TABLE_DIR)
+    if not os.path.isdir(table_path):
+        return []
+
+    days = []
+    for name in os.listdir(table_path):
+        if name.startswith("date="):
+            day = date.fromisoformat(name[len("date=") :])
+            if date_from <= day <= date_to:
+                days.append(day)
+
+    return sorted(days)
+
+
+def archive_files(archive_path: str, day: date) -> List[str]:
+    directory = day_directory(archive_path, day)
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(".parquet")
+    )
+
+
+def iter_archived_log_lines(
+    start: int,
+    end: int,
+    projection: Iterable[str],
+    after: Optional[Tuple[int, int]] = None,
+) -> Iterator[Dict]:
+    """
+    Yield the projected values of the archived log lines with a
+    timestamp in [start, end) after the keyset `after`, ordered by
+    (timestamp, id).
+
+    The dates are read in order and every file in batches of
+    ARCHIVE_READ_BATCH_SIZE, so a caller which stops after a page only
+    reads about a page. Only the projected columns are read, values
+    which are not archived are None.
+    """
+    archive_path = get_archive_path()
+    if not archive_path:
+        return
+
+    if after is not None:
+        start = max(start, after[0])
+    if start >= end:
+        return
+
+    projection = list(projection)
+    columns = [name for name in ARCHIVE_SCHEMA.names if name in projection]
+    # the keyset orders the rows of the files
+    columns += [name for name in ("timestamp", "id") if name not in columns]
+
+    for day in archived_days(archive_path, utc_date(start), utc_date(end - 1)):
+        streams = [
+            _iter_archive_file(file_path, day, start, end, projection, columns, after)
+            for file_path in archive_files(archive_path, day)
+        ]
+        yield from heapq.merge(*streams, key=itemgetter("timestamp", "id"))
+
+
+def _iter_archive_file(
+    file_path: str,
+    day: date,
+    start: int,
+    end: int,
+    projection: List[str],
+    columns: List[str],
+    after: Optional[Tuple[int, int]],
+) -> Iterator[Dict]:
+    """
+    Yield the rows of an archive file (ordered by timestamp and id)
+    within [start, end) after the keyset.
+    """
+    parquet_file = pq.ParquetFile(file_path)
+
+    for batch in parquet_file.iter_batches(ARCHIVE_READ_BATCH_SIZE, columns=columns):
+        timestamp = batch.column("timestamp")
+        mask = pc.and_(
+            pc.greater_equal(timestamp, start), pc.less(timestamp, end)
+        )
+        if after is not None:
+            after_keyset = pc.or_(
+                pc.greater(timestamp, after[0]),
+                pc.and_(
+                    pc.equal(timestamp, after[0]),
+                    pc.greater(batch.column("id"), after[1]),
+                ),
+            )
+            mask = pc.and_(mask, after_keyset)
+
+        values = batch.filter(mask).to_pydict()
+        for row_values in zip(*(values[name] for name in columns)):
+            row = dict.fromkeys(projection)
+            row.update(zip(columns, row_values))
+            if "date" in row:
+                row["date"] = day
+            yield row
+
+        if len(timestamp) and timestamp[-1].as_py() >= end:
+            return
+
+
+def count_archived_log_lines(
+    date_from: date, date_to: date, group_by: List[str]
+) -> Dict[Tuple, int]:
+    """
+    Count the archived log lines from date_from to date_to per group.
+
+    The groups are the values of the group_by columns (see
+    schema.LogGroupBy), only these columns are read.
+    """
+    archive_path = get_archive_path()
+    if not archive_path:
+        return {}
+
+    columns = {"hostIP", "path", "code", "verb"}.intersection(group_by)
+    if "hour" in group_by or not columns:
+        columns.add("timestamp")
+    columns = sorted(columns)
+
+    counts = {}
+    for day in archived_days(archive_path, date_from, date_to):
+        for file_path in archive_files(archive_path, day):
+            parquet_file = pq.ParquetFile(file_path)
+            batches = parquet_file.iter_batches(
+                ARCHIVE_READ_BATCH_SIZE, columns=columns
+            )
+            for batch in batches:
+                values = batch.to_pydict()
+                if "hour" in group_by:
+                    values["hour"] = [
+                        timestamp // SECONDS_PER_HOUR * SECONDS_PER_HOUR
+                        for timestamp in values["timestamp"]
+                    ]
+                values["date"] = [day] * batch.num_rows
+
+                for key in zip(*(values[name] for name in group_by)):
+                    counts[key] = counts.get(key, 0) + 1
+
+    return counts
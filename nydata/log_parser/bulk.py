@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk ingestion of log lines through PostgreSQL's `COPY ... FROM STDIN`.
+"""
+import csv
+import io
+from typing import Iterable, List
+
+from ..database import db, get_or_create
+from ..utils import chunked
+from .data import LogEntry
+from .metrics import STAGE_COMMIT, STAGE_DB_WRITE, flush_ingest_metrics, timed_stage
+from .models import (
+    LOG_LINE_COLUMNS,
+    LOG_LINE_CONFLICT_TARGET,
+    QUOTED_LOG_LINE_COLUMNS,
+    LogSource,
+    count_inserted_log_lines,
+    insert_log_lines,
+    insert_with_rollups_sql,
+    log_line_rows,
+)
+
+COPY_BATCH_SIZE = 50_000
+
+# Other databases (e.g. sqlite in the tests) have no COPY and
+# get executemany batches of this size instead.
+FALLBACK_BATCH_SIZE = 1_000
+
+_STAGING_TABLE = "log_lines_staging"
+
+
+def copy_logs_to_database(
+    source: str, logs: Iterable[LogEntry], batch_size: int = COPY_BATCH_SIZE
+) -> int:
+    """
+    Stream log entries into the log_lines table and return the number of new rows.
+
+    On PostgreSQL the entries are copied in batches into a temporary
+    staging table which is merged into log_lines with a single
+    INSERT ... SELECT at the end, which also updates the rollup
+    tables. Lines which are already in the database are skipped
+    through the unique hash code.
+    """
+    assert source, "[-] The name of LogSource cannot be empty!"
+    log_source = get_or_create(db.session, LogSource, name=source)
+    connection = db.session.connection()
+
+    try:
+        if connection.dialect.name == "postgresql":
+            num_rows = _copy_log_lines(connection, log_source.id, logs, batch_size)
+        else:
+            num_rows = _insert_log_lines(log_source.id, logs)
+
+        with timed_stage(STAGE_COMMIT):
+            db.session.commit()
+        flush_ingest_metrics()
+        return num_rows
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _copy_log_lines(
+    connection, log_source_id: int, logs: Iterable[LogEntry], batch_size: int
+) -> int:
+    """
+    Copy log entries through a staging table with psycopg2's copy_expert.
+    """
+    columns = QUOTED_LOG_LINE_COLUMNS
+    cursor = connection.connection.cursor()
+
+    cursor.execute(
+        f"CREATE TEMP TABLE {_STAGING_TABLE} ON COMMIT DROP AS "
+        f"SELECT {columns} FROM log_lines WITH NO DATA"
+    )
+
+    copy_sql = f"COPY {_STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    for batch in chunked(logs, batch_size):
+        with timed_stage(STAGE_DB_WRITE):
+            cursor.copy_expert(copy_sql, _to_csv(log_source_id, batch))
+        flush_ingest_metrics()
+
+    insert_sql = (
+        f"INSERT INTO log_lines ({columns}) "
+        f"SELECT {columns} FROM {_STAGING_TABLE} "
+        f"ON CONFLICT {LOG_LINE_CONFLICT_TARGET} DO NOTHING"
+    )
+    with timed_stage(STAGE_DB_WRITE):
+        cursor.execute(insert_with_rollups_sql(insert_sql))
+    return count_inserted_log_lines(cursor.fetchall())
+
+
+def _to_csv(log_source_id: int, batch: List[LogEntry]) -> io.StringIO:
+    """
+    Serialize a batch of log entries into an in-memory CSV file.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for values in log_line_rows(log_source_id, batch):
+        writer.writerow([values[column] for column in LOG_LINE_COLUMNS])
+
+    buffer.seek(0)
+    return buffer
+
+
+def _insert_log_lines(log_source_id: int, logs: Iterable[LogEntry]) -> int:
+    """
+    Insert log entries with executemany batches if COPY is not available.
+    """
+    num_rows = 0
+    for batch in chunked(logs, FALLBACK_BATCH_SIZE):
+        with timed_stage(STAGE_DB_WRITE):
+            num_rows += insert_log_lines(log_source_id, batch)
+        flush_ingest_metrics()
+
+    return num_rows
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of GraphQL log query results which is invalidated by ingestion watermarks.
+
+Every date has a version in the cache, a random token which is
+replaced after a transaction which added log lines of that date was
+committed. The versions of the dates inside the queried range are part
+of the cache key, so new log lines only invalidate the results which
+cover their date and closed historical ranges are always served from
+the cache without reaching the database.
+
+A version is only ever set to a new token (never read, changed and
+written back), so concurrent committers cannot lose an update. Dates
+without log lines have no version. The cache has to be shared by all
+processes which ingest or query (CACHE_TYPE=redis) and must not evict
+the versions, which never expire (e.g. redis with a volatile-*
+maxmemory-policy, the query results do expire).
+"""
+import json
+from datetime import date, timedelta
+from hashlib import blake2b
+from typing import Callable, Iterable, List, Optional
+from uuid import uuid4
+
+from flask import current_app
+from sqlalchemy import event
+
+from ..extensions import cache, db
+
+GENERATION_KEY = "log_query_generation"
+
+VERSION_KEY_PREFIX = "log_date_version:"
+
+QUERY_KEY_PREFIX = "log_query:"
+
+# Bigger results are not cached to keep the memory of the cache bounded
+MAX_CACHED_ROWS = 10_000
+
+# Dates of a transaction whose versions are replaced after its commit
+_PENDING_KEY = "log_dates"
+_RESET_KEY = "reset_log_query_generation"
+
+
+def new_token() -> str:
+    return uuid4().hex
+
+
+def get_generation() -> str:
+    """
+    Get the current generation of cache keys or start a new one.
+
+    `add` only sets a missing key, so concurrent processes agree on
+    the same new generation.
+    """
+    cache.add(GENERATION_KEY, new_token(), timeout=0)
+    return cache.get(GENERATION_KEY) or ""
+
+
+def version_key(day: date) -> str:
+    return f"{VERSION_KEY_PREFIX}{day.isoformat()}"
+
+
+def get_versions(date_from: date, date_to: date) -> List[Optional[str]]:
+    """
+    Get the versions of the dates from date_from to date_to (inclusive).
+    """
+    num_days = (date_to - date_from).days + 1
+    keys = [version_key(date_from + timedelta(days=day)) for day in range(num_days)]
+    return cache.get_many(*keys)
+
+
+def bump_versions(days: Iterable[date]):
+    """
+    Replace the versions of the dates, their cached results become unreachable.
+    """
+    cache.set_many({version_key(day): new_token() for day in days}, timeout=0)
+
+
+def track_new_log_lines(days: Iterable[date]):
+    """
+    Remember the dates of new log lines of the current transaction.
+
+    The versions are only replaced after the transaction is committed,
+    see publish_versions.
+    """
+    db.session.info.setdefault(_PENDING_KEY, set()).update(days)
+
+
+def reset_watermarks_on_commit():
+    """
+    Start a new generation of cache keys after the current transaction
+    is committed, e.g. because log lines were deleted.
+
+    All cached query results become unreachable.
+    """
+    db.session.info[_RESET_KEY] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def publish_versions(session):
+    if session.info.pop(_RESET_KEY, False):
+        cache.delete(GENERATION_KEY)
+
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        bump_versions(pending)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_versions(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_RESET_KEY, None)
+
+
+def query_cache_key(field: str, date_from: date, date_to: date, **arguments) -> str:
+    """
+    Cache key of a log query over the date range with the given arguments.
+    """
+    document = json.dumps(
+        [
+            get_generation(),
+            field,
+            date_from,
+            date_to,
+            sorted(arguments.items()),
+            get_versions(date_from, date_to),
+        ],
+        default=str,
+    )
+    return QUERY_KEY_PREFIX + blake2b(document.encode("utf-8")).hexdigest()
+
+
+def cached_query(
+    field: str, date_from: date, date_to: date, query: Callable[[], List], **arguments
+) -> List:
+    """
+    Get the rows of a log query from the cache or run and cache it.
+
+    The rows have to be picklable (no ORM objects).
+    """
+    key = query_cache_key(field, date_from, date_to, **arguments)
+
+    rows = cache.get(key)
+    if rows is None:
+        rows = query()
+
+        if len(rows) <= MAX_CACHED_ROWS:
+            timeout = current_app.config.get("LOG_QUERY_CACHE_TIMEOUT")
+            cache.set(key, rows, timeout=timeout)
+
+    return rows
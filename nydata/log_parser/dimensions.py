@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Dictionary encoding of repeated log line values like user agents and paths.
+
+Every distinct value is stored once in a dimension table and the log
+lines reference it by id. The ids of recently used values are kept in
+an in-process LRU cache, so ingestion rarely has to look them up.
+"""
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, Iterable, Optional
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+
+from ..error import DbError
+from ..extensions import db
+from ..utils import chunked
+
+# Number of values cached per dimension table
+INTERN_CACHE_SIZE = 10_000
+
+LOOKUP_BATCH_SIZE = 500
+
+# Ids interned by a transaction which are cached after its commit
+_PENDING_KEY = "interned_ids"
+
+_lock = Lock()
+
+
+def value_digest(value: str) -> str:
+    """
+    Unique key of a dimension value, long values cannot be indexed directly.
+    """
+    return sha256(value.encode("utf-8")).hexdigest()
+
+
+def get_intern_cache(table: str) -> OrderedDict:
+    """
+    Get the LRU cache (value -> id) of a dimension table of the current app.
+    """
+    caches = current_app.extensions.setdefault("log_intern_caches", {})
+    return caches.setdefault(table, OrderedDict())
+
+
+def intern_values(model, values: Iterable[Optional[str]]) -> Dict[str, int]:
+    """
+    Get the ids of values in the dimension table of model.
+
+    Values which are not stored yet are inserted. The caller commits,
+    new ids are only cached after the commit (see cache_interned_ids).
+    """
+    table = model.__tablename__
+    cache = get_intern_cache(table)
+    pending = db.session.info.setdefault(_PENDING_KEY, {}).setdefault(table, {})
+
+    ids = {}
+    missing = []
+
+    with _lock:
+        for value in set(values):
+            if value is None:
+                continue
+
+            if value in cache:
+                cache.move_to_end(value)
+                ids[value] = cache[value]
+            elif value in pending:
+                ids[value] = pending[value]
+            else:
+                missing.append(value)
+
+    if missing:
+        new_ids = _lookup_values(model, missing)
+        _insert_values(model, [value for value in missing if value not in new_ids])
+        new_ids.update(_lookup_values(model, missing))
+
+        pending.update(new_ids)
+        ids.update(new_ids)
+
+    return ids
+
+
+def _lookup_values(model, values: Iterable[str]) -> Dict[str, int]:
+    """
+    Query the ids of the values which are already stored.
+    """
+    ids = {}
+
+    for batch in chunked(values, LOOKUP_BATCH_SIZE):
+        digests = {value_digest(value): value for value in batch}
+        rows = db.session.query(model.digest, model.id).filter(
+            model.digest.in_(digests)
+        )
+        ids.update((digests[digest], value_id) for digest, value_id in rows)
+
+    return ids
+
+
+def _insert_values(model, values: Iterable[str]):
+    """
+    Insert values, values inserted concurrently by others are skipped.
+    """
+    rows = [{"value": value, "digest": value_digest(value)} for value in values]
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        statement = insert(table).on_conflict_do_nothing(index_elements=["digest"])
+    elif dialect == "sqlite":
+        statement = table.insert().prefix_with("OR IGNORE")
+    else:
+        raise DbError(f"[-] Unsupported database dialect={dialect}!")
+
+    db.session.execute(statement, rows)
+
+
+@event.listens_for(db.session, "after_commit")
+def cache_interned_ids(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+
+    with _lock:
+        for table, ids in pending.items():
+            cache = get_intern_cache(table)
+            cache.update(ids)
+
+            while len(cache) > INTERN_CACHE_SIZE:
+                cache.popitem(last=False)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_interned_ids(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
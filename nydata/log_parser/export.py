@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of log lines as NDJSON or CSV.
+
+The lines are read through a server-side cursor in chunks of
+EXPORT_CHUNK_SIZE rows and every chunk is serialized (and optionally
+compressed) before the next one is fetched, so the memory of the web
+worker does not depend on the number of exported lines.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, List, Tuple
+
+from sqlalchemy import and_, select
+
+from ..extensions import db
+from .models import LogLine, RequestPath, UserAgent
+
+# Number of rows fetched from the server-side cursor at once
+EXPORT_CHUNK_SIZE = 10_000
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+EXPORT_FORMATS = (FORMAT_NDJSON, FORMAT_CSV)
+
+MIMETYPES = {FORMAT_NDJSON: "application/x-ndjson", FORMAT_CSV: "text/csv"}
+
+# Exported values of a log line, in the order of the CSV columns
+EXPORT_COLUMNS = (
+    "id",
+    "log_source_id",
+    "hostIP",
+    "date",
+    "timestamp",
+    "verb",
+    "path",
+    "code",
+    "userAgent",
+)
+
+
+def export_query(start: int, end: int):
+    """
+    Select the exported values of the log lines with a timestamp in [start, end).
+    """
+    table = LogLine.__table__
+    paths = RequestPath.__table__
+    user_agents = UserAgent.__table__
+
+    values = {
+        **{name: table.c[name] for name in EXPORT_COLUMNS if name in table.c},
+        "path": paths.c.value.label("path"),
+        "userAgent": user_agents.c.value.label("userAgent"),
+    }
+    joined = table.outerjoin(paths, table.c.request_path_id == paths.c.id).outerjoin(
+        user_agents, table.c.user_agent_id == user_agents.c.id
+    )
+
+    return (
+        select([values[name] for name in EXPORT_COLUMNS])
+        .select_from(joined)
+        .where(and_(table.c.timestamp >= start, table.c.timestamp < end))
+        .order_by(table.c.timestamp, table.c.id)
+    )
+
+
+def iter_log_line_chunks(
+    start: int, end: int, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[List[Tuple]]:
+    """
+    Yield the exported log lines in chunks of at most chunk_size rows.
+
+    On PostgreSQL the rows are streamed through a named (server-side)
+    cursor on a connection of its own, which is closed when the
+    iteration ends or is abandoned.
+    """
+    connection = db.engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(
+            export_query(start, end)
+        )
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+    finally:
+        connection.close()
+
+
+def to_ndjson(chunks: Iterable[List[Tuple]]) -> Iterator[str]:
+    """
+    Serialize every chunk as one JSON object per line.
+    """
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + "\n"
+            for row in rows
+        )
+
+
+def to_csv(chunks: Iterable[List[Tuple]]) -> Iterator[str]:
+    """
+    Serialize the chunks as CSV, the first chunk starts with the header.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+        buffer.seek(0)
+        buffer.truncate()
+
+    # the header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """
+    Compress a stream of text chunks to a single gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def export_log_lines(
+    start: int, end: int, export_format: str, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[str]:
+    """
+    Stream the log lines with a timestamp in [start, end) in the export format.
+    """
+    chunks = iter_log_line_chunks(start, end, chunk_size)
+
+    if export_format == FORMAT_CSV:
+        return to_csv(chunks)
+
+    return to_ndjson(chunks)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic nginx access logs in the combined format for load and scale tests.
+
+The IPs, paths and user agents are drawn from pools of configurable
+size, either uniformly or Zipf distributed (a few hot values and a
+long tail) like real traffic. The timestamps ascend evenly over the
+time span. A share of the lines are errors (4xx/5xx) or malformed
+lines the parser has to reject. The same seed always writes the same
+file, no matter how many worker processes create it.
+"""
+import gzip
+import random
+import time
+from calendar import timegm
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import accumulate
+from typing import Dict, Iterator, List
+
+# Number of lines which are created and written at once
+GENERATOR_CHUNK_SIZE = 10_000
+
+DEFAULT_NUM_IPS = 10_000
+DEFAULT_NUM_PATHS = 2_000
+DEFAULT_NUM_USER_AGENTS = 300
+DEFAULT_SPAN_IN_DAYS = 1.0
+DEFAULT_ERROR_RATE = 0.05
+DEFAULT_MALFORMED_RATE = 0.001
+DEFAULT_SKEW = 1.1
+
+DISTRIBUTION_ZIPF = "zipf"
+DISTRIBUTION_UNIFORM = "uniform"
+DISTRIBUTIONS = (DISTRIBUTION_ZIPF, DISTRIBUTION_UNIFORM)
+
+_LINE = '{} - - [{}] "{} {} HTTP/1.1" {} {} "{}" "{}"\n'
+_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S +0000"
+
+_VERBS = ("GET", "POST", "HEAD", "PUT", "DELETE")
+_VERB_WEIGHTS = (85, 10, 3, 1, 1)
+
+_SUCCESS_CODES = (200, 304, 301, 206)
+_SUCCESS_WEIGHTS = (90, 6, 3, 1)
+
+_ERROR_CODES = (404, 400, 403, 499, 500, 502, 503)
+_ERROR_WEIGHTS = (60, 10, 8, 5, 8, 5, 4)
+
+_PATH_TEMPLATES = (
+    "/static/js/app.{:x}.js",
+    "/static/css/style.{:x}.css",
+    "/images/{}.png",
+    "/api/v1/items/{}",
+    "/blog/post-{}",
+    "/products/{}?ref=home",
+    "/search?q=term{}",
+)
+
+_USER_AGENT_TEMPLATES = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/{major}.0.{build}.{patch} Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_{minor}_{patch}) "
+    "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{minor}.{patch} "
+    "Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:{major}.{patch}) Gecko/20100101 "
+    "Firefox/{major}.{patch}",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS {minor}_{patch} like Mac OS X) "
+    "AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E{build}",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html) "
+    "Chrome/{major}.0.{build}.{patch}",
+    "curl/7.{major}.{patch}",
+)
+
+# Lines of broken clients, TLS handshakes on the plain port and
+# partially written lines, none of them matches the nginx pattern
+_MALFORMED_LINES = (
+    '{} - - [{}] "-" 400 0 "-" "-"\n',
+    '{} - - [{}] "\\x16\\x03\\x01\\x02\\x00\\x01\\x00" 400 166 "-" "-"\n',
+    '{} - - [{}] "GET /\n',
+)
+
+
+def zipf_cum_weights(size: int, skew: float) -> List[float]:
+    """
+    Cumulative weights of a Zipf distribution, the k-th value has
+    the weight 1 / k**skew.
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+def make_ips(rng: random.Random, size: int) -> List[str]:
+    """
+    Unique public looking IPv4 addresses.
+    """
+    return [
+        f"{ip >> 24}.{ip >> 16 & 255}.{ip >> 8 & 255}.{ip & 255}"
+        for ip in rng.sample(range(0x0B000000, 0xDF000000), size)
+    ]
+
+
+def make_paths(rng: random.Random, size: int) -> List[str]:
+    """
+    Unique request paths, the start page first.
+    """
+    return ["/"] + [
+        rng.choice(_PATH_TEMPLATES).format(index) for index in range(1, size)
+    ]
+
+
+def make_user_agents(rng: random.Random, size: int) -> List[str]:
+    """
+    Unique user agents of browsers, bots and tools.
+    """
+    user_agents = {}
+
+    while len(user_agents) < size:
+        user_agent = rng.choice(_USER_AGENT_TEMPLATES).format(
+            major=rng.randrange(40, 120),
+            minor=rng.randrange(9, 16),
+            build=rng.randrange(1000, 6000),
+            patch=rng.randrange(0, 200),
+        )
+        user_agents[user_agent] = None
+
+    return list(user_agents)
+
+
+class LogGenerator:
+    """
+    Creates the lines of a synthetic log chunk by chunk.
+
+    The pools of values are built from the seed, every chunk is drawn
+    with a seed of its own. So the chunks can be created in any order
+    and on several cores and the log is still the same.
+    """
+
+    def __init__(
+        self,
+        num_lines: int,
+        seed: int,
+        start: datetime = datetime(2016, 12, 1),
+        span_in_days: float = DEFAULT_SPAN_IN_DAYS,
+        num_ips: int = DEFAULT_NUM_IPS,
+        num_paths: int = DEFAULT_NUM_PATHS,
+        num_user_agents: int = DEFAULT_NUM_USER_AGENTS,
+        distribution: str = DISTRIBUTION_ZIPF,
+        skew: float = DEFAULT_SKEW,
+        error_rate: float = DEFAULT_ERROR_RATE,
+        malformed_rate: float = DEFAULT_MALFORMED_RATE,
+        chunk_size: int = GENERATOR_CHUNK_SIZE,
+    ):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"[-] Unknown distribution={distribution}")
+
+        self.num_lines = num_lines
+        self.seed = seed
+        self.first_second = timegm(start.timetuple())
+        self.span = int(span_in_days * 86400)
+        self.malformed_rate = malformed_rate
+        self.chunk_size = chunk_size
+
+        rng = random.Random(seed)
+        self.ips = make_ips(rng, num_ips)
+        self.paths = make_paths(rng, num_paths)
+        self.user_agents = make_user_agents(rng, num_user_agents)
+        self.sizes = [rng.randrange(200, 200_000) for _ in self.paths]
+
+        self.weights = {"ip": None, "path": None, "agent": None}
+        if distribution == DISTRIBUTION_ZIPF:
+            self.weights["ip"] = zipf_cum_weights(num_ips, skew)
+            self.weights["path"] = zipf_cum_weights(num_paths, skew)
+            self.weights["agent"] = zipf_cum_weights(num_user_agents, skew)
+
+        # most requests have no referrer, the others come from a hot page
+        self.referrers = ["-"] + [
+            f"https://nydata.example{path}" for path in self.paths[:50]
+        ]
+        num_linked = len(self.referrers) - 1
+        self.referrer_weights = [70] + [30 / num_linked] * num_linked
+
+        # errors take the share error_rate of all status codes
+        self.codes = _SUCCESS_CODES + _ERROR_CODES
+        self.code_weights = [
+            weight * (1 - error_rate) / sum(_SUCCESS_WEIGHTS)
+            for weight in _SUCCESS_WEIGHTS
+        ] + [weight * error_rate / sum(_ERROR_WEIGHTS) for weight in _ERROR_WEIGHTS]
+
+    @property
+    def num_chunks(self) -> int:
+        return -(-self.num_lines // self.chunk_size)
+
+    def chunk(self, number: int) -> str:
+        """
+        Create the lines of a chunk, the timestamps ascend evenly from
+        the start until the end of the time span.
+        """
+        offset = number * self.chunk_size
+        size = min(self.chunk_size, self.num_lines - offset)
+        rng = random.Random(f"{self.seed}-{number}")
+
+        seconds = [
+            self.first_second + index * self.span // self.num_lines
+            for index in range(offset, offset + size)
+        ]
+        times = {
+            second: time.strftime(_TIME_FORMAT, time.gmtime(second))
+            for second in set(seconds)
+        }
+
+        # every column is drawn for the whole chunk at once
+        ips = rng.choices(self.ips, cum_weights=self.weights["ip"], k=size)
+        paths = rng.choices(
+            range(len(self.paths)), cum_weights=self.weights["path"], k=size
+        )
+        agents = rng.choices(
+            self.user_agents, cum_weights=self.weights["agent"], k=size
+        )
+        verbs = rng.choices(_VERBS, weights=_VERB_WEIGHTS, k=size)
+        codes = rng.choices(self.codes, self.code_weights, k=size)
+        referrers = rng.choices(self.referrers, self.referrer_weights, k=size)
+
+        lines = []
+        for index in range(size):
+            if rng.random() < self.malformed_rate:
+                malformed = _MALFORMED_LINES[index % len(_MALFORMED_LINES)]
+                lines.append(malformed.format(ips[index], times[seconds[index]]))
+                continue
+
+            path_index = paths[index]
+            code = codes[index]
+            if code >= 400:
+                body_size = 571
+            else:
+                body_size = 0 if code == 304 else self.sizes[path_index]
+
+            lines.append(
+                _LINE.format(
+                    ips[index],
+                    times[seconds[index]],
+                    verbs[index],
+                    self.paths[path_index],
+                    code,
+                    body_size,
+                    referrers[index],
+                    agents[index],
+                )
+            )
+
+        return "".join(lines)
+
+
+def average_line_size(**options) -> float:
+    """
+    Estimate the bytes per line of a generated log with these options.
+    """
+    sample_size = 1_000
+    options = {**options, "num_lines": sample_size, "chunk_size": sample_size}
+    return len(LogGenerator(**options).chunk(0).encode()) / sample_size
+
+
+# The generator of a worker process
+_worker_generator = None
+
+
+def _init_worker(options: Dict):
+    global _worker_generator
+    _worker_generator = LogGenerator(**options)
+
+
+def _worker_chunk(number: int) -> str:
+    return _worker_generator.chunk(number)
+
+
+def iter_log_chunks(workers: int = 1, **options) -> Iterator[str]:
+    """
+    Yield the chunks of a synthetic log in order, created by a pool
+    of worker processes if workers > 1. See LogGenerator for the options.
+    """
+    generator = LogGenerator(**options)
+    numbers = deque(range(generator.num_chunks))
+
+    if workers == 1:
+        for number in numbers:
+            yield generator.chunk(number)
+        return
+
+    max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(options,)
+    ) as executor:
+        in_flight = deque()
+
+        while numbers or in_flight:
+            while numbers and len(in_flight) < max_in_flight:
+                in_flight.append(executor.submit(_worker_chunk, numbers.popleft()))
+
+            yield in_flight.popleft().result()
+
+
+def generate_nginx_log(file_path: str, workers: int = 1, **options) -> int:
+    """
+    Write a synthetic nginx access log, gzip compressed if the path
+    ends with .gz. See LogGenerator for the options.
+
+    Returns the number of written bytes (uncompressed).
+    """
+    if file_path.endswith(".gz"):
+        file_conn = gzip.open(file_path, "wt", compresslevel=1)
+    else:
+        file_conn = open(file_path, "w")
+
+    num_bytes = 0
+    with file_conn:
+        for chunk in iter_log_chunks(workers, **options):
+            file_conn.write(chunk)
+            num_bytes += len(chunk)
+
+    return num_bytes
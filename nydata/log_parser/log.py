@@ -1,24 +1,93 @@
+import logging
+import time
 from os import path
+from typing import BinaryIO, Iterator, List
 
-from ..utils import eprint
-from .data import NGINX
-from .models import save_log_to_database, save_logs_to_database
-from .parser.parser import parse_log_line, parse_logs
+from ..database import db, get_or_create
+from .bulk import copy_logs_to_database
+from .data import NGINX, LogEntry
+from .metrics import STAGE_READ, timed_iter
+from .models import (
+    INSERT_BATCH_SIZE,
+    LogSource,
+    save_log_batches,
+    save_log_to_database,
+    save_logs_to_database,
+)
+from .parallel import CHUNK_SIZE_IN_MB, parse_file_in_parallel
+from .progress import IngestProgress, log_event
+from .reader import expand_log_paths, is_gzip_file, parse_log_files, parse_mapped_file
+from .rejects import RejectSink, error_reason, parse_log_line_or_reason
+from .tail import digest_new_lines
 
 BIG_FILE_SIZE_IN_MB = 100
 
+# Ingestion modes
+MODE_BATCH = "batch"
+MODE_ORM = "orm"
+MODE_COPY = "copy"
+INGESTION_MODES = (MODE_BATCH, MODE_ORM, MODE_COPY)
+
 
 def parse_and_save_nginx_logs(
-    file_path: str, parse_by_line_at_mb: float = BIG_FILE_SIZE_IN_MB
+    file_path: str,
+    parse_by_line_at_mb: float = BIG_FILE_SIZE_IN_MB,
+    mode: str = MODE_BATCH,
+    incremental: bool = False,
+    workers: int = 1,
+    chunk_mb: float = CHUNK_SIZE_IN_MB,
+    batch_size: int = INSERT_BATCH_SIZE,
 ) -> bool:
     """
     Parse and save NGINX access log files from a certain location
 
-    The parameter parse_by_line_at_mb chooses the parsing mode.
-    If the log file is bigger than this size it will be parsed
-    line by line.
+    The parameter mode chooses how the logs are written to the
+    database. MODE_BATCH streams the lines in batches of batch_size
+    with a commit per batch, MODE_ORM creates one LogLine object
+    per line and MODE_COPY streams the lines with PostgreSQL's COPY.
+
+    In MODE_ORM the parameter parse_by_line_at_mb chooses the
+    parsing mode. If the log file is bigger than this size it
+    will be parsed line by line.
+
+    With incremental=True only the lines appended since the last
+    incremental run are read, see tail.digest_new_lines.
+
+    With more than one worker the file is split into chunks of
+    chunk_mb which are parsed on several cores. This only works for a
+    single uncompressed file.
+
+    The file_path can also be a directory (its access.log files) or a
+    glob pattern. Several files and gzip compressed files are streamed
+    oldest first in one pass, see digest_log_files.
     """
     try:
+        if incremental:
+            digest_new_lines(NGINX, file_path, batch_size)
+            return True
+
+        file_paths = expand_log_paths(file_path)
+        if len(file_paths) != 1 or is_gzip_file(file_paths[0]):
+            if workers > 1:
+                log_event(
+                    logging.WARNING,
+                    "[-] Several or gzip compressed files are read by one worker",
+                    location=file_path,
+                    workers=workers,
+                )
+            return digest_log_files(NGINX, file_paths, mode == MODE_COPY, batch_size)
+
+        if workers > 1:
+            return digest_logs_in_parallel(
+                NGINX, file_path, workers, chunk_mb, mode == MODE_COPY, batch_size
+            )
+
+        if mode == MODE_BATCH:
+            return digest_logs_in_batches(NGINX, file_path, batch_size)
+
+        if mode == MODE_COPY:
+            return digest_logs_with_copy(NGINX, file_path)
+
         size_in_mb = path.getsize(file_path) / 1_000_000.0
         bigger_than_threshold = size_in_mb > parse_by_line_at_mb
 
@@ -29,8 +98,12 @@ def parse_and_save_nginx_logs(
             return digest_logs(NGINX, file_path)
 
     except Exception as error:
-        eprint(f"[-] Failed to parse and save access.log at location={file_path}")
-        eprint(f"[-] Retrieved error: {error}")
+        log_event(
+            logging.ERROR,
+            "[-] Failed to parse and save access.log",
+            location=file_path,
+            error=repr(str(error)),
+        )
         return False
 
 
@@ -41,45 +114,229 @@ def digest_log_by_line(source: str, file_path: str) -> bool:
 
     Attention: This function works line by line and
     in order to save memory
+
+    Failed lines are quarantined in rejected_log_lines and only a
+    sample of them is logged, see rejects.RejectSink and
+    progress.IngestProgress.
     """
-    num_errors = 0
-    failed_lines = []
+    get_or_create(db.session, LogSource, name=source)
+    progress = IngestProgress(file_path)
+    rejects = RejectSink(source, file_path, autocommit=True)
+    offset = 0
+
     # only reads one line - when the next line is loaded
     # the previous one is garbage collected.
-    with open(file_path) as file_conn:
-        for line in file_conn:
+    with open(file_path, "rb") as file_conn:
+        for raw_line in timed_iter(file_conn, STAGE_READ):
+            line_offset = offset
+            offset += len(raw_line)
+
+            progress.add()
+            line = raw_line.decode("utf-8", "replace")
+            log_entry, reason = parse_log_line_or_reason(source, line)
+            if log_entry is None:
+                progress.failed(line)
+                rejects.add(line, line_offset, reason)
+                continue
+
             try:
-                log_entry = parse_log_line(source, line)
                 save_log_to_database(source, log_entry)
-
             except Exception as error:
-                eprint(f"[-] Failed to save log to db: {error}")
-                eprint(f"[-] Failed line: {line}")
-                num_errors += 1
-                failed_lines.append(line)
-                continue
+                db.session.rollback()
+                progress.failed(line, error)
+                rejects.add(line, line_offset, error_reason(error))
 
-    if num_errors == 0:
-        return True
-    else:
-        eprint(f"[-] Failed log lines: {failed_lines}")
-        eprint(f"[-] Number of failed lines: {num_errors}!")
-        return False
+    rejects.commit()
+    progress.finish()
+    return progress.num_failed == 0
 
 
 def digest_logs(source: str, file_path: str) -> bool:
     """
+    :param: source which type of log file are we dealing with.
+    :param: file_path: The full fill path to the log
+
+    The file is memory mapped and parsed lazily while the entries are
+    written in batches, so memory does not grow with the file size.
+    """
+    log_event(logging.INFO, "[+] Trying parse nginx access.log", path=file_path)
+    stats = {}
+    rejects = RejectSink(source, file_path)
+
+    log_entries = parse_mapped_file(source, file_path, stats, rejects)
+    saved = save_logs_to_database(source, log_entries)
+    rejects.commit()
+
+    num_failed = stats.get("failed", 0)
+    log_event(logging.INFO, "[+] Parsing done", failed=num_failed)
+    return saved
+
+
+def digest_logs_in_batches(
+    source: str, file_path: str, batch_size: int = INSERT_BATCH_SIZE
+) -> bool:
+    """
+    Stream a log file through read -> parse -> batch -> write -> commit.
+
+    :param: source which type of log file are we dealing with.
+    :param: file_path: The full fill path to the log
+    :param: batch_size: The number of lines per batch insert and commit
+    """
+    log_event(
+        logging.INFO,
+        "[+] Trying parse access.log",
+        path=file_path,
+        batch_size=batch_size,
+    )
+    start = time.perf_counter()
+    stats = {}
+    rejects = RejectSink(source, file_path)
+
+    log_entries = parse_mapped_file(source, file_path, stats, rejects)
+    num_rows = save_log_batches(source, log_entries, batch_size)
+    rejects.commit()
+
+    return log_added_rows(num_rows, time.perf_counter() - start, stats)
+
+
+def digest_logs_with_copy(source: str, file_path: str) -> bool:
+    """
+    Parse a log file line by line and bulk copy the entries to the database.
+
     :param: source which type of log file are we dealing with.
     :param: file_path: The full fill path to the log
     """
-    print(f"[+] Trying parse nginx access.log from path={file_path}")
+    log_event(logging.INFO, "[+] Trying to bulk copy access.log", path=file_path)
+    start = time.perf_counter()
+    rejects = RejectSink(source, file_path)
 
-    with open(file_path) as f:
-        log_file_content = f.read()
+    with open(file_path, "rb") as file_conn:
+        log_entries = parse_raw_lines(source, file_conn, rejects)
+        num_rows = copy_logs_to_database(source, log_entries)
+    rejects.commit()
 
-    log_entries = parse_logs(source, log_file_content)
-    num_entries = len(log_entries)
+    return log_added_rows(num_rows, time.perf_counter() - start)
 
-    print(f"[+] Parsing OK. Number of found entries={num_entries}")
-    saved = save_logs_to_database(NGINX, log_entries)
+
+def digest_logs_in_parallel(
+    source: str,
+    file_path: str,
+    workers: int,
+    chunk_mb: float = CHUNK_SIZE_IN_MB,
+    copy: bool = False,
+    batch_size: int = INSERT_BATCH_SIZE,
+) -> bool:
+    """
+    Parse a log file with several processes and save it with one writer.
+
+    :param: source which type of log file are we dealing with.
+    :param: file_path: The full fill path to the log
+    :param: workers: The number of parsing processes
+    :param: chunk_mb: The size of the byte ranges handed to the workers
+    :param: copy: Write with COPY instead of batched inserts
+    :param: batch_size: The number of lines per batch insert
+    """
+    log_event(
+        logging.INFO,
+        "[+] Trying to parse access.log",
+        path=file_path,
+        workers=workers,
+        chunk_mb=chunk_mb,
+    )
+    start = time.perf_counter()
+    stats = {}
+    rejects = RejectSink(source, file_path)
+
+    log_entries = parse_file_in_parallel(
+        source, file_path, workers, chunk_mb, stats, rejects
+    )
+
+    if copy:
+        saved = copy_logs_to_database(source, log_entries) > 0
+    else:
+        saved = save_log_batches(source, log_entries, batch_size) > 0
+    rejects.commit()
+
+    elapsed = time.perf_counter() - start
+    log_event(
+        logging.INFO,
+        "[+] Parsed access.log",
+        elapsed=f"{elapsed:.2f}s",
+        failed=stats.get("failed", 0),
+    )
     return saved
+
+
+def digest_log_files(
+    source: str,
+    file_paths: List[str],
+    copy: bool = False,
+    batch_size: int = INSERT_BATCH_SIZE,
+) -> bool:
+    """
+    Parse and save a set of plain and gzip compressed log files in one pass.
+
+    :param: source which type of log file are we dealing with.
+    :param: file_paths: The log files, oldest first
+    :param: copy: Write with COPY instead of batched inserts
+    :param: batch_size: The number of lines per batch insert
+    """
+    if not file_paths:
+        log_event(logging.ERROR, "[-] No log files found!")
+        return False
+
+    log_event(logging.INFO, "[+] Trying to parse log files", paths=file_paths)
+    start = time.perf_counter()
+    stats = {}
+    rejects = RejectSink(source)
+
+    log_entries = parse_log_files(source, file_paths, stats, rejects)
+
+    if copy:
+        num_rows = copy_logs_to_database(source, log_entries)
+    else:
+        num_rows = save_log_batches(source, log_entries, batch_size)
+    rejects.commit()
+
+    return log_added_rows(num_rows, time.perf_counter() - start, stats)
+
+
+def parse_raw_lines(
+    source: str, file_conn: BinaryIO, rejects: RejectSink
+) -> Iterator[LogEntry]:
+    """
+    Parse the raw lines of a binary file, failed lines go to rejects.
+    """
+    offset = 0
+
+    for raw_line in timed_iter(file_conn, STAGE_READ):
+        line = raw_line.decode("utf-8", "replace")
+        log_entry, reason = parse_log_line_or_reason(source, line)
+        if log_entry is None:
+            rejects.add(raw_line, offset, reason)
+        else:
+            yield log_entry
+
+        offset += len(raw_line)
+
+
+def log_added_rows(num_rows: int, elapsed: float, stats: dict = None) -> bool:
+    """
+    Log the summary of an ingestion run and check that it added rows.
+    """
+    rows_per_sec = num_rows / elapsed if elapsed > 0 else 0.0
+    fields = {
+        "rows": num_rows,
+        "elapsed": f"{elapsed:.2f}s",
+        "rows_per_sec": f"{rows_per_sec:.0f}",
+    }
+    if stats is not None:
+        fields["failed"] = stats.get("failed", 0)
+
+    log_event(logging.INFO, "[+] Added log lines", **fields)
+
+    if num_rows == 0:
+        log_event(logging.ERROR, "[-] 0 log lines retrieved!")
+        return False
+
+    return True
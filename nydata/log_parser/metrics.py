@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics of the log ingestion and the GraphQL log queries.
+
+The parsers add up the seconds of the read, regex and transform
+stages line by line in this process and the writers publish them
+together with the DB write and commit time once per batch (see
+flush_ingest_metrics), so a line only costs a few clock reads.
+
+Every process has its own metrics. To aggregate the gunicorn workers
+and the ingestion worker, point the environment variable
+prometheus_multiproc_dir of all of them to the same empty directory
+before they start, see get_registry.
+"""
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram
+from prometheus_client import multiprocess
+
+T = TypeVar("T")
+
+MULTIPROCESS_DIR_ENV = "prometheus_multiproc_dir"
+
+# Stages of the ingestion of a log line
+STAGE_READ = "read"
+STAGE_REGEX = "regex"
+STAGE_TRANSFORM = "transform"
+STAGE_DB_WRITE = "db_write"
+STAGE_COMMIT = "commit"
+INGEST_STAGES = (
+    STAGE_READ,
+    STAGE_REGEX,
+    STAGE_TRANSFORM,
+    STAGE_DB_WRITE,
+    STAGE_COMMIT,
+)
+
+LOG_LINES_PARSED = Counter(
+    "nydata_log_lines_parsed", "Log lines parsed to a LogEntry", ["source"]
+)
+LOG_LINES_FAILED = Counter(
+    "nydata_log_lines_failed",
+    "Log lines which did not match the pattern of their source",
+    ["source"],
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "nydata_ingest_stage_seconds",
+    "Seconds spent in an ingestion stage per batch of log lines",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+GRAPHQL_RESOLVER_SECONDS = Histogram(
+    "nydata_graphql_resolver_seconds",
+    "Latency of the GraphQL log resolvers",
+    ["field"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+GRAPHQL_RESOLVER_ROWS = Histogram(
+    "nydata_graphql_resolver_rows",
+    "Number of rows returned by the GraphQL log resolvers",
+    ["field"],
+    buckets=(0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+)
+
+# Stage seconds and line counts of the current batch of this process
+_pending_seconds = defaultdict(float)
+_pending_parsed = defaultdict(int)
+_pending_failed = defaultdict(int)
+
+
+def record_stage(stage: str, seconds: float):
+    _pending_seconds[stage] += seconds
+
+
+def count_parsed_line(source: str):
+    _pending_parsed[source] += 1
+
+
+def count_failed_line(source: str):
+    _pending_failed[source] += 1
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """
+    Add the time spent in the with block to an ingestion stage.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def timed_iter(iterable: Iterable[T], stage: str = STAGE_READ) -> Iterator[T]:
+    """
+    Yield the items of an iterable and add the time spent waiting
+    for them (e.g. reading a file) to an ingestion stage.
+    """
+    iterator = iter(iterable)
+
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            record_stage(stage, time.perf_counter() - started)
+
+        yield item
+
+
+def flush_ingest_metrics():
+    """
+    Publish the stage times and line counts of the last batch.
+    """
+    for stage, seconds in _pending_seconds.items():
+        INGEST_STAGE_SECONDS.labels(stage).observe(seconds)
+
+    for source, num_lines in _pending_parsed.items():
+        LOG_LINES_PARSED.labels(source).inc(num_lines)
+
+    for source, num_lines in _pending_failed.items():
+        LOG_LINES_FAILED.labels(source).inc(num_lines)
+
+    _pending_seconds.clear()
+    _pending_parsed.clear()
+    _pending_failed.clear()
+
+
+def timed_resolver(field: str) -> Callable:
+    """
+    Observe the latency and the number of rows of a GraphQL resolver.
+
+    The rows of a relay connection are its edges.
+    """
+
+    def decorator(resolve: Callable) -> Callable:
+        @wraps(resolve)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = resolve(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                GRAPHQL_RESOLVER_SECONDS.labels(field).observe(seconds)
+
+            rows = getattr(result, "edges", result)
+            GRAPHQL_RESOLVER_ROWS.labels(field).observe(len(rows))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Get the registry of this process or, in multiprocess mode, a registry
+    which aggregates the metric files of all processes.
+    """
+    if not os.environ.get(MULTIPROCESS_DIR_ENV):
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
@@ -1,10 +1,26 @@
-from typing import List
+import logging
+from hashlib import blake2b
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+from sqlalchemy import bindparam, func, text
+from sqlalchemy.ext.hybrid import hybrid_property
 
 from nydata.database import Column, Model, SurrogatePK, db, get_or_create, relationship
 
-from ..error import LogLineAlreadyInDb
-from ..utils import eprint
+from ..error import DbError, LogLineAlreadyInDb
+from ..utils import chunked
+from .cache import track_new_log_lines
 from .data import LogEntry
+from .dimensions import intern_values
+from .metrics import (
+    STAGE_COMMIT,
+    STAGE_DB_WRITE,
+    flush_ingest_metrics,
+    timed_stage,
+)
+from .progress import IngestProgress, log_event
 
 
 class LogSource(SurrogatePK, Model):
@@ -18,10 +34,45 @@ class LogSource(SurrogatePK, Model):
     lines = relationship("LogLine", backref="log_source")
 
 
+class UserAgent(SurrogatePK, Model):
+    """
+    Distinct user agent of the log lines
+    """
+
+    __tablename__ = "user_agents"
+
+    value = Column(db.Text(), nullable=False)
+    # see dimensions.value_digest
+    digest = Column(db.String(64), unique=True, nullable=False)
+
+
+class RequestPath(SurrogatePK, Model):
+    """
+    Distinct request path of the log lines
+    """
+
+    __tablename__ = "request_paths"
+
+    # https://stackoverflow.com/questions/417142/what-is-the-maximum-length-of-a-url-in-different-browsers
+    value = Column(db.String(2043), nullable=False)
+    # see dimensions.value_digest
+    digest = Column(db.String(64), unique=True, nullable=False)
+
+
 class LogLine(SurrogatePK, Model):
     """The parsed and normalized log line"""
 
     __tablename__ = "log_lines"
+    __table_args__ = (
+        # Hash code for collision checks. On PostgreSQL log_lines can be
+        # partitioned by timestamp (see partitions.py) and a unique index
+        # has to contain the partition key.
+        db.Index("ix_log_lines_hash_code", "hash_code", "timestamp", unique=True),
+        # Serves every time range query and the keyset pagination, the
+        # date is derived from the timestamp (see utc_date).
+        db.Index("ix_log_lines_timestamp", "timestamp", "id"),
+        {"extend_existing": True},
+    )
 
     # log_source = relationship('LogSource', backref='log_sources')
     log_source_id = Column(db.Integer(), db.ForeignKey("log_sources.id"))
@@ -29,110 +80,554 @@ class LogLine(SurrogatePK, Model):
     # can contain IPv4 and IPv6
     hostIP = Column(db.String(40))
 
-    date = Column(db.Date(), index=True)
-    timestamp = Column(db.Integer())
+    # UTC date of the timestamp
+    date = Column(db.Date())
+    timestamp = Column(db.Integer(), nullable=False)
 
     # RFC 7231 section 4 and RFC 5789 section 2
     verb = Column(db.String(8))
 
-    # https://stackoverflow.com/questions/417142/what-is-the-maximum-length-of-a-url-in-different-browsers
-    path = Column(db.String(2043))
     code = Column(db.Integer())
-    userAgent = Column(db.Text())
 
-    # Hash code for collision checks
-    hash_code = Column(db.String(128), index=True)
+    # the few thousand distinct paths and user agents are stored once
+    # in dimension tables, see the path and userAgent properties
+    request_path_id = Column(db.Integer(), db.ForeignKey("request_paths.id"))
+    request_path = relationship("RequestPath", lazy="joined")
+    user_agent_id = Column(db.Integer(), db.ForeignKey("user_agents.id"))
+    user_agent = relationship("UserAgent", lazy="joined")
+
+    hash_code = Column(db.String(128))
+
+    @hybrid_property
+    def path(self) -> Optional[str]:
+        return self.request_path.value if self.request_path else None
+
+    @path.setter
+    def path(self, value: Optional[str]):
+        self.request_path = intern_object(RequestPath, value)
+
+    @path.expression
+    def path(cls):
+        """Needs a join of LogLine.request_path"""
+        return RequestPath.value
+
+    @hybrid_property
+    def userAgent(self) -> Optional[str]:
+        return self.user_agent.value if self.user_agent else None
+
+    @userAgent.setter
+    def userAgent(self, value: Optional[str]):
+        self.user_agent = intern_object(UserAgent, value)
+
+    @userAgent.expression
+    def userAgent(cls):
+        """Needs a join of LogLine.user_agent"""
+        return UserAgent.value
+
+    @hybrid_property
+    def hour(self) -> int:
+        """Unix timestamp of the start of the hour of the log line"""
+        return self.timestamp // SECONDS_PER_HOUR * SECONDS_PER_HOUR
+
+    @hour.expression
+    def hour(cls):
+        return cls.timestamp / SECONDS_PER_HOUR * SECONDS_PER_HOUR
+
+
+class DailyLogCount(SurrogatePK, Model):
+    """
+    Number of log lines per day, log source, response code and verb
+    """
+
+    __tablename__ = "daily_log_counts"
+    __table_args__ = (
+        db.UniqueConstraint("date", "log_source_id", "code", "verb"),
+        {"extend_existing": True},
+    )
+
+    log_source_id = Column(db.Integer(), db.ForeignKey("log_sources.id"))
+    date = Column(db.Date(), nullable=False)
+    code = Column(db.Integer(), nullable=False)
+    verb = Column(db.String(8), nullable=False)
+    num_lines = Column(db.BigInteger(), nullable=False, default=0)
+
+
+class HourlyLogCount(SurrogatePK, Model):
+    """
+    Number of log lines per hour, log source, response code and verb
+    """
+
+    __tablename__ = "hourly_log_counts"
+    __table_args__ = (
+        db.UniqueConstraint("date", "hour", "log_source_id", "code", "verb"),
+        {"extend_existing": True},
+    )
+
+    log_source_id = Column(db.Integer(), db.ForeignKey("log_sources.id"))
+
+    # the date is part of the key so the rollup can be filtered
+    # by the same (UTC) date as the log lines
+    date = Column(db.Date(), nullable=False)
+    hour = Column(db.Integer(), nullable=False)
+    code = Column(db.Integer(), nullable=False)
+    verb = Column(db.String(8), nullable=False)
+    num_lines = Column(db.BigInteger(), nullable=False, default=0)
+
+
+class IngestCheckpoint(SurrogatePK, Model):
+    """
+    How far a log file was ingested, so later runs only read new bytes
+    """
+
+    __tablename__ = "ingest_checkpoints"
+
+    path = Column(db.String(1024), unique=True, nullable=False)
+
+    # identifies the file behind the path to detect logrotate
+    inode = Column(db.BigInteger())
+    byte_offset = Column(db.BigInteger(), nullable=False, default=0)
+
+    # Hash code of the raw line which ends at byte_offset
+    last_line_hash = Column(db.String(128))
+
+
+class RejectedLogLine(SurrogatePK, Model):
+    """
+    Dead letter of a log line which could not be parsed or saved
+
+    The raw line is kept to replay it after the pattern was fixed,
+    see rejects.replay_rejected_lines.
+    """
+
+    __tablename__ = "rejected_log_lines"
+
+    log_source_id = Column(db.Integer(), db.ForeignKey("log_sources.id"))
+
+    # None if the line did not come from a file
+    path = Column(db.String(1024))
+    byte_offset = Column(db.BigInteger())
+
+    line = Column(db.Text(), nullable=False)
+    reason = Column(db.String(255), nullable=False)
+    created_at = Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # see rejects.reject_digest, the same line is only stored once
+    hash_code = Column(db.String(64), unique=True, nullable=False)
+
+
+SECONDS_PER_HOUR = 3600
+
+INSERT_BATCH_SIZE = 1_000
+
+# Column order of bulk writes, see log_line_rows
+LOG_LINE_COLUMNS = (
+    "log_source_id",
+    "hostIP",
+    "date",
+    "timestamp",
+    "verb",
+    "request_path_id",
+    "code",
+    "user_agent_id",
+    "hash_code",
+)
+
+QUOTED_LOG_LINE_COLUMNS = ", ".join(f'"{column}"' for column in LOG_LINE_COLUMNS)
+
+# Columns of the unique index ix_log_lines_hash_code
+LOG_LINE_CONFLICT_TARGET = "(hash_code, timestamp)"
+
+_INSERT_IGNORE_SQL = (
+    f"INSERT INTO log_lines ({QUOTED_LOG_LINE_COLUMNS}) VALUES %s "
+    f"ON CONFLICT {LOG_LINE_CONFLICT_TARGET} DO NOTHING"
+)
+
+# Rollup table -> key columns and the SQL expressions to compute them
+# from log_lines. Integer division truncates the timestamp to the hour.
+ROLLUP_KEYS = {
+    DailyLogCount.__tablename__: {
+        "date": "date",
+        "log_source_id": "log_source_id",
+        "code": "code",
+        "verb": "verb",
+    },
+    HourlyLogCount.__tablename__: {
+        "date": "date",
+        "hour": f"timestamp / {SECONDS_PER_HOUR} * {SECONDS_PER_HOUR}",
+        "log_source_id": "log_source_id",
+        "code": "code",
+        "verb": "verb",
+    },
+}
+
+
+def rollup_sql(table: str, source: str, where: str = "") -> str:
+    """
+    SQL which adds the log lines selected from source to a rollup table.
+
+    Works on PostgreSQL and on sqlite >= 3.24 (upsert syntax).
+    """
+    keys = ROLLUP_KEYS[table]
+    columns = ", ".join(keys)
+    expressions = ", ".join(keys.values())
+
+    # sqlite needs a WHERE clause to parse the upsert of a SELECT
+    where = where or "WHERE true"
+
+    return (
+        f"INSERT INTO {table} ({columns}, num_lines) "
+        f"SELECT {expressions}, count(*) FROM {source} {where} "
+        f"GROUP BY {expressions} "
+        f"ON CONFLICT ({columns}) "
+        f"DO UPDATE SET num_lines = {table}.num_lines + excluded.num_lines"
+    )
+
+
+def insert_with_rollups_sql(insert_sql: str) -> str:
+    """
+    Extend an INSERT ... ON CONFLICT DO NOTHING into log_lines, so the
+    same PostgreSQL statement also updates the rollup tables.
+
+    Only the actually inserted rows are returned by the INSERT and
+    counted, duplicates never reach the rollups. The statement returns
+    the number of inserted log lines per date, see count_inserted_log_lines.
+    """
+    returning = "date, timestamp, log_source_id, code, verb"
+    rollups = ", ".join(
+        f"{table}_rollup AS ({rollup_sql(table, 'inserted')})" for table in ROLLUP_KEYS
+    )
+    return (
+        f"WITH inserted AS ({insert_sql} RETURNING {returning}), {rollups} "
+        f"SELECT date, count(*) FROM inserted GROUP BY date"
+    )
+
+
+def count_inserted_log_lines(rows: Iterable[Tuple[date, int]]) -> int:
+    """
+    Sum the (date, number) rows of inserted log lines and hand the
+    dates to the query cache to invalidate their cached results.
+    """
+    rows = list(rows)
+    track_new_log_lines(day for day, _ in rows)
+    return sum(num_rows for _, num_rows in rows)
+
+
+def update_log_rollups(first_id: int, last_id: Optional[int] = None):
+    """
+    Add the log lines with first_id <= id <= last_id to the rollup tables.
+
+    The caller commits, so the rollups are updated in the same
+    transaction as the log lines.
+    """
+    where = "WHERE id >= :first_id"
+    if last_id is not None:
+        where += " AND id <= :last_id"
+
+    params = {"first_id": first_id, "last_id": last_id}
+    for table in ROLLUP_KEYS:
+        db.session.execute(text(rollup_sql(table, "log_lines", where)), params)
+
+
+_INSERT_WITH_ROLLUPS_SQL = insert_with_rollups_sql(_INSERT_IGNORE_SQL)
+
+REHASH_CHUNK_SIZE = 10_000
+
+# Length of the hex digest created by log_line_digest
+DIGEST_LENGTH = 64
+
+
+def log_line_digest(host_ip, timestamp, verb, path, code, user_agent) -> str:
+    """
+    Stable hash code of the values of a log line.
+
+    In contrast to the builtin hash() the digest is the same in
+    every process, so log lines can be deduplicated across
+    workers and CLI runs.
+    """
+    fields = (host_ip, timestamp, verb, path, code, user_agent)
+    payload = "\x1f".join("" if field is None else str(field) for field in fields)
+    return blake2b(payload.encode("utf-8"), digest_size=DIGEST_LENGTH // 2).hexdigest()
+
+
+def hash_log_entry(entry: LogEntry) -> str:
+    """
+    Hash code of a LogEntry used for collision checks.
+    """
+    return log_line_digest(
+        entry.host_ip,
+        entry.timestamp,
+        entry.request_verb,
+        entry.request_path,
+        entry.response_code,
+        entry.user_agent,
+    )
+
+
+def utc_date(timestamp: int) -> date:
+    """
+    Get the UTC date of a unix timestamp, the date of a log line.
+    """
+    return datetime.utcfromtimestamp(timestamp).date()
+
+
+def log_line_values(log_source_id: int, entry: LogEntry) -> Dict:
+    """
+    Map a LogEntry dataclass to the column values of a models.LogLine.
+    """
+    return {
+        "log_source_id": log_source_id,
+        "hostIP": entry.host_ip,
+        "date": utc_date(entry.timestamp),
+        "timestamp": entry.timestamp,
+        "verb": entry.request_verb,
+        "path": entry.request_path,
+        "code": entry.response_code,
+        "userAgent": entry.user_agent,
+        "hash_code": hash_log_entry(entry),
+    }
+
+
+def log_line_rows(log_source_id: int, entries: Iterable[LogEntry]) -> List[Dict]:
+    """
+    Map LogEntry dataclasses to the LOG_LINE_COLUMNS of the log_lines table.
+
+    The paths and user agents are replaced by the ids of their
+    dimension tables, the values are interned batch-wise.
+    """
+    rows = [log_line_values(log_source_id, entry) for entry in entries]
+
+    request_path_ids = intern_values(RequestPath, (row["path"] for row in rows))
+    user_agent_ids = intern_values(UserAgent, (row["userAgent"] for row in rows))
+
+    for row in rows:
+        row["request_path_id"] = request_path_ids.get(row.pop("path"))
+        row["user_agent_id"] = user_agent_ids.get(row.pop("userAgent"))
+
+    return rows
+
+
+def intern_object(model, value: Optional[str]):
+    """
+    Get the object of a value of a dimension table, see intern_values.
+    """
+    if value is None:
+        return None
+
+    value_id = intern_values(model, [value])[value]
+    return db.session.query(model).get(value_id)
 
 
 def create_log_line(log_source_id: int, entry: LogEntry, commit=True) -> LogLine:
     """
     Create a models.LogLine from a LogEntry dataclass.
+
+    The line is inserted like a batch of one (see insert_log_lines), so
+    the unique digest index decides if it is already in the database.
+    """
+    if insert_log_lines(log_source_id, [entry]) == 0:
+        raise LogLineAlreadyInDb("[-] LogLine already in database. Skipping")
+
+    if commit:
+        db.session.commit()
+
+    return LogLine.query.filter_by(
+        hash_code=hash_log_entry(entry), timestamp=entry.timestamp
+    ).one()
+
+
+def insert_log_lines(log_source_id: int, entries: Iterable[LogEntry]) -> int:
     """
-    date = entry.original_date_time.date()
-    hash_code = str(hash(entry))
-
-    # https://stackoverflow.com/questions/32938475/flask-sqlalchemy-check-if-row-exists-in-table
-    log_line_not_in_db = LogLine.query.filter_by(hash_code=hash_code).scalar() is None
-
-    if log_line_not_in_db:
-        return LogLine.create(
-            commit=commit,
-            log_source_id=log_source_id,
-            hostIP=entry.host_ip,
-            date=date,
-            timestamp=entry.timestamp,
-            verb=entry.request_verb,
-            path=entry.request_path,
-            code=entry.response_code,
-            userAgent=entry.user_agent,
-            hash_code=hash_code,
+    Insert log entries in one batch and return the number of new rows.
+
+    Lines which are already in the database are skipped by the
+    database itself (ON CONFLICT DO NOTHING) instead of one
+    existence query per line. The rollup tables are updated in the
+    same transaction. The caller commits.
+    """
+    rows = log_line_rows(log_source_id, entries)
+    if not rows:
+        return 0
+
+    table = LogLine.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        # One multi-row VALUES statement. psycopg2's executemany needs
+        # one round trip per row and SQLAlchemy would compile a new
+        # statement for every batch.
+        cursor = db.session.connection().connection.cursor()
+        values = [tuple(row[column] for column in LOG_LINE_COLUMNS) for row in rows]
+        result = execute_values(
+            cursor, _INSERT_WITH_ROLLUPS_SQL, values, page_size=len(values), fetch=True
+        )
+        return count_inserted_log_lines(result)
+
+    if dialect == "sqlite":
+        # sqlite has a single writer, so every row above the
+        # current maximum id was inserted by this statement.
+        last_id = db.session.query(func.max(LogLine.id)).scalar() or 0
+
+        statement = table.insert().prefix_with("OR IGNORE")
+        db.session.execute(statement, rows)
+
+        update_log_rollups(last_id + 1)
+        inserted = (
+            db.session.query(LogLine.date, func.count(LogLine.id))
+            .filter(LogLine.id > last_id)
+            .group_by(LogLine.date)
         )
-    else:
-        msg = "[-] LogLine already in database. Skipping"
-        raise LogLineAlreadyInDb(msg)
+        return count_inserted_log_lines(inserted)
+
+    raise DbError(f"[-] Unsupported database dialect={dialect}!")
+
+
+def rehash_log_lines(chunk_size: int = REHASH_CHUNK_SIZE) -> int:
+    """
+    Replace legacy hash codes of stored log lines with log_line_digest.
+
+    The table is walked by id in chunks and every chunk is committed
+    on its own, so the backfill can run while the app is online.
+    Rows which already carry a digest are skipped.
+    """
+    table = LogLine.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("_id"))
+        .values(hash_code=bindparam("_hash_code"))
+    )
+    stale = db.or_(
+        LogLine.hash_code.is_(None), func.length(LogLine.hash_code) != DIGEST_LENGTH
+    )
+
+    num_rows = 0
+    last_id = 0
+
+    while True:
+        rows = (
+            db.session.query(
+                LogLine.id,
+                LogLine.hostIP,
+                LogLine.timestamp,
+                LogLine.verb,
+                LogLine.path,
+                LogLine.code,
+                LogLine.userAgent,
+            )
+            .outerjoin(LogLine.request_path)
+            .outerjoin(LogLine.user_agent)
+            .filter(LogLine.id > last_id, stale)
+            .order_by(LogLine.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            return num_rows
+
+        hash_codes = [
+            {"_id": row.id, "_hash_code": log_line_digest(*row[1:])} for row in rows
+        ]
+        db.session.execute(update, hash_codes)
+        db.session.commit()
+
+        last_id = rows[-1].id
+        num_rows += len(rows)
+        print(f"[+] Rehashed {num_rows} log lines up to id={last_id}")
+
+
+def save_log_batches(
+    source: str, logs: Iterable[LogEntry], batch_size: int = INSERT_BATCH_SIZE
+) -> int:
+    """
+    Save a stream of log entries batch by batch and return the number of new rows.
+
+    Every batch is written with one statement and committed on its
+    own, so neither the memory nor the transaction grow with the
+    number of log entries. The progress is logged periodically.
+    """
+    assert source, "[-] The name of LogSource cannot be empty!"
+    log_source = get_or_create(db.session, LogSource, name=source)
+    log_source_id = log_source.id
+
+    entries = (log_line for log_line in logs if log_line is not None)
+    progress = IngestProgress(source)
+    num_lines = 0
+
+    try:
+        for batch in chunked(entries, batch_size):
+            with timed_stage(STAGE_DB_WRITE):
+                num_lines += insert_log_lines(log_source_id, batch)
+            with timed_stage(STAGE_COMMIT):
+                db.session.commit()
+            flush_ingest_metrics()
+            progress.add(len(batch))
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return num_lines
 
 
 def save_log_to_database(source: str, log_entry: LogEntry) -> bool:
     """
     Save a single log entry to the database.
+
+    Nothing is logged per entry, the callers count the saved and
+    failed entries (see progress.IngestProgress).
     """
     try:
-        print(f"[+] Inserting log to db for source={source}")
         log_source = get_or_create(db.session, LogSource, name=source)
-        create_log_line(log_source.id, log_entry)
+
+        with timed_stage(STAGE_DB_WRITE):
+            num_lines = insert_log_lines(log_source.id, [log_entry])
+        if num_lines == 0:
+            raise LogLineAlreadyInDb("[-] LogLine already in database. Skipping")
+
+        with timed_stage(STAGE_COMMIT):
+            db.session.commit()
+        flush_ingest_metrics()
+        return True
 
     except LogLineAlreadyInDb:
-        eprint(f"[-] LogLine already in DB - skip!")
         return False
 
-    except Exception as error:
-        eprint(f"[-] Could not write LogEntry to db: {log_entry}")
-        raise error
-
 
-def save_logs_to_database(source: str, logs: List[LogEntry]) -> bool:
+def save_logs_to_database(source: str, logs: Iterable[LogEntry]) -> bool:
     """
-    Save a list of log entries to the database.
+    Save a list (or any other iterable) of log entries to the database.
     """
     try:
-        print(f"[+] Inserting parsed logs to db for source={source}")
+        log_event(logging.INFO, "[+] Inserting parsed logs to db", source=source)
         assert source, "[-] The name of LogSource cannot be empty!"
         log_source = get_or_create(db.session, LogSource, name=source)
 
-        db_log_lines = []
-
-        for log_line in logs:
-            if log_line is None:
-                continue
-            try:
-                db_obj = create_log_line(log_source.id, log_line, commit=False)
-                db_log_lines.append(db_obj)
-
-            # Skip added lines
-            except LogLineAlreadyInDb:
-                continue
+        entries = (log_line for log_line in logs if log_line is not None)
+        progress = IngestProgress(source)
 
-        # db_log_lines = [create_log_line(log_source.id, log_line, commit=False)
-        #                 for log_line in logs
-        #                 if log_line is not None]
+        num_lines = 0
+        for batch in chunked(entries, INSERT_BATCH_SIZE):
+            with timed_stage(STAGE_DB_WRITE):
+                num_lines += insert_log_lines(log_source.id, batch)
+            flush_ingest_metrics()
+            progress.add(len(batch))
 
-        if len(db_log_lines) == 0:
-            eprint(f"[-] 0 log lines retrieved!")
+        if num_lines == 0:
+            log_event(logging.ERROR, "[-] 0 log lines retrieved!")
             return False
 
-        # db.session.add_all(db_log_lines)
         # Flush the whole data to db.
-        db.session.commit()
+        with timed_stage(STAGE_COMMIT):
+            db.session.commit()
+        flush_ingest_metrics()
 
-        num_lines = len(db_log_lines)
-        print(f"[+] SUCCESS. Added {num_lines} log lines to db!")
+        log_event(logging.INFO, "[+] SUCCESS. Added log lines to db", rows=num_lines)
         return True
 
     except Exception as error:
-        eprint("[-] Could not save logs to db -> Rollback!")
-        eprint(f"[-] Error: {error}")
-
         db.session.rollback()
-
-        eprint(f"[-] Rollback successful!")
+        log_event(
+            logging.ERROR,
+            "[-] Could not save logs to db, rolled back",
+            error=repr(str(error)),
+        )
         return False
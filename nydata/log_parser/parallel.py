@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Parse big log files on several cores.
+
+The file is split into byte ranges which end at a line break. Every
+range is parsed in a worker process and sent back as a batch of
+compact records to a single writer in the main process.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from .data import LogEntry
+from .metrics import STAGE_READ, flush_ingest_metrics, timed_iter
+from .rejects import RejectSink, parse_log_line_or_reason
+
+CHUNK_SIZE_IN_MB = 32
+
+# The plain field values of a LogEntry, cheaper to pickle than the dataclass
+Record = Tuple
+
+# The byte offset, the raw line and the reason of a line which could not be parsed
+Rejected = Tuple[int, bytes, str]
+
+
+def split_file(file_path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into (start, end) byte ranges which end at a line break.
+    """
+    size = os.path.getsize(file_path)
+    ranges = []
+
+    with open(file_path, "rb") as file_conn:
+        start = 0
+        while start < size:
+            end = start + chunk_size
+
+            if end < size:
+                # move the end behind the line break of the current line
+                file_conn.seek(end)
+                file_conn.readline()
+                end = file_conn.tell()
+            else:
+                end = size
+
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+
+def parse_file_range(
+    source: str, file_path: str, start: int, end: int
+) -> Tuple[List[Record], List[Rejected]]:
+    """
+    Parse the lines of a byte range and return the records and the failed lines.
+
+    This function runs in the worker processes, which publish their
+    own ingestion metrics.
+    """
+    records = []
+    rejected = []
+
+    with open(file_path, "rb") as file_conn:
+        file_conn.seek(start)
+        position = start
+
+        for raw_line in timed_iter(file_conn, STAGE_READ):
+            if position >= end:
+                break
+            offset = position
+            position += len(raw_line)
+
+            line = raw_line.decode("utf-8", "replace")
+            entry, reason = parse_log_line_or_reason(source, line)
+            if entry is None:
+                rejected.append((offset, raw_line, reason))
+                continue
+
+            records.append(
+                (
+                    entry.host_ip,
+                    entry.original_date_time,
+                    entry.timestamp,
+                    entry.request_verb,
+                    entry.request_path,
+                    entry.response_code,
+                    entry.user_agent,
+                )
+            )
+
+    flush_ingest_metrics()
+    return records, rejected
+
+
+def parse_file_in_parallel(
+    source: str,
+    file_path: str,
+    workers: int,
+    chunk_size_in_mb: float = CHUNK_SIZE_IN_MB,
+    stats: dict = None,
+    rejects: RejectSink = None,
+) -> Iterator[LogEntry]:
+    """
+    Parse a log file with a pool of worker processes.
+
+    The entries are yielded in file order. Only a few ranges per worker
+    are in flight, so memory is bounded by the chunk size and not by
+    the file size. The number of unparseable lines is counted in
+    stats["failed"] if a dict is given and the lines are quarantined
+    in rejects if a sink is given.
+    """
+    chunk_size = max(1, int(chunk_size_in_mb * 1_000_000))
+    ranges = deque(split_file(file_path, chunk_size))
+    max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, end = ranges.popleft()
+                in_flight.append(
+                    executor.submit(parse_file_range, source, file_path, start, end)
+                )
+
+            records, rejected = in_flight.popleft().result()
+            if stats is not None:
+                stats["failed"] = stats.get("failed", 0) + len(rejected)
+            if rejects is not None:
+                for offset, raw_line, reason in rejected:
+                    rejects.add(raw_line, offset, reason, file_path)
+
+            for record in records:
+                yield LogEntry(*record)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Compile nginx `log_format` directives into log line regexes.
+
+A format like
+
+    $remote_addr - $remote_user [$time_local] "$request" $status ...
+
+is compiled into an anchored regex. Every variable matches a character
+class which excludes the first character of the text behind it, so
+there are no overlapping quantifiers and a line is matched in linear
+time without backtracking into other fields.
+
+The groups are named after the variables, except the ones the
+transformers know by another name (see FIELD_NAMES) and $request,
+which is split into verb, path and protocol. Only the fields a
+transformer needs have to be captured, the others are just matched.
+"""
+import re
+from typing import Iterable, List, Optional, Tuple
+
+COMBINED_LOG_FORMAT = (
+    '$remote_addr - $remote_user [$time_local] "$request" '
+    '$status $body_bytes_sent "$http_referer" "$http_user_agent"'
+)
+
+# Field names of variables as used by the transformers
+FIELD_NAMES = {
+    "remote_addr": "ip",
+    "time_local": "time",
+    "status": "code",
+    "http_user_agent": "agent",
+}
+
+REQUEST_FIELDS = ("verb", "path", "protocol")
+
+# Regex of the request line, the path of a valid request has no spaces
+_REQUEST_REGEX = '(?P<verb>[A-Z]+) (?P<path>[^ "]*) (?P<protocol>HTTP/[0-9.]+)'
+
+# Character classes of variables with a known alphabet
+_VARIABLE_CLASSES = {
+    "remote_addr": "[0-9A-Fa-f.:]",
+    "status": "[0-9]",
+    "body_bytes_sent": "[0-9]",
+    "bytes_sent": "[0-9]",
+    "request_length": "[0-9]",
+    "connection": "[0-9]",
+    "connection_requests": "[0-9]",
+    "request_time": "[0-9.]",
+    "msec": "[0-9.]",
+}
+
+_VARIABLE = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+
+# A token is ("literal", text) or ("variable", name)
+Token = Tuple[str, str]
+LITERAL = "literal"
+VARIABLE = "variable"
+
+
+def tokenize_log_format(log_format: str) -> List[Token]:
+    """
+    Split a log_format string into literal text and variables.
+
+    Raises a ValueError if two variables are not separated by text,
+    their values could not be told apart.
+    """
+    tokens = []
+    position = 0
+
+    for matched in _VARIABLE.finditer(log_format):
+        if matched.start() > position:
+            tokens.append((LITERAL, log_format[position : matched.start()]))
+        elif tokens and tokens[-1][0] == VARIABLE:
+            raise ValueError(f"[-] Variables need a separator: `{log_format}`")
+
+        tokens.append((VARIABLE, matched.group(1) or matched.group(2)))
+        position = matched.end()
+
+    if position < len(log_format):
+        tokens.append((LITERAL, log_format[position:]))
+
+    if not any(kind == VARIABLE for kind, _ in tokens):
+        raise ValueError(f"[-] No variables in the log format: `{log_format}`")
+
+    return tokens
+
+
+def field_name(variable: str) -> str:
+    return FIELD_NAMES.get(variable, variable)
+
+
+def log_format_regex(log_format: str, fields: Optional[Iterable[str]] = None) -> str:
+    """
+    Build the regex of a log format.
+
+    Only the given fields (all if None) are captured as named groups.
+    """
+    tokens = tokenize_log_format(log_format)
+    captured = set()
+
+    def group(name: str, regex: str) -> str:
+        if (fields is None or name in fields) and name not in captured:
+            captured.add(name)
+            return f"(?P<{name}>{regex})"
+        return f"(?:{regex})"
+
+    parts = ["^"]
+    for index, (kind, value) in enumerate(tokens):
+        if kind == LITERAL:
+            parts.append(re.escape(value))
+            continue
+
+        if value == "request":
+            regex = _REQUEST_REGEX
+            for name in REQUEST_FIELDS:
+                if (fields is not None and name not in fields) or name in captured:
+                    regex = regex.replace(f"(?P<{name}>", "(?:", 1)
+                captured.add(name)
+            parts.append(f"(?:{regex})")
+            continue
+
+        parts.append(group(field_name(value), _variable_regex(value, tokens, index)))
+
+    parts.append(r"\r?$")
+    return "".join(parts)
+
+
+def _variable_regex(variable: str, tokens: List[Token], index: int) -> str:
+    """
+    The regex of a variable, which stops at the text behind it.
+    """
+    if index + 1 == len(tokens):
+        return r"[^\r\n]*"
+
+    delimiter = tokens[index + 1][1][0]
+    char_class = _VARIABLE_CLASSES.get(variable)
+    if char_class is not None and not re.match(char_class, delimiter):
+        return f"{char_class}{{3}}" if variable == "status" else f"{char_class}+"
+
+    return f"[^{re.escape(delimiter)}\\r\\n]*"
+
+
+def compile_log_format(
+    log_format: str, fields: Optional[Iterable[str]] = None
+) -> re.Pattern:
+    """
+    Compile the regex of a log format for str lines.
+    """
+    return re.compile(log_format_regex(log_format, fields))
+
+
+def compile_log_format_bytes(
+    log_format: str, fields: Optional[Iterable[str]] = None
+) -> re.Pattern:
+    """
+    Compile the regex of a log format for bytes, e.g. a memory mapped file.
+
+    The pattern is matched line by line inside a bigger buffer, so
+    `^` has to match at every line start (MULTILINE).
+    """
+    return re.compile(log_format_regex(log_format, fields).encode(), re.MULTILINE)
@@ -1,8 +1,16 @@
+import time
 from functools import partial
 from typing import Dict, List
 
 from nydata.error import LogRegexPatternNotFound, LogTransformerNotFound
 from nydata.log_parser.data import NGINX, LogEntry
+from nydata.log_parser.metrics import (
+    STAGE_REGEX,
+    STAGE_TRANSFORM,
+    count_failed_line,
+    count_parsed_line,
+    record_stage,
+)
 from nydata.utils import extract_and_transform
 
 from .pattern import get_patterns
@@ -38,6 +46,9 @@ def generic_parse_log_line(
     """
     A generic parser function to parse and transfer a log line string
     to a LogLine entry
+
+    The regex and transform time and the parsed and failed lines are
+    recorded for the ingestion metrics.
     """
     pattern = regexes.get(source)
     transform = transformers.get(source)
@@ -50,7 +61,19 @@ def generic_parse_log_line(
         msg = f"No transformer found with the name=`{source}`!"
         raise LogTransformerNotFound(msg)
 
-    return extract_and_transform(pattern, transform, line)
+    started = time.perf_counter()
+    matched = pattern.match(line)
+    matched_at = time.perf_counter()
+    record_stage(STAGE_REGEX, matched_at - started)
+
+    if matched is None:
+        count_failed_line(source)
+        return None
+
+    log_entry = transform(matched.groupdict())
+    record_stage(STAGE_TRANSFORM, time.perf_counter() - matched_at)
+    count_parsed_line(source)
+    return log_entry
 
 
 parse_log_line = partial(generic_parse_log_line, get_patterns(), get_transformers())
@@ -1,36 +1,62 @@
 import re
-from typing import Dict
+from typing import Callable, Dict, Iterable, Optional
 
 from nydata.log_parser.data import NGINX
 
-_NGINX_LOG_LINE = r"""^(?P<ip>[0-9.]*)    # ip entry
-                     \s*-\s*-\s*
-                     \[(?P<time>.*?)\]   # datetime entry
-                     \s"
-                     (?P<verb>[A-Z]*)    # HTTP method like GET, HEAD
-                     \s
-                     (?P<path>.*?)
-                     \sHTTP/\d\.\d"\s
-                     (?P<code>\d{3})     # HTTP status code
-                     \s\d*\s".*?"\s
-                     "(?P<agent>.*?)"    # agent
-                     $"""
+from .log_format import COMBINED_LOG_FORMAT, compile_log_format, compile_log_format_bytes
+from .transform import NGINX_FIELDS, get_transformers, transform_nginx
 
 
 def get_nginx_log_regex() -> re.Pattern:
     """
-    Retrieve a compiled regexp
+    Retrieve a compiled regexp of the combined log format
     """
-    return re.compile(_NGINX_LOG_LINE, re.VERBOSE)
+    return compile_log_format(COMBINED_LOG_FORMAT, NGINX_FIELDS)
+
+
+def get_nginx_log_bytes_regex() -> re.Pattern:
+    """
+    Retrieve a compiled regexp for bytes, e.g. a memory mapped file.
+    """
+    return compile_log_format_bytes(COMBINED_LOG_FORMAT, NGINX_FIELDS)
 
 
 _PATTERNS = {
     NGINX: get_nginx_log_regex(),
 }
 
+_BYTES_PATTERNS = {
+    NGINX: get_nginx_log_bytes_regex(),
+}
+
 
 def get_patterns() -> Dict:
     """
     Get the name <-> pattern mapper.
     """
     return _PATTERNS
+
+
+def get_bytes_patterns() -> Dict:
+    """
+    Get the name <-> bytes pattern mapper.
+    """
+    return _BYTES_PATTERNS
+
+
+def register_log_format(
+    source: str,
+    log_format: str,
+    transform: Callable = transform_nginx,
+    fields: Optional[Iterable[str]] = NGINX_FIELDS,
+):
+    """
+    Parse the lines of a log source with the regex of a nginx log_format.
+
+    Only the given fields are captured (all if None), by default the
+    ones transform_nginx reads. Raises a ValueError for a log format
+    which cannot be compiled.
+    """
+    _PATTERNS[source] = compile_log_format(log_format, fields)
+    _BYTES_PATTERNS[source] = compile_log_format_bytes(log_format, fields)
+    get_transformers()[source] = transform
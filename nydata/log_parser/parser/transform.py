@@ -1,11 +1,98 @@
 # -*- coding: utf-8 -*-
 
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Dict
 
 from dateutil import parser
 
 from nydata.log_parser.data import NGINX, LogEntry
 
+_MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+# tzinfo objects by UTC offset string like `+0200`
+_TIMEZONES: Dict[str, timezone] = {}
+
+# Consecutive log lines share their timestamp most of the time.
+TIME_CACHE_SIZE = 4096
+
+
+def get_timezone(offset: str) -> timezone:
+    """
+    Get a cached tzinfo for an UTC offset string like `+0200`.
+    """
+    tz = _TIMEZONES.get(offset)
+
+    if tz is None:
+        if offset[0] not in "+-" or len(offset) != 5 or not offset[1:].isdigit():
+            raise ValueError(f"Invalid UTC offset=`{offset}`")
+
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        sign = -1 if offset[0] == "-" else 1
+        tz = _TIMEZONES[offset] = timezone(timedelta(minutes=sign * minutes))
+
+    return tz
+
+
+def parse_fixed_nginx_time(value: str) -> datetime:
+    """
+    Parse a nginx $time_local value like `25/Oct/2016:14:49:33 +0200`.
+
+    Raises a ValueError if the value does not have this exact layout.
+    """
+    layout_ok = (
+        len(value) == 26
+        and value[2] == "/"
+        and value[6] == "/"
+        and value[11] == ":"
+        and value[14] == ":"
+        and value[17] == ":"
+        and value[20] == " "
+    )
+    digits = value[0:2] + value[7:11] + value[12:14] + value[15:17] + value[18:20]
+    month = _MONTHS.get(value[3:6])
+
+    if not layout_ok or month is None or not digits.isdigit():
+        raise ValueError(f"Invalid nginx time=`{value}`")
+
+    return datetime(
+        int(value[7:11]),
+        month,
+        int(value[0:2]),
+        int(value[12:14]),
+        int(value[15:17]),
+        int(value[18:20]),
+        tzinfo=get_timezone(value[21:26]),
+    )
+
+
+@lru_cache(maxsize=TIME_CACHE_SIZE)
+def parse_nginx_time(value: str) -> datetime:
+    """
+    Parse a nginx time value and fall back to dateutil for unusual layouts.
+    """
+    try:
+        return parse_fixed_nginx_time(value)
+    except ValueError:
+        return parser.parse(value, fuzzy=True)
+
+
+# The fields of a matched line which transform_nginx reads
+NGINX_FIELDS = ("ip", "time", "verb", "path", "code", "agent")
+
 
 def transform_nginx(log_entry: Dict) -> LogEntry:
     """
@@ -16,7 +103,7 @@ def transform_nginx(log_entry: Dict) -> LogEntry:
     def get(name: str, default=""):
         return log_entry.get(name, default)
 
-    original_date_time = parser.parse(get("time"), fuzzy=True)
+    original_date_time = parse_nginx_time(get("time"))
     timestamp = int(original_date_time.timestamp())
     code = int(get("code"))
 
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Monthly range partitioning of the log_lines table on PostgreSQL.
+
+Every (UTC) month of the timestamp gets its own partition, lines
+outside of the created months end up in a default partition. Date
+range queries only scan the partitions of their months and old
+months are deleted by dropping their partition.
+"""
+import re
+from calendar import timegm
+from datetime import date, datetime
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from ..error import DbError
+from ..extensions import db
+from .cache import reset_watermarks_on_commit
+from .models import DailyLogCount, HourlyLogCount, LogLine
+
+# Number of months partitions are created in advance
+MONTHS_AHEAD = 3
+
+TABLE = LogLine.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_PARTITION_NAME = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+# Constraints of the partitioned table. Unique constraints have to
+# contain the partition key, so a log line is unique per timestamp.
+_CONSTRAINTS = (
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, timestamp)",
+    f"CREATE UNIQUE INDEX ix_{TABLE}_hash_code ON {TABLE} (hash_code, timestamp)",
+    f"CREATE INDEX ix_{TABLE}_timestamp ON {TABLE} (timestamp, id)",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_log_source_id_fkey "
+    f"FOREIGN KEY (log_source_id) REFERENCES log_sources (id)",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_request_path_id_fkey "
+    f"FOREIGN KEY (request_path_id) REFERENCES request_paths (id)",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_agent_id_fkey "
+    f"FOREIGN KEY (user_agent_id) REFERENCES user_agents (id)",
+)
+
+
+def _execute(statement: str):
+    return db.session.execute(text(statement))
+
+
+def first_of_month(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, num_months: int) -> date:
+    """
+    Get the first day of the month num_months after month.
+    """
+    index = month.year * 12 + month.month - 1 + num_months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: date) -> Tuple[int, int]:
+    """
+    Get the [start, end) unix timestamps of a (UTC) month.
+    """
+    start = first_of_month(month)
+    end = add_months(start, 1)
+    return timegm(start.timetuple()), timegm(end.timetuple())
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned() -> bool:
+    """
+    Check if log_lines is a partitioned table.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect != "postgresql":
+        return False
+
+    query = text(
+        "SELECT count(*) FROM pg_partitioned_table "
+        "WHERE partrelid = CAST(:table AS regclass)"
+    )
+    return db.session.execute(query, {"table": TABLE}).scalar() > 0
+
+
+def list_log_partitions() -> List[date]:
+    """
+    Get the months which have a partition, the default partition excluded.
+    """
+    query = text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+    )
+    months = []
+
+    for (name,) in db.session.execute(query, {"table": TABLE}):
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+
+    return sorted(months)
+
+
+def create_log_partition(month: date) -> bool:
+    """
+    Create the partition of a month if it does not exist yet.
+
+    Lines of the month which are already in the default partition
+    are moved into the new partition. The caller commits.
+    """
+    month = first_of_month(month)
+    if month in list_log_partitions():
+        return False
+
+    name = partition_name(month)
+    start, end = month_bounds(month)
+    in_month = f"timestamp >= {start} AND timestamp < {end}"
+
+    # Attaching the partition fails while the default partition
+    # holds lines of the month.
+    statements = (
+        f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)",
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}",
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}",
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ({start}) TO ({end})",
+    )
+    for statement in statements:
+        _execute(statement)
+
+    print(f"[+] Created partition={name}")
+    return True
+
+
+def create_future_partitions(months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Create the partitions of the current and the next months_ahead months.
+    """
+    this_month = first_of_month(datetime.utcnow().date())
+    months = [add_months(this_month, offset) for offset in range(months_ahead + 1)]
+    return sum(create_log_partition(month) for month in months)
+
+
+def partition_log_lines(months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Convert log_lines to a partitioned table (if necessary) and pre-create
+    the partitions of the next months. Returns the number of new partitions.
+
+    The conversion copies all lines and locks the table, run it
+    in a maintenance window. The caller commits.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect != "postgresql":
+        raise DbError(f"[-] Partitioning is not supported by dialect={dialect}!")
+
+    num_partitions = 0
+    if not is_partitioned():
+        num_partitions += _convert_log_lines()
+
+    return num_partitions + create_future_partitions(months_ahead)
+
+
+def _convert_log_lines() -> int:
+    """
+    Copy the lines of the log_lines heap into a new partitioned table.
+    """
+    heap = f"{TABLE}_heap"
+
+    _execute(f"ALTER TABLE {TABLE} RENAME TO {heap}")
+    _execute(
+        f"CREATE TABLE {TABLE} (LIKE {heap} INCLUDING DEFAULTS) "
+        f"PARTITION BY RANGE (timestamp)"
+    )
+    _execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+    timestamps = f"SELECT min(timestamp), max(timestamp) FROM {heap}"
+    first, last = _execute(timestamps).first()
+
+    num_partitions = 0
+    if first is not None:
+        month = first_of_month(datetime.utcfromtimestamp(first).date())
+        last_month = first_of_month(datetime.utcfromtimestamp(last).date())
+
+        while month <= last_month:
+            num_partitions += create_log_partition(month)
+            month = add_months(month, 1)
+
+    _execute(f"INSERT INTO {TABLE} SELECT * FROM {heap}")
+    _execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+    _execute(f"DROP TABLE {heap}")
+
+    # the indexes are built after the copy, which is a lot faster
+    for statement in _CONSTRAINTS:
+        _execute(statement)
+
+    return num_partitions
+
+
+def drop_log_partitions(before: date, keep_rollups: bool = False) -> List[str]:
+    """
+    Delete all lines of the months before the month of `before`.
+
+    Whole months are dropped with their partition instead of
+    deleting row by row. The rollup rows of these months are deleted
+    in the same transaction, unless keep_rollups is set because the
+    lines were archived. The caller commits.
+    """
+    if not is_partitioned():
+        raise DbError(f"[-] The table {TABLE} is not partitioned!")
+
+    cutoff = first_of_month(before)
+    dropped = []
+
+    for month in list_log_partitions():
+        if month < cutoff:
+            name = partition_name(month)
+            _execute(f"DROP TABLE {name}")
+            dropped.append(name)
+
+    start, _ = month_bounds(cutoff)
+    db.session.execute(
+        text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :start"),
+        {"start": start},
+    )
+
+    if not keep_rollups:
+        for model in (DailyLogCount, HourlyLogCount):
+            model.query.filter(model.date < cutoff).delete(synchronize_session=False)
+
+    # cached query results may contain the dropped lines
+    reset_watermarks_on_commit()
+    return dropped
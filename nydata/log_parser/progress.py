@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Leveled, rate-limited logging of the log ingestion.
+
+The ingestion loops never log per line. They count the lines in an
+IngestProgress which logs a summary every PROGRESS_INTERVAL_IN_SECONDS
+and at most ERROR_SAMPLES_PER_INTERVAL failed lines per interval. The
+other failed lines are only counted and reported with the summary.
+
+Messages carry their values as key=value fields, which are also
+attached to the log record as `fields` for structured handlers.
+"""
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger("nydata.ingest")
+
+PROGRESS_INTERVAL_IN_SECONDS = 10.0
+
+ERROR_SAMPLES_PER_INTERVAL = 5
+
+# Failed lines are cut to this length in the log
+MAX_SAMPLE_LENGTH = 300
+
+
+def log_event(level: int, message: str, **fields):
+    """
+    Log a message followed by its key=value fields.
+    """
+    if not logger.isEnabledFor(level):
+        return
+
+    text = " ".join([message] + [f"{key}={value}" for key, value in fields.items()])
+    logger.log(level, text, extra={"fields": fields})
+
+
+class IngestProgress:
+    """
+    Counts the processed and failed lines of an ingestion run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        interval: float = PROGRESS_INTERVAL_IN_SECONDS,
+        error_samples: int = ERROR_SAMPLES_PER_INTERVAL,
+    ):
+        self.name = name
+        self.interval = interval
+        self.error_samples = error_samples
+
+        self.started = time.monotonic()
+        self.num_lines = 0
+        self.num_failed = 0
+
+        self._next_report = self.started + interval
+        self._samples_left = error_samples
+        self._suppressed = 0
+
+    def add(self, num_lines: int = 1):
+        """
+        Count processed lines and log a summary if the interval is over.
+        """
+        self.num_lines += num_lines
+
+        if time.monotonic() >= self._next_report:
+            self.report("[+] Ingest progress")
+
+    def failed(self, line: str, error: Optional[Exception] = None):
+        """
+        Count a failed line, which is logged if the interval has samples left.
+        """
+        self.num_failed += 1
+
+        if self._samples_left <= 0:
+            self._suppressed += 1
+            return
+
+        self._samples_left -= 1
+        fields = {"name": self.name, "line": repr(line[:MAX_SAMPLE_LENGTH])}
+        if error is not None:
+            fields["error"] = repr(str(error))
+        log_event(logging.WARNING, "[-] Failed log line", **fields)
+
+    def report(self, message: str, level: int = logging.INFO):
+        """
+        Log the counts so far and start a new interval.
+        """
+        now = time.monotonic()
+        elapsed = now - self.started
+        lines_per_sec = self.num_lines / elapsed if elapsed > 0 else 0.0
+
+        fields = {
+            "name": self.name,
+            "lines": self.num_lines,
+            "failed": self.num_failed,
+            "elapsed": f"{elapsed:.2f}s",
+            "lines_per_sec": f"{lines_per_sec:.0f}",
+        }
+        if self._suppressed:
+            fields["unlogged_failures"] = self._suppressed
+
+        log_event(level, message, **fields)
+
+        self._next_report = now + self.interval
+        self._samples_left = self.error_samples
+        self._suppressed = 0
+
+    def finish(self):
+        """
+        Log the summary of the run, as a warning if lines failed.
+        """
+        level = logging.WARNING if self.num_failed else logging.INFO
+        self.report("[+] Ingest done", level)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Read log files without loading them into memory.
+"""
+import glob
+import gzip
+import mmap
+import queue
+import re
+import threading
+import time
+from os import path
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from ..error import LogRegexPatternNotFound, LogTransformerNotFound
+from .data import LogEntry
+from .metrics import (
+    STAGE_READ,
+    STAGE_REGEX,
+    STAGE_TRANSFORM,
+    count_failed_line,
+    count_parsed_line,
+    record_stage,
+    timed_iter,
+)
+from .parser.pattern import get_bytes_patterns
+from .parser.transform import get_transformers
+from .rejects import RejectSink, error_reason
+
+# Mapped pages which were parsed already are released in steps of this size
+RELEASE_PAGES_EVERY = 16 * 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Files of a log directory which are read, nginx writes its error.log next to it
+ACCESS_LOG_GLOB = "access.log*"
+
+# Read ahead of rotated log sets: chunks of about 1 MB of lines
+PREFETCH_CHUNK_SIZE = 1024 * 1024
+PREFETCH_CHUNKS = 8
+
+_END_OF_FILES = object()
+
+
+def match_mapped_file(
+    pattern: re.Pattern, file_path: str
+) -> Iterator[Tuple[int, Optional[re.Match]]]:
+    """
+    Match a bytes pattern against every line of a memory mapped file.
+
+    Yields the byte offset of every line and the match or None. The
+    pattern runs directly on the mapped pages, so neither the file
+    nor a list of lines is ever held in memory. Pages which were
+    parsed already are handed back to the kernel where madvise is
+    available (Python 3.8+). The read and regex time is recorded
+    for the ingestion metrics.
+    """
+    with open(file_path, "rb") as file_conn:
+        try:
+            mapped = mmap.mmap(file_conn.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return
+
+        with mapped:
+            can_release = hasattr(mapped, "madvise")
+            if can_release:
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+            size = len(mapped)
+            position = 0
+            released = 0
+
+            while position < size:
+                started = time.perf_counter()
+                if can_release and position - released >= RELEASE_PAGES_EVERY:
+                    # madvise needs a page aligned start
+                    release_to = position - position % mmap.PAGESIZE
+                    mapped.madvise(mmap.MADV_DONTNEED, released, release_to - released)
+                    released = release_to
+
+                # the pages are read from disk when they are searched first
+                line_break = mapped.find(b"\n", position)
+                if line_break == -1:
+                    line_break = size
+
+                line_end = line_break
+                if line_end > position and mapped[line_end - 1] == ord("\r"):
+                    line_end -= 1
+
+                read_at = time.perf_counter()
+                matched = pattern.match(mapped, position, line_end)
+                record_stage(STAGE_READ, read_at - started)
+                record_stage(STAGE_REGEX, time.perf_counter() - read_at)
+
+                yield position, matched
+                position = line_break + 1
+
+
+def parse_mapped_file(
+    source: str, file_path: str, stats: dict = None, rejects: RejectSink = None
+) -> Iterator[LogEntry]:
+    """
+    Lazily parse a log file through a memory map.
+
+    The number of unparseable lines is counted in stats["failed"]
+    if a dict is given. The lines themselves are quarantined in
+    rejects if a sink is given.
+    """
+    pattern, transform = _get_bytes_parser(source)
+
+    with open(file_path, "rb") as file_conn:
+        for offset, matched in match_mapped_file(pattern, file_path):
+            if matched is None:
+                _count_failure(source, stats)
+                if rejects is not None:
+                    # rare, so the line is read again instead of yielded
+                    file_conn.seek(offset)
+                    rejects.add(file_conn.readline(), offset, file_path=file_path)
+                continue
+
+            try:
+                log_entry = _transform_match(source, transform, matched)
+            except Exception as error:
+                _count_failure(source, stats)
+                if rejects is not None:
+                    reason = error_reason(error)
+                    rejects.add(matched.group(0), offset, reason, file_path)
+                continue
+
+            yield log_entry
+
+
+def expand_log_paths(location: str, pattern: str = ACCESS_LOG_GLOB) -> List[str]:
+    """
+    Find the log files of a file path, directory or glob pattern, oldest first.
+
+    A directory stands for the files in it which match pattern, by
+    default the access log and its rotated files. Rotated files like
+    access.log.14.gz ... access.log.1 come before access.log.
+    """
+    if path.isdir(location):
+        file_paths = glob.glob(path.join(location, pattern))
+    elif path.isfile(location):
+        file_paths = [location]
+    else:
+        file_paths = glob.glob(location)
+
+    file_paths = [file_path for file_path in file_paths if path.isfile(file_path)]
+    return sorted(file_paths, key=_rotation_order)
+
+
+def is_gzip_file(file_path: str) -> bool:
+    """
+    Check the magic bytes of a file for gzip compression.
+    """
+    with open(file_path, "rb") as file_conn:
+        return file_conn.read(2) == GZIP_MAGIC
+
+
+def open_log_file(file_path: str) -> BinaryIO:
+    """
+    Open a plain or gzip compressed log file for binary reading.
+    """
+    if is_gzip_file(file_path):
+        return gzip.open(file_path, "rb")
+
+    return open(file_path, "rb")
+
+
+def read_log_files(file_paths: List[str]) -> Iterator[bytes]:
+    """
+    Yield the raw lines of several plain or gzip compressed files in order.
+    """
+    for _, lines in read_log_chunks(file_paths):
+        yield from lines
+
+
+def read_log_chunks(file_paths: List[str]) -> Iterator[Tuple[str, List[bytes]]]:
+    """
+    Yield the path and a chunk of raw lines of several plain or gzip
+    compressed files in order.
+
+    A background thread reads and decompresses the files ahead of the
+    consumer (zlib releases the GIL), so decompression of the next
+    chunk overlaps with the parsing of the current one. At most
+    PREFETCH_CHUNKS chunks are buffered.
+    """
+    chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for file_path in file_paths:
+                with open_log_file(file_path) as file_conn:
+                    while True:
+                        lines = file_conn.readlines(PREFETCH_CHUNK_SIZE)
+                        if not lines:
+                            break
+                        if not put((file_path, lines)):
+                            return
+            put(_END_OF_FILES)
+
+        except Exception as error:
+            put(error)
+
+    reader = threading.Thread(target=produce, name="log-reader", daemon=True)
+    reader.start()
+
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _END_OF_FILES:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+
+            yield chunk
+
+    finally:
+        stop.set()
+
+
+def parse_log_files(
+    source: str, file_paths: List[str], stats: dict = None, rejects: RejectSink = None
+) -> Iterator[LogEntry]:
+    """
+    Lazily parse several plain or gzip compressed log files in order.
+
+    The number of unparseable lines is counted in stats["failed"]
+    if a dict is given. The lines themselves are quarantined in
+    rejects with their (uncompressed) byte offset if a sink is given.
+    """
+    pattern, transform = _get_bytes_parser(source)
+    current_path = None
+    offset = 0
+
+    for file_path, raw_lines in timed_iter(read_log_chunks(file_paths), STAGE_READ):
+        if file_path != current_path:
+            current_path = file_path
+            offset = 0
+
+        for raw_line in raw_lines:
+            started = time.perf_counter()
+            matched = pattern.match(raw_line.rstrip(b"\r\n"))
+            record_stage(STAGE_REGEX, time.perf_counter() - started)
+
+            line_offset = offset
+            offset += len(raw_line)
+
+            if matched is None:
+                _count_failure(source, stats)
+                if rejects is not None:
+                    rejects.add(raw_line, line_offset, file_path=file_path)
+                continue
+
+            try:
+                log_entry = _transform_match(source, transform, matched)
+            except Exception as error:
+                _count_failure(source, stats)
+                if rejects is not None:
+                    reason = error_reason(error)
+                    rejects.add(raw_line, line_offset, reason, file_path)
+                continue
+
+            yield log_entry
+
+
+def _get_bytes_parser(source: str) -> Tuple[re.Pattern, Callable]:
+    """
+    Get the bytes pattern and the transformer of a log source.
+    """
+    pattern = get_bytes_patterns().get(source)
+    transform = get_transformers().get(source)
+
+    if pattern is None:
+        msg = f"No bytes pattern found with the name=`{source}`!"
+        raise LogRegexPatternNotFound(msg)
+
+    if transform is None:
+        msg = f"No transformer found with the name=`{source}`!"
+        raise LogTransformerNotFound(msg)
+
+    return pattern, transform
+
+
+def _transform_match(source: str, transform: Callable, matched: re.Match) -> LogEntry:
+    """
+    Decode the groups of a bytes match and transform them to a LogEntry.
+    """
+    started = time.perf_counter()
+    extracted = {
+        name: value.decode("utf-8", "replace")
+        for name, value in matched.groupdict().items()
+        if value is not None
+    }
+    log_entry = transform(extracted)
+
+    record_stage(STAGE_TRANSFORM, time.perf_counter() - started)
+    count_parsed_line(source)
+    return log_entry
+
+
+def _count_failure(source: str, stats: dict = None):
+    count_failed_line(source)
+    if stats is not None:
+        stats["failed"] = stats.get("failed", 0) + 1
+
+
+def _rotation_order(file_path: str) -> Tuple[str, int, float]:
+    """
+    Sort key of rotated files: access.log.2.gz < access.log.1 < access.log
+    """
+    name = path.basename(file_path)
+    if name.endswith(".gz"):
+        name = name[: -len(".gz")]
+
+    base, _, suffix = name.rpartition(".")
+    if base and suffix.isdigit():
+        return base, -int(suffix), path.getmtime(file_path)
+
+    return name, 0, path.getmtime(file_path)
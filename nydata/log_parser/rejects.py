@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Dead-letter quarantine of log lines which could not be parsed or saved.
+
+The parsers hand their rejected lines to a RejectSink, which keeps
+them in a small buffer and writes them in batches to the
+rejected_log_lines table together with the source, file, byte offset
+and the reason. A rejected line costs a list append in the hot loop.
+
+After a pattern was fixed, replay_rejected_lines parses the stored
+lines again and moves the ones which match into log_lines.
+"""
+from hashlib import blake2b
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy.dialects import postgresql
+
+from ..database import db, get_or_create
+from ..error import DbError, LogRegexPatternNotFound, LogTransformerNotFound
+from .data import LogEntry
+from .metrics import count_failed_line
+from .models import LogSource, RejectedLogLine, insert_log_lines
+from .parser.parser import parse_log_line
+
+# Number of rejected lines which are written at once
+REJECT_BATCH_SIZE = 1_000
+
+# Number of rejected lines which are parsed again per transaction
+REPLAY_BATCH_SIZE = 1_000
+
+REASON_NO_MATCH = "no match"
+
+# Length of the reason column of rejected_log_lines
+MAX_REASON_LENGTH = 255
+
+
+def reject_digest(
+    log_source_id: int, path: Optional[str], byte_offset: Optional[int], line: str
+) -> str:
+    """
+    Stable hash code of a rejected line at its position in a file.
+
+    Ingesting the same file again does not store its rejects twice.
+    """
+    fields = (log_source_id, path, byte_offset, line)
+    payload = "\x1f".join("" if field is None else str(field) for field in fields)
+    return blake2b(payload.encode("utf-8"), digest_size=32).hexdigest()
+
+
+def error_reason(error: Exception) -> str:
+    """
+    The reason of a line which failed with an exception.
+    """
+    return f"{type(error).__name__}: {error}"[:MAX_REASON_LENGTH]
+
+
+def parse_log_line_or_reason(
+    source: str, line: str
+) -> Tuple[Optional[LogEntry], Optional[str]]:
+    """
+    Parse a log line and return the entry or the reason why it failed.
+
+    A line which matches but cannot be transformed (e.g. a corrupt
+    $time_local) fails on its own instead of failing the whole run.
+    """
+    try:
+        log_entry = parse_log_line(source, line)
+    except (LogRegexPatternNotFound, LogTransformerNotFound):
+        raise
+    except Exception as error:
+        count_failed_line(source)
+        return None, error_reason(error)
+
+    if log_entry is None:
+        return None, REASON_NO_MATCH
+    return log_entry, None
+
+
+class RejectSink:
+    """
+    Collects the rejected lines of a log source and writes them in batches.
+
+    The lines are written to the session of the log lines, so they
+    are committed with the next batch of log lines. With autocommit=True
+    every write is committed on its own, which suits callers that
+    roll back failed lines (see log.digest_log_by_line).
+    """
+
+    def __init__(
+        self,
+        source: str,
+        file_path: Optional[str] = None,
+        batch_size: int = REJECT_BATCH_SIZE,
+        autocommit: bool = False,
+    ):
+        self.source = source
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.autocommit = autocommit
+
+        self.num_rejected = 0
+        self._log_source_id = None
+        self._pending = []
+
+    def add(
+        self,
+        line: Union[str, bytes],
+        byte_offset: Optional[int] = None,
+        reason: str = REASON_NO_MATCH,
+        file_path: Optional[str] = None,
+    ):
+        """
+        Quarantine a line, the file_path defaults to the one of the sink.
+        """
+        self._pending.append((line, byte_offset, reason, file_path or self.file_path))
+        self.num_rejected += 1
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write the pending lines and return their number.
+        """
+        if not self._pending:
+            return 0
+
+        if self._log_source_id is None:
+            log_source = get_or_create(db.session, LogSource, name=self.source)
+            self._log_source_id = log_source.id
+
+        rows = [
+            self._row(line, byte_offset, reason, file_path)
+            for line, byte_offset, reason, file_path in self._pending
+        ]
+        self._pending = []
+
+        insert_rejected_lines(rows)
+        if self.autocommit:
+            db.session.commit()
+
+        return len(rows)
+
+    def commit(self) -> int:
+        """
+        Write and commit the pending lines, e.g. at the end of a file.
+
+        Returns the number of all rejected lines of the sink.
+        """
+        self.flush()
+        db.session.commit()
+        return self.num_rejected
+
+    def _row(
+        self,
+        line: Union[str, bytes],
+        byte_offset: Optional[int],
+        reason: str,
+        file_path: Optional[str],
+    ) -> Dict:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.rstrip("\r\n")
+
+        return {
+            "log_source_id": self._log_source_id,
+            "path": file_path,
+            "byte_offset": byte_offset,
+            "line": line,
+            "reason": reason,
+            "hash_code": reject_digest(
+                self._log_source_id, file_path, byte_offset, line
+            ),
+        }
+
+
+def insert_rejected_lines(rows: List[Dict]):
+    """
+    Insert rejected lines, lines which are already stored are skipped.
+
+    The caller commits.
+    """
+    table = RejectedLogLine.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        statement = postgresql.insert(table).on_conflict_do_nothing(
+            index_elements=["hash_code"]
+        )
+    elif dialect == "sqlite":
+        statement = table.insert().prefix_with("OR IGNORE")
+    else:
+        raise DbError(f"[-] Unsupported database dialect={dialect}!")
+
+    db.session.execute(statement, rows)
+
+
+def replay_rejected_lines(
+    source: Optional[str] = None, batch_size: int = REPLAY_BATCH_SIZE
+) -> Tuple[int, int]:
+    """
+    Parse the rejected lines again, e.g. after a pattern was fixed.
+
+    The lines which match now are saved to log_lines and removed from
+    the quarantine, the others stay. The table is walked by id and
+    every batch is committed on its own. Returns the number of
+    replayed lines and of new log lines.
+    """
+    query = db.session.query(
+        RejectedLogLine.id,
+        RejectedLogLine.line,
+        RejectedLogLine.log_source_id,
+        LogSource.name,
+    ).join(LogSource, RejectedLogLine.log_source_id == LogSource.id)
+    if source is not None:
+        query = query.filter(LogSource.name == source)
+
+    num_replayed = 0
+    num_rows = 0
+    last_id = 0
+
+    while True:
+        rows = (
+            query.filter(RejectedLogLine.id > last_id)
+            .order_by(RejectedLogLine.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return num_replayed, num_rows
+
+        replayed_ids = []
+        entries = {}
+        for row in rows:
+            log_entry, _ = parse_log_line_or_reason(row.name, row.line)
+            if log_entry is not None:
+                replayed_ids.append(row.id)
+                entries.setdefault(row.log_source_id, []).append(log_entry)
+
+        for log_source_id, log_entries in entries.items():
+            num_rows += insert_log_lines(log_source_id, log_entries)
+
+        if replayed_ids:
+            RejectedLogLine.query.filter(
+                RejectedLogLine.id.in_(replayed_ids)
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+        last_id = rows[-1].id
+        num_replayed += len(replayed_ids)
@@ -1,10 +1,43 @@
 # -*- coding: utf-8 -*-
+import heapq
+from base64 import b64decode, b64encode
+from calendar import timegm
+from datetime import date, datetime, timezone
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import graphene
+from graphene.utils.str_converters import to_camel_case
 from graphene_sqlalchemy import SQLAlchemyObjectType
 from graphql import GraphQLError
+from graphql.language.ast import FragmentSpread, InlineFragment
+from sqlalchemy import cast, func, tuple_
 
-from nydata.log_parser.models import LogLine
+from nydata.database import db
+from nydata.log_parser.archive import count_archived_log_lines, iter_archived_log_lines
+from nydata.log_parser.cache import cached_query
+from nydata.log_parser.metrics import timed_resolver
+from nydata.log_parser.models import (
+    ROLLUP_KEYS,
+    SECONDS_PER_HOUR,
+    DailyLogCount,
+    HourlyLogCount,
+    LogLine,
+    RequestPath,
+    UserAgent,
+    utc_date,
+)
+
+# Maximal number of log lines of one page of the logs_connection
+MAX_PAGE_SIZE = 1000
+
+# Maximal number of groups returned by log_counts
+MAX_GROUP_COUNT = 1000
+
+_CURSOR_PREFIX = "LogLine:"
+
+SECONDS_PER_DAY = 86400
 
 
 class Log(SQLAlchemyObjectType):
@@ -15,6 +48,304 @@ class Log(SQLAlchemyObjectType):
     class Meta:
         model = LogLine
         interfaces = (graphene.relay.Node,)
+        exclude_fields = ("request_path_id", "user_agent_id")
+
+    # resolved from the dimension tables
+    path = graphene.String()
+    userAgent = graphene.String()
+
+    hour = graphene.Int(description="Unix timestamp of the start of the hour")
+
+    def resolve_id(self, info):
+        # works for LogLine objects and the projected Log objects of to_logs
+        return self.id
+
+
+# Selectable field names of Log (also camel cased) -> attribute names,
+# e.g. userAgent is a field of its own and not user_agent camel cased.
+_LOG_FIELD_NAMES = {to_camel_case(name): name for name in Log._meta.fields}
+_LOG_FIELD_NAMES.update((name, name) for name in Log._meta.fields)
+
+
+class LogGroupBy(graphene.Enum):
+    """
+    Columns the log lines can be grouped by in log_counts
+    """
+
+    CODE = "code"
+    VERB = "verb"
+    PATH = "path"
+    DAY = "date"
+    HOUR = "hour"
+    HOST_IP = "hostIP"
+
+
+class LogCount(graphene.ObjectType):
+    """
+    Number of log lines of one group, only the grouped columns are set
+    """
+
+    code = graphene.Int()
+    verb = graphene.String()
+    path = graphene.String()
+    day = graphene.Date()
+    hour = graphene.Int(description="Unix timestamp of the start of the hour")
+    hostIP = graphene.String()
+    count = graphene.Int(required=True)
+
+
+def check_date_range(date_from, date_to):
+    """
+    Raise a GraphQLError if the date range is invalid.
+    """
+    if date_from > date_to:
+        msg = "[!] Invalid query `date_from` always has to be smaller than `date_to`!"
+        raise GraphQLError(msg)
+
+
+def to_timestamp(value: datetime) -> int:
+    """
+    Get the unix timestamp of a datetime, naive datetimes are in UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def date_bounds(date_from: date, date_to: date) -> Tuple[int, int]:
+    """
+    Get the [start, end) unix timestamps of the (UTC) dates date_from to date_to.
+    """
+    return timegm(date_from.timetuple()), timegm(date_to.timetuple()) + SECONDS_PER_DAY
+
+
+def get_time_range(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    datetime_from: Optional[datetime] = None,
+    datetime_to: Optional[datetime] = None,
+) -> Tuple[int, int]:
+    """
+    Get the [start, end) unix timestamps of a query over either the
+    dates or the datetimes, both ends are inclusive.
+    """
+    dates = (date_from, date_to)
+    datetimes = (datetime_from, datetime_to)
+
+    if None not in dates and datetimes == (None, None):
+        check_date_range(date_from, date_to)
+        return date_bounds(date_from, date_to)
+
+    if None not in datetimes and dates == (None, None):
+        start, last = to_timestamp(datetime_from), to_timestamp(datetime_to)
+        if start > last:
+            msg = (
+                "[!] Invalid query `datetime_from` always has to be smaller "
+                "than `datetime_to`!"
+            )
+            raise GraphQLError(msg)
+        return start, last + 1
+
+    raise GraphQLError(
+        "[!] Invalid query either `date_from` and `date_to` or "
+        "`datetime_from` and `datetime_to` are required!"
+    )
+
+
+def log_line_time_filter(start: int, end: int) -> Tuple:
+    """
+    Filter the log lines with a timestamp in [start, end).
+
+    A single index on the timestamp serves every range and PostgreSQL
+    skips the partitions of other months.
+    """
+    return LogLine.timestamp >= start, LogLine.timestamp < end
+
+
+def log_line_date_filter(date_from: date, date_to: date) -> Tuple:
+    """
+    Filter the log lines from date_from to date_to (inclusive).
+
+    The date of a log line is the UTC date of its timestamp, so the
+    dates are filtered by their exact timestamp range.
+    """
+    return log_line_time_filter(*date_bounds(date_from, date_to))
+
+
+def get_count_model(group_by: List[str]):
+    """
+    Get the smallest table which can answer a log_counts query.
+
+    Grouping by code, verb, day and hour is answered by the rollup
+    tables, only the other columns have to scan the log lines.
+    """
+    for model in (DailyLogCount, HourlyLogCount):
+        if set(group_by) <= ROLLUP_KEYS[model.__tablename__].keys():
+            return model
+
+    return LogLine
+
+
+def merge_group_counts(
+    query, archived: Dict[Tuple, int], group_by: List[str], limit: int
+) -> List[Dict]:
+    """
+    Add the group counts of the archive to the ones of the log_lines
+    query and return the biggest limit groups.
+    """
+    counts = dict(archived)
+    for row in query:
+        key = tuple(getattr(row, name) for name in group_by)
+        counts[key] = counts.get(key, 0) + row.count
+
+    def order(item) -> Tuple:
+        key, num_lines = item
+        return (-num_lines, *((value is None, value) for value in key))
+
+    return [
+        {**dict(zip(group_by, key)), "count": num_lines}
+        for key, num_lines in sorted(counts.items(), key=order)[:limit]
+    ]
+
+
+def _selections(info, selection_set) -> Iterator:
+    """
+    Yield the fields of a selection set with the fragments resolved.
+    """
+    for selection in selection_set.selections:
+        if isinstance(selection, FragmentSpread):
+            fragment = info.fragments[selection.name.value]
+            yield from _selections(info, fragment.selection_set)
+        elif isinstance(selection, InlineFragment):
+            yield from _selections(info, selection.selection_set)
+        else:
+            yield selection
+
+
+def selected_fields(info, *path: str) -> Set[str]:
+    """
+    Get the names of the fields the client selected below the resolved
+    field, following path (e.g. "edges", "node") into nested objects.
+    """
+    selection_sets = [field.selection_set for field in info.field_asts]
+
+    for name in path:
+        selection_sets = [
+            selection.selection_set
+            for selection_set in selection_sets
+            for selection in _selections(info, selection_set)
+            if selection.name.value == name and selection.selection_set
+        ]
+
+    return {
+        selection.name.value
+        for selection_set in selection_sets
+        for selection in _selections(info, selection_set)
+    }
+
+
+def log_line_projection(fields: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Get the values which have to be loaded for the selected fields of Log.
+
+    The field names can be camel cased (see schema), the keyset
+    (timestamp, id) of the log lines is always loaded.
+    """
+    projection = {"id", "timestamp"}
+
+    for field in fields:
+        name = _LOG_FIELD_NAMES.get(field)
+        if name == "hour":
+            projection.add("timestamp")
+        elif name is not None:
+            projection.add(name)
+
+    return tuple(sorted(projection))
+
+
+def load_log_lines(
+    query, projection: Iterable[str], limit: Optional[int] = None
+) -> List[Dict]:
+    """
+    Load only the projected values of the log lines selected by the query.
+
+    The dimension tables are only joined if path or userAgent are
+    projected. Unlike ORM objects the values can be cached, see to_logs.
+    """
+    columns = LogLine.__table__.columns
+    entities = [columns[name] for name in projection if name in columns]
+
+    if "path" in projection:
+        query = query.outerjoin(LogLine.request_path)
+        entities.append(RequestPath.value.label("path"))
+
+    if "userAgent" in projection:
+        query = query.outerjoin(LogLine.user_agent)
+        entities.append(UserAgent.value.label("userAgent"))
+
+    query = query.with_entities(*entities).limit(limit)
+    return [row._asdict() for row in query]
+
+
+def load_logs(
+    query,
+    start: int,
+    end: int,
+    projection: Iterable[str],
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+) -> List[Dict]:
+    """
+    Load the projected log lines in [start, end) after the keyset `after`
+    from the table and from the Parquet archive, ordered by (timestamp, id).
+
+    Both are read in this order, so their rows are merged and the
+    archive is only read until the page (limit) is full.
+    """
+    rows = load_log_lines(query, projection, limit)
+    archived = iter_archived_log_lines(start, end, projection, after)
+
+    merged = heapq.merge(rows, archived, key=itemgetter("timestamp", "id"))
+    return list(islice(merged, limit))
+
+
+def to_logs(rows: List[Dict]) -> List["Log"]:
+    """
+    Create lightweight Log objects which only hold the loaded values.
+    """
+    logs = []
+
+    for row in rows:
+        log = Log(**row)
+        if log.timestamp is not None:
+            log.hour = log.timestamp // SECONDS_PER_HOUR * SECONDS_PER_HOUR
+        logs.append(log)
+
+    return logs
+
+
+def encode_cursor(line: "Log") -> str:
+    """
+    Encode the keyset (timestamp, id) of a log line as opaque cursor.
+    """
+    value = f"{_CURSOR_PREFIX}{line.timestamp}:{line.id}"
+    return b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """
+    Decode a cursor created by encode_cursor to a (timestamp, id) keyset.
+    """
+    try:
+        value = b64decode(cursor.encode()).decode()
+        if not value.startswith(_CURSOR_PREFIX):
+            raise ValueError(value)
+
+        timestamp, line_id = value[len(_CURSOR_PREFIX) :].split(":")
+        return int(timestamp), int(line_id)
+
+    except ValueError:
+        raise GraphQLError(f"[!] Invalid cursor `{cursor}`!")
 
 
 class Query(graphene.ObjectType):
@@ -24,23 +355,185 @@ class Query(graphene.ObjectType):
 
     logs = graphene.List(
         Log,
+        date_from=graphene.Date(),
+        date_to=graphene.Date(),
+        datetime_from=graphene.DateTime(),
+        datetime_to=graphene.DateTime(),
+    )
+
+    logs_connection = graphene.relay.ConnectionField(
+        Log._meta.connection,
+        date_from=graphene.Date(),
+        date_to=graphene.Date(),
+        datetime_from=graphene.DateTime(),
+        datetime_to=graphene.DateTime(),
+    )
+
+    log_counts = graphene.List(
+        graphene.NonNull(LogCount),
+        group_by=graphene.List(graphene.NonNull(LogGroupBy), required=True),
         date_from=graphene.Date(required=True),
         date_to=graphene.Date(required=True),
+        limit=graphene.Int(),
     )
 
-    def resolve_logs(self, info, date_from, date_to):
+    @timed_resolver("logs")
+    def resolve_logs(self, info, **kwargs):
+        """
+        Get the log lines of the dates or of the (sub-day) datetimes.
+        """
+        start, end = get_time_range(**kwargs)
 
-        if date_from > date_to:
-            msg = (
-                "[!] Invalid query `date_from` always has to be smaller than `date_to`!"
-            )
+        #  start <= LogLine.timestamp < end, in the order of the index
+        query = LogLine.query.filter(*log_line_time_filter(start, end)).order_by(
+            LogLine.timestamp, LogLine.id
+        )
+
+        projection = log_line_projection(selected_fields(info))
+
+        rows = cached_query(
+            "logs",
+            utc_date(start),
+            utc_date(end - 1),
+            lambda: load_logs(query, start, end, projection),
+            start=start,
+            end=end,
+            projection=projection,
+        )
+        return to_logs(rows)
+
+    @timed_resolver("logs_connection")
+    def resolve_logs_connection(self, info, first=None, after=None, **kwargs):
+        """
+        Page through the log lines ordered by (timestamp, id).
+
+        The pages are selected by keyset instead of OFFSET, so every
+        page costs the same no matter how deep the client pages.
+        """
+        start, end = get_time_range(
+            kwargs.get("date_from"),
+            kwargs.get("date_to"),
+            kwargs.get("datetime_from"),
+            kwargs.get("datetime_to"),
+        )
+
+        if kwargs.get("last") is not None or kwargs.get("before") is not None:
+            raise GraphQLError("[!] Only forward pagination with `first` is supported!")
+
+        page_size = MAX_PAGE_SIZE if first is None else first
+        if not 0 <= page_size <= MAX_PAGE_SIZE:
+            msg = f"[!] `first` has to be between 0 and {MAX_PAGE_SIZE}!"
             raise GraphQLError(msg)
 
-        #  date_from <= LogLine.date <= date_to
-        lines = LogLine.query.filter(
-            LogLine.date >= date_from, LogLine.date <= date_to
-        ).all()
-        return lines
+        query = LogLine.query.filter(*log_line_time_filter(start, end))
+
+        keyset = None if after is None else decode_cursor(after)
+        if keyset is not None:
+            line_keyset = tuple_(LogLine.timestamp, LogLine.id)
+            query = query.filter(line_keyset > tuple_(*keyset))
+
+        # one more line tells us if there is a next page
+        query = query.order_by(LogLine.timestamp, LogLine.id)
+
+        projection = log_line_projection(selected_fields(info, "edges", "node"))
+
+        rows = cached_query(
+            "logs_connection",
+            utc_date(start),
+            utc_date(end - 1),
+            lambda: load_logs(
+                query, start, end, projection, limit=page_size + 1, after=keyset
+            ),
+            start=start,
+            end=end,
+            first=page_size,
+            after=after,
+            projection=projection,
+        )
+        lines = to_logs(rows)
+        page = lines[:page_size]
+
+        connection_type = Log._meta.connection
+        edges = [
+            connection_type.Edge(node=line, cursor=encode_cursor(line)) for line in page
+        ]
+        page_info = graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=after is not None,
+            has_next_page=len(lines) > page_size,
+        )
+        return connection_type(edges=edges, page_info=page_info)
+
+    @timed_resolver("log_counts")
+    def resolve_log_counts(self, info, group_by, date_from, date_to, limit=None):
+        """
+        Count the log lines per group with a single GROUP BY query.
+
+        The groups are ordered by their count, biggest first.
+        See get_count_model for the table which is queried. Groups
+        of the log_lines table also count the archived lines.
+        """
+        check_date_range(date_from, date_to)
+
+        if not group_by:
+            raise GraphQLError("[!] `group_by` needs at least one column!")
+
+        limit = MAX_GROUP_COUNT if limit is None else limit
+        if not 0 <= limit <= MAX_GROUP_COUNT:
+            msg = f"[!] `limit` has to be between 0 and {MAX_GROUP_COUNT}!"
+            raise GraphQLError(msg)
+
+        # keep the requested order, but group by every column only once
+        group_by = list(dict.fromkeys(group_by))
+        model = get_count_model(group_by)
+
+        columns = [getattr(model, name).label(name) for name in group_by]
+        if model is LogLine:
+            count = func.count(LogLine.id)
+            date_filter = log_line_date_filter(date_from, date_to)
+        else:
+            count = cast(func.sum(model.num_lines), db.BigInteger)
+            date_filter = (model.date >= date_from, model.date <= date_to)
+        count = count.label("count")
+
+        query = db.session.query(*columns, count).select_from(model)
+        if "path" in group_by:
+            query = query.outerjoin(LogLine.request_path)
+
+        query = (
+            query.filter(*date_filter)
+            .group_by(*columns)
+            .order_by(count.desc(), *columns)
+        )
+
+        def count_groups() -> List[Dict]:
+            # the rollups also count the archived lines, the table does not
+            archived = {}
+            if model is LogLine:
+                archived = count_archived_log_lines(date_from, date_to, group_by)
+
+            if not archived:
+                return [row._asdict() for row in query.limit(limit)]
+            return merge_group_counts(query, archived, group_by, limit)
+
+        rows = cached_query(
+            "log_counts",
+            date_from,
+            date_to,
+            count_groups,
+            group_by=group_by,
+            limit=limit,
+        )
+
+        counts = []
+        for values in rows:
+            values = dict(values)
+            if "date" in values:
+                values["day"] = values.pop("date")
+            counts.append(LogCount(**values))
+
+        return counts
 
 
 def get_logs_schema() -> graphene.Schema:
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental ingestion of growing log files.
+
+Every run continues at the byte offset stored in an IngestCheckpoint,
+so the cost of a run depends on the new data only. A rotated file
+(new inode or truncation) is read to its end before the new file is
+started from the beginning.
+"""
+import glob
+import logging
+import os
+from hashlib import blake2b
+from os import path
+from threading import Event
+from typing import Iterator, List, Optional, Tuple
+
+from ..database import db, get_or_create
+from ..utils import chunked
+from .metrics import (
+    STAGE_COMMIT,
+    STAGE_DB_WRITE,
+    STAGE_READ,
+    flush_ingest_metrics,
+    timed_iter,
+    timed_stage,
+)
+from .models import INSERT_BATCH_SIZE, IngestCheckpoint, LogSource, insert_log_lines
+from .progress import IngestProgress, log_event
+from .rejects import RejectSink, parse_log_line_or_reason
+
+# How many bytes before the offset are read to verify the last ingested line
+LAST_LINE_WINDOW = 64 * 1024
+
+
+def digest_new_lines(
+    source: str,
+    file_path: str,
+    batch_size: int = INSERT_BATCH_SIZE,
+    stop: Optional[Event] = None,
+) -> int:
+    """
+    Parse and save the lines which were appended since the last run.
+
+    A set stop event ends the run after the next committed batch, the
+    checkpoint lets the next run continue there. Returns the number
+    of new log lines in the database.
+    """
+    file_path = path.abspath(file_path)
+    log_source = get_or_create(db.session, LogSource, name=source)
+
+    checkpoint = IngestCheckpoint.query.filter_by(path=file_path).first()
+    if checkpoint is None:
+        checkpoint = IngestCheckpoint(path=file_path, byte_offset=0)
+        db.session.add(checkpoint)
+
+    num_rows = 0
+    try:
+        for segment_path, offset in plan_segments(file_path, checkpoint):
+            log_event(
+                logging.DEBUG, "[+] Reading log", path=segment_path, offset=offset
+            )
+            num_rows += _digest_segment(
+                source,
+                log_source.id,
+                checkpoint,
+                segment_path,
+                offset,
+                batch_size,
+                finished=segment_path != file_path,
+                stop=stop,
+            )
+            if stop is not None and stop.is_set():
+                break
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # an idle poll is only worth a debug message
+    level = logging.INFO if num_rows else logging.DEBUG
+    log_event(level, "[+] SUCCESS. Added new log lines", rows=num_rows, path=file_path)
+    return num_rows
+
+
+def plan_segments(file_path: str, checkpoint: IngestCheckpoint) -> List[Tuple[str, int]]:
+    """
+    Find the files and byte offsets which still have to be read.
+    """
+    stat = os.stat(file_path)
+
+    if checkpoint.inode is None:
+        return [(file_path, 0)]
+
+    same_file = (
+        checkpoint.inode == stat.st_ino
+        and checkpoint.byte_offset <= stat.st_size
+        and _ends_with_last_line(file_path, checkpoint)
+    )
+    if same_file:
+        return [(file_path, checkpoint.byte_offset)]
+
+    rotated_path = find_rotated_file(file_path, checkpoint)
+    if rotated_path is None:
+        log_event(
+            logging.WARNING,
+            "[-] Log file was rotated or truncated and the rotated file is "
+            "missing. Starting from the beginning!",
+            path=file_path,
+        )
+        return [(file_path, 0)]
+
+    return [(rotated_path, checkpoint.byte_offset), (file_path, 0)]
+
+
+def find_rotated_file(file_path: str, checkpoint: IngestCheckpoint) -> Optional[str]:
+    """
+    Find the file that held the checkpointed data before logrotate.
+
+    logrotate either renames the file (e.g. access.log -> access.log.1),
+    which keeps the inode, or copies and truncates it, in which case the
+    copy ends with the last ingested line. Compressed files are ignored.
+    """
+    candidates = sorted(glob.glob(f"{file_path}.*"))
+
+    for candidate in candidates:
+        if candidate.endswith(".gz"):
+            continue
+
+        stat = os.stat(candidate)
+        if stat.st_size < checkpoint.byte_offset:
+            continue
+
+        if stat.st_ino == checkpoint.inode:
+            return candidate
+
+        if checkpoint.last_line_hash and _ends_with_last_line(candidate, checkpoint):
+            return candidate
+
+    return None
+
+
+def hash_raw_line(raw_line: bytes) -> str:
+    """
+    Hash code of a raw log line.
+    """
+    return blake2b(raw_line, digest_size=32).hexdigest()
+
+
+def read_complete_lines(
+    file_path: str, offset: int, finished: bool = False
+) -> Iterator[Tuple[bytes, int]]:
+    """
+    Yield the raw lines after the offset together with their end offset.
+
+    A last line without a line break is still being written and
+    will be read by the next run, unless the file is finished
+    (e.g. rotated).
+    """
+    with open(file_path, "rb") as file_conn:
+        file_conn.seek(offset)
+
+        for raw_line in file_conn:
+            if not raw_line.endswith(b"\n") and not finished:
+                return
+
+            offset += len(raw_line)
+            yield raw_line, offset
+
+
+def _digest_segment(
+    source: str,
+    log_source_id: int,
+    checkpoint: IngestCheckpoint,
+    file_path: str,
+    offset: int,
+    batch_size: int = INSERT_BATCH_SIZE,
+    finished: bool = False,
+    stop: Optional[Event] = None,
+) -> int:
+    """
+    Save the lines of one file and move the checkpoint after every batch.
+
+    The checkpoint is committed in the same transaction as the log
+    lines, so a crash never skips or repeats a batch. Lines which do
+    not match are quarantined in the same transaction and a sample of
+    them is logged (see rejects.RejectSink and progress.IngestProgress).
+    """
+    checkpoint.inode = os.stat(file_path).st_ino
+    checkpoint.byte_offset = offset
+    if offset == 0:
+        checkpoint.last_line_hash = None
+
+    progress = IngestProgress(file_path)
+    rejects = RejectSink(source, file_path)
+    num_rows = 0
+    raw_lines = timed_iter(read_complete_lines(file_path, offset, finished), STAGE_READ)
+    for batch in chunked(raw_lines, batch_size):
+        entries = []
+        for raw_line, line_end in batch:
+            line = raw_line.decode("utf-8", "replace")
+            log_entry, reason = parse_log_line_or_reason(source, line)
+            if log_entry is None:
+                progress.failed(line)
+                rejects.add(line, line_end - len(raw_line), reason)
+            else:
+                entries.append(log_entry)
+
+        with timed_stage(STAGE_DB_WRITE):
+            num_rows += insert_log_lines(log_source_id, entries)
+
+        last_line, checkpoint.byte_offset = batch[-1]
+        checkpoint.last_line_hash = hash_raw_line(last_line)
+        rejects.flush()
+        with timed_stage(STAGE_COMMIT):
+            db.session.commit()
+        flush_ingest_metrics()
+        progress.add(len(batch))
+
+        if stop is not None and stop.is_set():
+            break
+
+    if progress.num_failed:
+        progress.finish()
+
+    db.session.commit()
+    return num_rows
+
+
+def _ends_with_last_line(file_path: str, checkpoint: IngestCheckpoint) -> bool:
+    """
+    Check if the line before the checkpoint offset is the last ingested line.
+    """
+    offset = checkpoint.byte_offset
+    if offset == 0 or checkpoint.last_line_hash is None:
+        return True
+
+    start = max(0, offset - LAST_LINE_WINDOW)
+    with open(file_path, "rb") as file_conn:
+        file_conn.seek(start)
+        window = file_conn.read(offset - start)
+
+    if not window.endswith(b"\n"):
+        return False
+
+    line_start = window.rfind(b"\n", 0, len(window) - 1) + 1
+    if line_start == 0 and start > 0:
+        # The line is longer than the window, we cannot tell.
+        return True
+
+    return hash_raw_line(window[line_start:]) == checkpoint.last_line_hash
@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint
+from datetime import date, datetime
+from http import HTTPStatus
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_graphql import GraphQLView
 from flask_jwt_extended import jwt_required
+from graphql import GraphQLError
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from ..settings import NGINX_ACCESS_LOG_PATH
-from .log import parse_and_save_nginx_logs
-from .schema import schema
+from .export import (
+    EXPORT_FORMATS,
+    FORMAT_NDJSON,
+    MIMETYPES,
+    export_log_lines,
+    gzip_chunks,
+)
+from .metrics import get_registry
+from .schema import get_time_range, schema
 
 
 def graphql_view():
@@ -26,13 +37,63 @@ blueprint = Blueprint(
 blueprint.add_url_rule("/", view_func=graphql_view())
 
 
-@blueprint.before_app_first_request
-def read_access_log():
+export_blueprint = Blueprint("export", __name__, url_prefix="/export")
+
+
+@export_blueprint.route("/logs", methods=["GET"])
+@jwt_required
+def export_logs():
+    """
+    Stream the log lines of a date or datetime range as NDJSON or CSV.
+
+    Query parameters: date_from and date_to or datetime_from and
+    datetime_to (ISO 8601) and format (ndjson or csv). The response
+    is gzip compressed if the client accepts it.
+    """
+    export_format = request.args.get("format", FORMAT_NDJSON)
+    if export_format not in EXPORT_FORMATS:
+        msg = f"Unknown format, use one of {', '.join(EXPORT_FORMATS)}"
+        return jsonify({"msg": msg}), HTTPStatus.BAD_REQUEST
+
+    try:
+        bounds = {
+            name: parse(request.args[name])
+            for name, parse in (
+                ("date_from", date.fromisoformat),
+                ("date_to", date.fromisoformat),
+                ("datetime_from", datetime.fromisoformat),
+                ("datetime_to", datetime.fromisoformat),
+            )
+            if name in request.args
+        }
+        start, end = get_time_range(**bounds)
+
+    except (ValueError, GraphQLError) as error:
+        return jsonify({"msg": str(error)}), HTTPStatus.BAD_REQUEST
+
+    chunks = export_log_lines(start, end, export_format)
+    filename = f"logs_{start}_{end}.{export_format}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    if request.accept_encodings["gzip"] > 0:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=MIMETYPES[export_format],
+        headers=headers,
+    )
+
+
+metrics_blueprint = Blueprint("metrics", __name__)
+
+
+@metrics_blueprint.route("/metrics", methods=["GET"])
+def metrics():
     """
-    Read access log before first request.
+    Ingestion and query metrics in the Prometheus text format.
 
-    In a productive solution I would query it regularly with
-    Celery beat in another process.
+    In multiprocess mode they are aggregated over all processes.
     """
-    log_path = NGINX_ACCESS_LOG_PATH
-    parse_and_save_nginx_logs(log_path)
+    return Response(generate_latest(get_registry()), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Background ingestion of the access log, run as its own process.
+
+The worker polls the log on a schedule and digests the appended
+lines (see tail.digest_new_lines), so the web workers never parse
+logs and start serving immediately.
+"""
+import logging
+import signal
+import time
+from threading import Event
+from typing import Optional
+
+from ..database import db
+from .data import NGINX
+from .models import INSERT_BATCH_SIZE
+from .progress import log_event
+from .tail import digest_new_lines
+
+
+def run_ingest_worker(
+    file_path: str,
+    interval: float,
+    batch_size: int = INSERT_BATCH_SIZE,
+    max_polls: Optional[int] = None,
+    stop: Optional[Event] = None,
+) -> int:
+    """
+    Poll the log file every interval seconds until stopped.
+
+    A failed poll (e.g. the file is missing during logrotate) is
+    logged and retried with the next poll, a repeated error only at
+    debug level. SIGTERM and SIGINT stop the worker after the
+    current batch is committed, also in the middle of a backlog.
+    Returns the number of new log lines.
+    """
+    if stop is None:
+        stop = Event()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_number, lambda *args: stop.set())
+
+    log_event(logging.INFO, "[+] Ingesting log", path=file_path, interval=interval)
+    num_rows = 0
+    num_polls = 0
+    last_error = None
+
+    while not stop.is_set():
+        started = time.monotonic()
+
+        try:
+            num_rows += digest_new_lines(NGINX, file_path, batch_size, stop)
+            last_error = None
+        except Exception as error:
+            level = logging.DEBUG if str(error) == last_error else logging.ERROR
+            last_error = str(error)
+            log_event(
+                level, "[-] Failed to ingest", path=file_path, error=repr(last_error)
+            )
+        finally:
+            # do not hold a connection while sleeping
+            db.session.remove()
+
+        num_polls += 1
+        if max_polls is not None and num_polls >= max_polls:
+            break
+
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    log_event(logging.INFO, "[+] Stopped ingestion worker", polls=num_polls)
+    return num_rows
@@ -24,7 +24,11 @@ SEND_FILE_MAX_AGE_DEFAULT = env.int("SEND_FILE_MAX_AGE_DEFAULT")
 BCRYPT_LOG_ROUNDS = env.int("BCRYPT_LOG_ROUNDS", default=13)
 DEBUG_TB_ENABLED = DEBUG
 DEBUG_TB_INTERCEPT_REDIRECTS = False
-CACHE_TYPE = "simple"  # Can be "memcached", "redis", etc.
+# Can be "memcached", "redis", etc.
+CACHE_TYPE = env.str("CACHE_TYPE", default="simple")
+CACHE_REDIS_URL = env.str("CACHE_REDIS_URL", default=None)
+# Seconds a cached GraphQL log query result is kept (0 = forever)
+LOG_QUERY_CACHE_TIMEOUT = env.int("LOG_QUERY_CACHE_TIMEOUT", default=86400)
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 POSTGRES_URL = env.str('POSTGRES_URL')
@@ -42,3 +46,15 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 NGINX_ACCESS_LOG_PATH = path.abspath(env.str("NGINX_ACCESS_LOG_PATH"))
 msg = f"[-] Bad configuration! Log file does not exist: path=`{NGINX_ACCESS_LOG_PATH}`"
 assert path.exists(NGINX_ACCESS_LOG_PATH), msg
+
+# Also the level of supervisord and gunicorn, see supervisord.conf
+LOG_LEVEL = env.str("LOG_LEVEL", default="info")
+
+# nginx log_format of the access log, unset = the combined format
+NGINX_LOG_FORMAT = env.str("NGINX_LOG_FORMAT", default=None)
+
+# Seconds between two polls of the access log by `flask ingest-logs`
+INGEST_INTERVAL_IN_SECONDS = env.float("INGEST_INTERVAL_IN_SECONDS", default=5.0)
+
+# Directory of the Parquet archive of old log lines (see `flask archive-logs`)
+LOG_ARCHIVE_PATH = env.str("LOG_ARCHIVE_PATH", default=None)
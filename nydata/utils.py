@@ -2,7 +2,8 @@
 """Helper utilities and decorators."""
 import re
 import sys
-from typing import Callable, Dict, TypeVar
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, TypeVar
 
 # Generic Type variable
 T = TypeVar("T")
@@ -31,3 +32,15 @@ def eprint(*args, **kwargs):
     Print to standard error
     """
     print(*args, file=sys.stderr, **kwargs)
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Split an iterable lazily into lists of at most `size` elements.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -7,6 +7,12 @@ if [ $# -eq 0 ] || [ "${1#-}" != "$1" ]; then
   set -- supervisord "$@"
 fi
 
+if [ -n "$prometheus_multiproc_dir" ]; then
+  echo "[+] Resetting the metrics in $prometheus_multiproc_dir"
+  rm -rf "$prometheus_multiproc_dir"
+  mkdir -p "$prometheus_multiproc_dir"
+fi
+
 echo "[+] flask createdb"
 flask createdb
 
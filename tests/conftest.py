@@ -3,14 +3,18 @@
 
 import logging
 from dataclasses import dataclass
+from datetime import datetime
 from os import path
+from typing import Callable, List
 
 import pytest
 from graphene.test import Client
+from sqlalchemy import event
 from webtest import TestApp
 
 from nydata.app import create_app
 from nydata.database import db as _db
+from nydata.log_parser.data import LogEntry
 from nydata.log_parser.schema import get_logs_schema
 
 from .factories import UserFactory
@@ -61,6 +65,22 @@ def db(app):
     _db.drop_all()
 
 
+@pytest.fixture
+def sql_statements(db) -> List[str]:
+    """
+    Collect the SQL statements sent to the database during the test.
+    """
+    statements = []
+    engine = db.get_engine()
+
+    def collect(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", collect)
+    yield statements
+    event.remove(engine, "before_cursor_execute", collect)
+
+
 @pytest.fixture
 def user_password() -> str:
     return "myprecious"
@@ -132,6 +152,31 @@ def log_line() -> str:
     return line
 
 
+@pytest.fixture
+def create_entry() -> Callable[..., LogEntry]:
+    """
+    Factory of log entries at a datetime, the other fields have defaults.
+    """
+
+    def create(
+        now: datetime,
+        verb: str = "GET",
+        path: str = "/favicon.ico",
+        user_agent: str = "Mozilla",
+    ) -> LogEntry:
+        return LogEntry(
+            host_ip="127.0.0.1",
+            original_date_time=now,
+            timestamp=int(now.timestamp()),
+            request_verb=verb,
+            request_path=path,
+            response_code=200,
+            user_agent=user_agent,
+        )
+
+    return create
+
+
 @pytest.fixture
 def user_data() -> UserData:
     """
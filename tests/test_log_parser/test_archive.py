@@ -0,0 +1,195 @@
+import os
+from datetime import date
+from typing import List
+
+import pytest
+
+from nydata.log_parser import archive, schema
+from nydata.log_parser.archive import (
+    archive_log_lines,
+    day_directory,
+    iter_archived_log_lines,
+    write_archive_file,
+)
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.models import DailyLogCount, LogLine, save_log_batches
+from nydata.log_parser.parser.parser import parse_nginx_logs
+from nydata.log_parser.partitions import (
+    is_partitioned,
+    list_log_partitions,
+    partition_log_lines,
+)
+from nydata.log_parser.schema import date_bounds
+
+logs_query = """{ logs (date_from: "2016-01-01", date_to: "2016-12-31") {
+                    id
+                    timestamp
+                    path
+                } }"""
+
+
+@pytest.fixture
+def archive_path(app, tmp_path):
+    app.config["LOG_ARCHIVE_PATH"] = str(tmp_path)
+    yield str(tmp_path)
+    app.config.pop("LOG_ARCHIVE_PATH")
+
+
+@pytest.fixture
+def access_log_lines(db, access_log_str):
+    """The 12 sample log lines, 3 of October 25th and 9 of December 7th"""
+    save_log_batches(NGINX, parse_nginx_logs(access_log_str))
+
+
+@pytest.mark.usefixtures("access_log_lines")
+def test_archive_log_lines(archive_path, graphql_client):
+
+    expected = graphql_client.execute(logs_query)["data"]["logs"]
+
+    assert archive_log_lines(archive_path, date(2016, 12, 1)) == 3
+    assert LogLine.query.count() == 9
+
+    directory = day_directory(archive_path, date(2016, 10, 25))
+    assert [name for name in os.listdir(directory) if name.endswith(".parquet")]
+
+    # the rollups still count the archived lines
+    assert DailyLogCount.query.filter_by(date=date(2016, 10, 25)).count() > 0
+
+    # queries read the archived lines
+    response = graphql_client.execute(logs_query)
+    assert "errors" not in response, response["errors"]
+    assert response["data"]["logs"] == expected
+
+    # nothing is left to archive
+    assert archive_log_lines(archive_path, date(2016, 12, 1)) == 0
+
+
+@pytest.mark.usefixtures("access_log_lines")
+def test_write_archive_file__replaces_same_lines(archive_path):
+
+    day = date(2016, 12, 7)
+    assert write_archive_file(archive_path, day, chunk_size=4)[0] == 9
+    assert write_archive_file(archive_path, day)[0] == 9
+
+    assert len(os.listdir(day_directory(archive_path, day))) == 1
+
+
+@pytest.mark.usefixtures("access_log_lines")
+def test_iter_archived_log_lines__prunes_columns_and_ranges(archive_path):
+
+    archive_log_lines(archive_path, date(2016, 12, 8))
+
+    start, end = date_bounds(date(2016, 12, 7), date(2016, 12, 7))
+    projection = ["id", "timestamp", "date", "hash_code"]
+    rows = list(iter_archived_log_lines(start, end, projection))
+
+    assert len(rows) == 9
+    assert set(rows[0]) == {"id", "timestamp", "date", "hash_code"}
+    assert rows[0]["date"] == date(2016, 12, 7)
+    assert rows[0]["hash_code"] is None
+
+    # 2016-12-07 10:03:20 UTC
+    rows = list(iter_archived_log_lines(1481105000, end, ["id", "timestamp"]))
+    assert len(rows) == 4
+
+    # after the keyset of the 2nd line
+    after = (rows[1]["timestamp"], rows[1]["id"])
+    assert list(iter_archived_log_lines(start, end, ["id"], after)) == rows[2:]
+
+
+@pytest.mark.usefixtures("access_log_lines")
+def test_logs_connection__pages_through_archive_and_table(
+    archive_path, graphql_client
+):
+    archive_log_lines(archive_path, date(2016, 12, 1))
+
+    query = """query page($after: String) {
+                    logs_connection (date_from: "2016-01-01", date_to: "2016-12-31",
+                                     first: 2, after: $after) {
+                        pageInfo { hasNextPage endCursor }
+                        edges { node { timestamp } }
+                    }
+                }"""
+    timestamps, after = [], None
+
+    while True:
+        response = graphql_client.execute(query, variables={"after": after})
+        assert "errors" not in response, response["errors"]
+
+        connection = response["data"]["logs_connection"]
+        timestamps += [edge["node"]["timestamp"] for edge in connection["edges"]]
+        after = connection["pageInfo"]["endCursor"]
+
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+
+    assert len(timestamps) == 12
+    assert timestamps == sorted(timestamps)
+
+
+@pytest.mark.usefixtures("access_log_lines")
+def test_logs_connection__reads_one_page_of_the_archive(
+    archive_path, graphql_client, monkeypatch
+):
+    archive_log_lines(archive_path, date(2016, 12, 8))
+    assert LogLine.query.count() == 0
+
+    num_read = 0
+
+    def counting_reader(*args):
+        nonlocal num_read
+        for row in iter_archived_log_lines(*args):
+            num_read += 1
+            yield row
+
+    monkeypatch.setattr(schema, "iter_archived_log_lines", counting_reader)
+    monkeypatch.setattr(archive, "ARCHIVE_READ_BATCH_SIZE", 2)
+
+    query = """{ logs_connection (date_from: "2016-01-01", date_to: "2016-12-31",
+                                  first: 2) {
+                    pageInfo { hasNextPage }
+                    edges { node { timestamp } }
+                } }"""
+    response = graphql_client.execute(query)
+    assert "errors" not in response, response["errors"]
+
+    connection = response["data"]["logs_connection"]
+    assert len(connection["edges"]) == 2
+    assert connection["pageInfo"]["hasNextPage"]
+
+    # the page and the line which tells that there is a next page
+    assert num_read == 3
+
+
+@pytest.mark.usefixtures("access_log_lines")
+@pytest.mark.parametrize("group_by", ["PATH", "HOST_IP", "HOUR, PATH"])
+def test_log_counts__counts_archived_lines(archive_path, graphql_client, group_by):
+    archive_log_lines(archive_path, date(2016, 12, 1))
+
+    def counts(group_by: str) -> List[int]:
+        query = f"""{{ log_counts (group_by: [{group_by}], date_from: "2016-01-01",
+                                  date_to: "2016-12-31") {{ count }} }}"""
+        response = graphql_client.execute(query)
+        assert "errors" not in response, response["errors"]
+        return [group["count"] for group in response["data"]["log_counts"]]
+
+    assert sum(counts("DAY")) == 12
+    assert sum(counts(group_by)) == 12
+
+    # the archived and the stored lines of an IP are one group
+    assert counts("HOST_IP") == [8, 4]
+
+
+def test_archive_log_lines__drops_partitions(db, access_log_str, archive_path):
+    if db.session.get_bind().dialect.name != "postgresql":
+        pytest.skip("Partitioning needs PostgreSQL")
+
+    save_log_batches(NGINX, parse_nginx_logs(access_log_str))
+    partition_log_lines(months_ahead=0)
+    db.session.commit()
+
+    assert archive_log_lines(archive_path, date(2016, 12, 7)) == 3
+
+    assert is_partitioned()
+    assert date(2016, 10, 1) not in list_log_partitions()
+    assert LogLine.query.count() == 9
@@ -0,0 +1,52 @@
+import csv
+from datetime import datetime
+
+import pytest
+
+from nydata.log_parser.bulk import _to_csv, copy_logs_to_database
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.models import DailyLogCount, LogLine, LogSource, UserAgent
+from nydata.log_parser.parser.parser import parse_nginx_logs
+
+
+@pytest.mark.usefixtures("db")
+def test_copy_logs_to_database(access_log_str):
+
+    num_rows = copy_logs_to_database(NGINX, parse_nginx_logs(access_log_str))
+
+    assert num_rows == 12
+    assert LogSource.query.count() == 1
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_copy_logs_to_database__skips_lines_already_in_db(access_log_str):
+
+    copy_logs_to_database(NGINX, parse_nginx_logs(access_log_str))
+    num_rows = copy_logs_to_database(NGINX, parse_nginx_logs(access_log_str))
+
+    assert num_rows == 0
+    assert LogLine.query.count() == 12
+
+    daily_counts = DailyLogCount.query.with_entities(DailyLogCount.num_lines)
+    assert sum(num_lines for num_lines, in daily_counts) == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_copy_logs_to_database__error_with_empty_source(access_log_str):
+
+    with pytest.raises(AssertionError):
+        copy_logs_to_database("", parse_nginx_logs(access_log_str))
+
+
+@pytest.mark.usefixtures("db")
+def test_to_csv__writes_dimension_ids(create_entry):
+
+    agent = 'Mozilla "quoted", with comma'
+    entry = create_entry(datetime(2016, 12, 7, 10, 34, 43), user_agent=agent)
+    buffer = _to_csv(1, [entry])
+    row = next(csv.reader(buffer))
+
+    assert row[0] == "1"
+    assert row[2] == "2016-12-07"
+    assert row[7] == str(UserAgent.query.filter_by(value=agent).one().id)
@@ -0,0 +1,98 @@
+from datetime import date, datetime
+
+import pytest
+
+from nydata.database import db as _db
+from nydata.log_parser.cache import (
+    get_generation,
+    get_versions,
+    query_cache_key,
+    reset_watermarks_on_commit,
+)
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.models import (
+    LogSource,
+    insert_log_lines,
+    save_log_to_database,
+)
+
+counts_query = """query log_counts($dateFrom: Date!, $dateTo: Date!) {
+                                log_counts (group_by: [DAY], date_from: $dateFrom, date_to: $dateTo) {
+                                    day
+                                    count
+                                }
+                            }"""
+
+
+def count_logs(graphql_client, date_from: str, date_to: str):
+    variables = {"dateFrom": date_from, "dateTo": date_to}
+    response = graphql_client.execute(counts_query, variables=variables)
+
+    assert "errors" not in response, response["errors"]
+    return response["data"]["log_counts"]
+
+
+@pytest.mark.usefixtures("db")
+def test_cached_query__repeated_query_does_not_reach_db(
+    db_setup_test_nginx_12, graphql_client, sql_statements
+):
+    counts = count_logs(graphql_client, "2000-11-11", "2019-12-12")
+    assert len(sql_statements) > 0
+
+    sql_statements.clear()
+    assert count_logs(graphql_client, "2000-11-11", "2019-12-12") == counts
+    assert len(sql_statements) == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_cached_query__ingestion_invalidates_affected_ranges(
+    db_setup_test_nginx_12, graphql_client, sql_statements, create_entry
+):
+    historical = count_logs(graphql_client, "2016-01-01", "2016-11-30")
+    everything = count_logs(graphql_client, "2000-11-11", "2019-12-12")
+    assert {"day": "2016-12-07", "count": 9} in everything
+
+    assert save_log_to_database(NGINX, create_entry(datetime(2016, 12, 7, 12)))
+
+    sql_statements.clear()
+    assert count_logs(graphql_client, "2016-01-01", "2016-11-30") == historical
+    assert len(sql_statements) == 0
+
+    everything = count_logs(graphql_client, "2000-11-11", "2019-12-12")
+    assert {"day": "2016-12-07", "count": 10} in everything
+    assert len(sql_statements) > 0
+
+
+@pytest.mark.usefixtures("db")
+def test_versions__only_replaced_after_commit(db, create_entry):
+
+    source = LogSource.create(name=NGINX)
+    day = date(2016, 12, 7)
+    key = query_cache_key("logs", day, day)
+
+    insert_log_lines(source.id, [create_entry(datetime(2016, 12, 7, 12))])
+    _db.session.rollback()
+
+    assert get_versions(date(2016, 12, 6), date(2016, 12, 8)) == [None] * 3
+    assert query_cache_key("logs", day, day) == key
+
+    insert_log_lines(source.id, [create_entry(datetime(2016, 12, 7, 12))])
+    _db.session.commit()
+
+    versions = get_versions(date(2016, 12, 6), date(2016, 12, 8))
+    assert versions[0] is None and versions[2] is None
+    assert versions[1] is not None
+    assert query_cache_key("logs", day, day) != key
+
+
+@pytest.mark.usefixtures("db")
+def test_reset_watermarks_on_commit__starts_a_new_generation():
+    generation = get_generation()
+
+    reset_watermarks_on_commit()
+    _db.session.rollback()
+    assert get_generation() == generation
+
+    reset_watermarks_on_commit()
+    _db.session.commit()
+    assert get_generation() != generation
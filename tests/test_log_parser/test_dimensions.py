@@ -0,0 +1,63 @@
+import pytest
+
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.dimensions import get_intern_cache, intern_values
+from nydata.log_parser.models import (
+    LogLine,
+    RequestPath,
+    UserAgent,
+    save_logs_to_database,
+)
+from nydata.log_parser.parser.parser import parse_nginx_logs
+
+
+@pytest.mark.usefixtures("db")
+def test_intern_values__stores_every_value_once(db):
+
+    ids = intern_values(UserAgent, ["curl", "Mozilla", "curl", None])
+    assert set(ids) == {"curl", "Mozilla"}
+
+    assert intern_values(UserAgent, ["Mozilla"]) == {"Mozilla": ids["Mozilla"]}
+    db.session.commit()
+
+    assert intern_values(UserAgent, ["Mozilla"]) == {"Mozilla": ids["Mozilla"]}
+    assert UserAgent.query.count() == 2
+
+
+@pytest.mark.usefixtures("db")
+def test_intern_values__cached_after_commit(db, sql_statements):
+
+    ids = intern_values(RequestPath, ["/", "/favicon.ico"])
+    assert len(sql_statements) > 0
+    assert get_intern_cache(RequestPath.__tablename__) == {}
+
+    db.session.commit()
+    assert get_intern_cache(RequestPath.__tablename__) == ids
+
+    sql_statements.clear()
+    assert intern_values(RequestPath, ["/favicon.ico", "/"]) == ids
+    assert len(sql_statements) == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_intern_values__rollback_is_not_cached(db):
+
+    intern_values(RequestPath, ["/robots.txt"])
+    db.session.rollback()
+
+    assert get_intern_cache(RequestPath.__tablename__) == {}
+    assert RequestPath.query.count() == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_save_logs_to_database__dictionary_encodes_lines(access_log_str):
+
+    assert save_logs_to_database(NGINX, parse_nginx_logs(access_log_str))
+
+    assert LogLine.query.count() == 12
+    assert UserAgent.query.count() < 12
+    assert RequestPath.query.count() < 12
+
+    paths = {line.path for line in LogLine.query}
+    assert paths == {request_path.value for request_path in RequestPath.query}
+    assert all(line.userAgent.startswith("Mozilla") for line in LogLine.query)
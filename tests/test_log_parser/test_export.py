@@ -0,0 +1,93 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date
+from http import HTTPStatus
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from nydata.log_parser.export import EXPORT_COLUMNS, iter_log_line_chunks
+from nydata.log_parser.schema import date_bounds
+
+DECEMBER_7 = {"date_from": "2016-12-07", "date_to": "2016-12-07"}
+
+
+@pytest.fixture
+def auth_headers(app):
+    token = create_access_token(identity="tester")
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.usefixtures("db")
+def test_export_logs__ndjson(db_setup_test_nginx_12, testapp, auth_headers):
+
+    response = testapp.get("/export/logs", DECEMBER_7, headers=auth_headers)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.content_type == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 9
+    assert list(lines[0]) == list(EXPORT_COLUMNS)
+
+    timestamps = [line["timestamp"] for line in lines]
+    assert timestamps == sorted(timestamps)
+    assert lines[0]["date"] == "2016-12-07"
+    assert lines[0]["path"] == "/"
+
+
+@pytest.mark.usefixtures("db")
+def test_export_logs__gzipped_csv(db_setup_test_nginx_12, app, auth_headers):
+
+    # webtest decompresses responses, the flask client does not
+    client = app.test_client()
+    response = client.get(
+        "/export/logs",
+        query_string={**DECEMBER_7, "format": "csv"},
+        headers={**auth_headers, "Accept-Encoding": "gzip"},
+    )
+
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    text = gzip.decompress(response.data).decode("utf-8")
+    rows = list(csv.reader(io.StringIO(text)))
+
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert len(rows) == 10
+
+
+@pytest.mark.usefixtures("db")
+def test_export_logs__empty_range_has_csv_header(testapp, auth_headers):
+
+    params = {**DECEMBER_7, "format": "csv"}
+    response = testapp.get("/export/logs", params, headers=auth_headers)
+
+    assert response.text.splitlines() == [",".join(EXPORT_COLUMNS)]
+
+
+@pytest.mark.usefixtures("db")
+def test_export_logs__invalid_requests(testapp, auth_headers):
+
+    testapp.get("/export/logs", DECEMBER_7, status=HTTPStatus.UNAUTHORIZED)
+
+    params = {**DECEMBER_7, "format": "xml"}
+    testapp.get("/export/logs", params, headers=auth_headers, status=400)
+
+    params = {"date_from": "2016-12-07"}
+    response = testapp.get("/export/logs", params, headers=auth_headers, status=400)
+    assert response.json["msg"].startswith("[!] Invalid query")
+
+    params = {"date_from": "07.12.2016", "date_to": "2016-12-07"}
+    testapp.get("/export/logs", params, headers=auth_headers, status=400)
+
+
+@pytest.mark.usefixtures("db")
+def test_iter_log_line_chunks(db_setup_test_nginx_12):
+
+    start, end = date_bounds(date(2016, 12, 7), date(2016, 12, 7))
+    chunks = list(iter_log_line_chunks(start, end, chunk_size=4))
+
+    assert [len(rows) for rows in chunks] == [4, 4, 1]
@@ -0,0 +1,83 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.generator import (
+    DISTRIBUTION_UNIFORM,
+    generate_nginx_log,
+    iter_log_chunks,
+)
+from nydata.log_parser.log import parse_and_save_nginx_logs
+from nydata.log_parser.models import LogLine
+from nydata.log_parser.parser.parser import parse_log_line
+
+
+def generated_lines(**options):
+    return "".join(iter_log_chunks(**options)).splitlines()
+
+
+def test_iter_log_chunks__same_seed_same_log():
+    options = {"num_lines": 2_500, "chunk_size": 1_000}
+
+    log = generated_lines(seed=1, **options)
+
+    assert len(log) == 2_500
+    assert generated_lines(seed=1, **options) == log
+    assert generated_lines(seed=1, workers=2, **options) == log
+    assert generated_lines(seed=2, **options) != log
+
+
+def test_iter_log_chunks__follows_the_options():
+    entries = [
+        parse_log_line(NGINX, line)
+        for line in generated_lines(
+            num_lines=5_000,
+            seed=3,
+            start=datetime(2020, 1, 1),
+            span_in_days=2,
+            num_ips=50,
+            num_paths=20,
+            num_user_agents=10,
+            distribution=DISTRIBUTION_UNIFORM,
+            error_rate=0.1,
+            malformed_rate=0.02,
+        )
+    ]
+    parsed = [entry for entry in entries if entry is not None]
+
+    assert 60 < len(entries) - len(parsed) < 140
+    assert len({entry.host_ip for entry in parsed}) == 50
+    assert len({entry.request_path for entry in parsed}) == 20
+    assert len({entry.user_agent for entry in parsed}) == 10
+
+    num_errors = sum(entry.response_code >= 400 for entry in parsed)
+    assert 0.08 < num_errors / len(parsed) < 0.12
+
+    timestamps = [entry.timestamp for entry in parsed]
+    assert timestamps == sorted(timestamps)
+    assert timestamps[0] == 1577836800  # 2020-01-01 00:00:00 UTC
+    assert timestamps[-1] < 1577836800 + 2 * 86400
+
+
+def test_iter_log_chunks__zipf_has_hot_paths():
+    lines = generated_lines(num_lines=5_000, seed=4, malformed_rate=0)
+    paths = [parse_log_line(NGINX, line).request_path for line in lines]
+
+    # the first path of the pool, the start page, is the hottest
+    (hottest, count), = Counter(paths).most_common(1)
+    assert hottest == "/"
+    assert count > 5_000 / 20
+
+
+@pytest.mark.usefixtures("db")
+def test_generate_nginx_log__gzipped_log_can_be_ingested(tmp_path):
+    file_path = str(tmp_path / "access.log.gz")
+
+    assert generate_nginx_log(file_path, num_lines=300, seed=5, malformed_rate=0)
+    assert parse_and_save_nginx_logs(file_path)
+
+    # no line is malformed and the 300 lines of seed 5 are all distinct,
+    # so none is skipped as a duplicate
+    assert LogLine.query.count() == 300
@@ -2,6 +2,7 @@ import pytest
 
 from nydata.log_parser import digest_log_by_line, digest_logs, parse_and_save_nginx_logs
 from nydata.log_parser.data import NGINX
+from nydata.log_parser.log import MODE_BATCH, MODE_COPY, MODE_ORM, digest_logs_in_batches
 from nydata.log_parser.models import LogLine, LogSource
 
 
@@ -48,7 +49,7 @@ def test_parse_and_save_nginx_log__save_by_line(test_access_log_path):
     assert LogLine.query.count() == 0
     assert LogSource.query.count() == 0
 
-    saved = parse_and_save_nginx_logs(test_access_log_path, 0.00001)
+    saved = parse_and_save_nginx_logs(test_access_log_path, 0.00001, mode=MODE_ORM)
     assert saved is True
 
     assert LogSource.query.count() == 1
@@ -93,3 +94,45 @@ def test_digest_logs(test_bad_log_path):
 
     assert LogSource.query.count() == 1
     assert LogLine.query.count() == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__copy_mode(test_access_log_path):
+
+    assert LogLine.query.count() == 0
+
+    saved = parse_and_save_nginx_logs(test_access_log_path, mode=MODE_COPY)
+    assert saved is True
+
+    assert LogSource.query.count() == 1
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__copy_mode_bad_log_file(test_bad_log_path):
+
+    saved = parse_and_save_nginx_logs(test_bad_log_path, mode=MODE_COPY)
+    assert saved is False
+
+    assert LogLine.query.count() == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__batch_mode(test_access_log_path):
+
+    saved = parse_and_save_nginx_logs(
+        test_access_log_path, mode=MODE_BATCH, batch_size=5
+    )
+    assert saved is True
+
+    assert LogSource.query.count() == 1
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_logs_in_batches__lines_already_in_db(test_access_log_path):
+
+    assert digest_logs_in_batches(NGINX, test_access_log_path, batch_size=5) is True
+    assert digest_logs_in_batches(NGINX, test_access_log_path, batch_size=5) is False
+
+    assert LogLine.query.count() == 12
@@ -0,0 +1,109 @@
+import pytest
+
+from nydata.log_parser.parser.log_format import (
+    COMBINED_LOG_FORMAT,
+    compile_log_format,
+    tokenize_log_format,
+)
+from nydata.log_parser.parser.parser import parse_log_line, parse_nginx_log_line
+from nydata.log_parser.parser.pattern import (
+    get_bytes_patterns,
+    get_patterns,
+    register_log_format,
+)
+from nydata.log_parser.parser.transform import get_transformers
+from nydata.log_parser.reader import parse_mapped_file
+
+TIMED_LOG_FORMAT = COMBINED_LOG_FORMAT + " $request_time $upstream_response_time"
+
+TIMED = "nginx_timed"
+
+
+@pytest.fixture
+def timed_source():
+    register_log_format(TIMED, TIMED_LOG_FORMAT)
+    yield TIMED
+
+    for mapper in (get_patterns(), get_bytes_patterns(), get_transformers()):
+        mapper.pop(TIMED)
+
+
+def test_tokenize_log_format():
+    assert tokenize_log_format('${remote_addr} [$time_local] "$request"') == [
+        ("variable", "remote_addr"),
+        ("literal", " ["),
+        ("variable", "time_local"),
+        ("literal", '] "'),
+        ("variable", "request"),
+        ("literal", '"'),
+    ]
+
+
+@pytest.mark.parametrize("log_format", ["$status$body_bytes_sent", "no variables"])
+def test_tokenize_log_format__invalid_format(log_format):
+    with pytest.raises(ValueError):
+        tokenize_log_format(log_format)
+
+
+def test_compile_log_format__captures_all_fields(log_line):
+    pattern = compile_log_format(TIMED_LOG_FORMAT)
+
+    matched = pattern.match(log_line + " 0.004 0.002, 0.001\n")
+
+    assert matched.groupdict() == {
+        "ip": "77.179.66.156",
+        "remote_user": "-",
+        "time": "07/Dec/2016:10:34:43 +0100",
+        "verb": "GET",
+        "path": "/favicon.ico",
+        "protocol": "HTTP/1.1",
+        "code": "404",
+        "body_bytes_sent": "571",
+        "http_referer": "http://localhost:8080/",
+        "agent": matched.group("agent"),
+        "request_time": "0.004",
+        "upstream_response_time": "0.002, 0.001",
+    }
+    assert matched.group("agent").startswith("Mozilla/5.0 (Macintosh;")
+
+
+def test_compile_log_format__captures_only_the_given_fields(log_line):
+    pattern = compile_log_format(COMBINED_LOG_FORMAT, fields=("ip", "code"))
+
+    assert pattern.match(log_line).groupdict() == {"ip": "77.179.66.156", "code": "404"}
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        '1.2.3.4 - - [07/Dec/2016:10:34:43 +0100] "-" 400 0 "-" "-"',
+        '1.2.3.4 - - [07/Dec/2016:10:34:43 +0100] "GET / HTTP/1.1" 20 0 "-" "-"',
+        '1.2.3.4 - - [07/Dec/2016:10:34:43 +0100] "GET / HTTP/1.1" 200 0 "-" "-" x',
+        '"' * 10_000,
+    ],
+)
+def test_compile_log_format__rejects_lines_of_other_layouts(line):
+    assert compile_log_format(COMBINED_LOG_FORMAT).match(line) is None
+
+
+def test_parse_nginx_log_line__ipv6(log_line):
+    ipv6 = "2001:db8::ff00:42:8329"
+
+    log_entry = parse_nginx_log_line(log_line.replace("77.179.66.156", ipv6))
+
+    assert log_entry.host_ip == ipv6
+
+
+def test_register_log_format(timed_source, log_line, tmp_path):
+    timed_line = log_line + " 0.004 -"
+
+    assert parse_log_line(timed_source, timed_line) == parse_nginx_log_line(log_line)
+    assert parse_log_line(timed_source, log_line) is None
+
+    log_file = tmp_path / "access.log"
+    log_file.write_text(timed_line + "\n" + log_line + "\n")
+    stats = {}
+    entries = list(parse_mapped_file(timed_source, str(log_file), stats))
+
+    assert entries == [parse_nginx_log_line(log_line)]
+    assert stats["failed"] == 1
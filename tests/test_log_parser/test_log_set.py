@@ -0,0 +1,136 @@
+import gzip
+import logging
+import os
+
+import pytest
+
+from nydata.log_parser import parse_and_save_nginx_logs
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.log import MODE_COPY
+from nydata.log_parser.models import LogLine
+from nydata.log_parser.parser import parse_nginx_logs
+from nydata.log_parser.reader import (
+    expand_log_paths,
+    is_gzip_file,
+    parse_log_files,
+    read_log_files,
+)
+
+
+@pytest.fixture
+def rotated_logs(tmp_path, access_log_str):
+    """
+    A log directory with the sample lines spread over rotated files:
+    access.log.2.gz (oldest), access.log.1 and access.log (newest).
+    """
+    lines = [line + "\n" for line in access_log_str.splitlines()]
+
+    with gzip.open(tmp_path / "access.log.2.gz", "wt") as file_conn:
+        file_conn.writelines(lines[:4])
+    (tmp_path / "access.log.1").write_text("".join(lines[4:8]))
+    (tmp_path / "access.log").write_text("".join(lines[8:]))
+
+    # copied files do not keep their modification times
+    for name in ("access.log", "access.log.1", "access.log.2.gz"):
+        os.utime(tmp_path / name, (0, 0))
+
+    return tmp_path
+
+
+def test_expand_log_paths__directory_oldest_first(rotated_logs):
+
+    file_paths = expand_log_paths(str(rotated_logs))
+
+    names = [os.path.basename(file_path) for file_path in file_paths]
+    assert names == ["access.log.2.gz", "access.log.1", "access.log"]
+
+
+def test_expand_log_paths__directory_skips_error_log(rotated_logs):
+    (rotated_logs / "error.log").write_text("2016/12/07 10:34:43 [error] 1#1: *1\n")
+    (rotated_logs / "error.log.1").write_text("")
+
+    file_paths = expand_log_paths(str(rotated_logs))
+
+    names = [os.path.basename(file_path) for file_path in file_paths]
+    assert names == ["access.log.2.gz", "access.log.1", "access.log"]
+
+
+def test_expand_log_paths__glob(rotated_logs):
+
+    file_paths = expand_log_paths(str(rotated_logs / "access.log.*"))
+
+    names = [os.path.basename(file_path) for file_path in file_paths]
+    assert names == ["access.log.2.gz", "access.log.1"]
+
+
+def test_expand_log_paths__single_file_and_missing(test_access_log_path):
+
+    assert expand_log_paths(test_access_log_path) == [test_access_log_path]
+    assert expand_log_paths("file/does/not/exist") == []
+
+
+def test_is_gzip_file(rotated_logs):
+
+    assert is_gzip_file(str(rotated_logs / "access.log.2.gz"))
+    assert not is_gzip_file(str(rotated_logs / "access.log.1"))
+
+
+def test_read_log_files__reads_all_lines_in_order(rotated_logs, access_log_str):
+
+    raw_lines = list(read_log_files(expand_log_paths(str(rotated_logs))))
+
+    assert b"".join(raw_lines).decode() == access_log_str + "\n"
+
+
+def test_read_log_files__raises_reader_errors(tmp_path):
+
+    with pytest.raises(FileNotFoundError):
+        list(read_log_files([str(tmp_path / "missing.log")]))
+
+
+def test_parse_log_files(rotated_logs, access_log_str, test_bad_log_path):
+
+    stats = {}
+    file_paths = expand_log_paths(str(rotated_logs)) + [test_bad_log_path]
+
+    entries = list(parse_log_files(NGINX, file_paths, stats))
+
+    assert entries == parse_nginx_logs(access_log_str)
+    assert stats["failed"] == 6
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__directory(rotated_logs):
+
+    assert parse_and_save_nginx_logs(str(rotated_logs)) is True
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__directory_warns_about_workers(
+    rotated_logs, caplog
+):
+
+    assert parse_and_save_nginx_logs(str(rotated_logs), workers=2) is True
+    assert LogLine.query.count() == 12
+
+    warnings = [
+        record for record in caplog.records if record.levelno == logging.WARNING
+    ]
+    assert warnings[0].fields["workers"] == 2
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__glob_with_copy(rotated_logs):
+
+    saved = parse_and_save_nginx_logs(str(rotated_logs / "access.log*"), mode=MODE_COPY)
+
+    assert saved is True
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__single_gzip_file(rotated_logs):
+
+    assert parse_and_save_nginx_logs(str(rotated_logs / "access.log.2.gz")) is True
+    assert LogLine.query.count() == 4
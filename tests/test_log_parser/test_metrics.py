@@ -0,0 +1,91 @@
+from http import HTTPStatus
+
+import pytest
+from prometheus_client import REGISTRY
+
+from nydata.log_parser import parse_and_save_nginx_logs
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.metrics import INGEST_STAGES
+from nydata.log_parser.tail import digest_new_lines
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def ingest_samples():
+    return {
+        "parsed": sample("nydata_log_lines_parsed_total", source=NGINX),
+        "failed": sample("nydata_log_lines_failed_total", source=NGINX),
+        **{
+            stage: sample("nydata_ingest_stage_seconds_count", stage=stage)
+            for stage in INGEST_STAGES
+        },
+    }
+
+
+@pytest.fixture
+def log_with_bad_line(tmp_path, access_log_str) -> str:
+    """The 12 lines of the sample access.log and a bad line"""
+    file_path = tmp_path / "access.log"
+    file_path.write_text(access_log_str.rstrip("\n") + "\nnot a log line\n")
+    return str(file_path)
+
+
+@pytest.mark.usefixtures("db")
+def test_ingestion_metrics__batches(log_with_bad_line):
+    before = ingest_samples()
+
+    assert parse_and_save_nginx_logs(log_with_bad_line, batch_size=5)
+
+    after = ingest_samples()
+    assert after["parsed"] - before["parsed"] == 12
+    assert after["failed"] - before["failed"] == 1
+
+    # one observation per stage and batch
+    for stage in INGEST_STAGES:
+        assert after[stage] - before[stage] == 3, stage
+
+
+@pytest.mark.usefixtures("db")
+def test_ingestion_metrics__incremental(log_with_bad_line):
+    before = ingest_samples()
+
+    assert digest_new_lines(NGINX, log_with_bad_line) == 12
+
+    after = ingest_samples()
+    assert after["parsed"] - before["parsed"] == 12
+    assert after["failed"] - before["failed"] == 1
+    assert after["commit"] - before["commit"] == 1
+
+
+@pytest.mark.usefixtures("db")
+def test_resolver_metrics(db_setup_test_nginx_12, graphql_client):
+    query = """
+        query getLogs($date_from: Date!, $date_to: Date!) {
+            logs(date_from: $date_from, date_to: $date_to) { hostIP }
+        }
+    """
+    count_before = sample("nydata_graphql_resolver_seconds_count", field="logs")
+    rows_before = sample("nydata_graphql_resolver_rows_sum", field="logs")
+
+    variables = {"date_from": "2016-12-07", "date_to": "2016-12-07"}
+    response = graphql_client.execute(query, variables=variables)
+    assert "errors" not in response, response["errors"]
+
+    assert sample("nydata_graphql_resolver_seconds_count", field="logs") == (
+        count_before + 1
+    )
+    assert sample("nydata_graphql_resolver_rows_sum", field="logs") == (
+        rows_before + 9
+    )
+
+
+def test_metrics_endpoint(testapp):
+
+    response = testapp.get("/metrics")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.content_type == "text/plain"
+    assert "nydata_log_lines_parsed_total" in response.text
+    assert "# TYPE nydata_ingest_stage_seconds histogram" in response.text
@@ -1,15 +1,23 @@
 from copy import deepcopy
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 
 import pytest
 
 from nydata.database import get_or_create
 from nydata.error import LogLineAlreadyInDb
-from nydata.log_parser.data import NGINX, LogEntry
+from nydata.log_parser.data import NGINX
 from nydata.log_parser.models import (
+    DailyLogCount,
+    HourlyLogCount,
     LogLine,
     LogSource,
     create_log_line,
+    hash_log_entry,
+    insert_log_lines,
+    log_line_values,
+    rehash_log_lines,
+    save_log_batches,
+    save_log_to_database,
     save_logs_to_database,
 )
 from nydata.log_parser.parser.parser import parse_logs, parse_nginx_logs
@@ -88,51 +96,38 @@ def test_save_logs_to_database_with_parse_logs__error_with_empty_source(access_l
     assert saved is False
 
 
-def create_entry(verb, now) -> LogEntry:
-    """Create a log entry"""
-    return LogEntry(
-        host_ip="127.0.0.1",
-        original_date_time=now,
-        timestamp=int(now.timestamp()),
-        request_verb=verb,
-        request_path="/favicon.ico",
-        response_code=200,
-        user_agent="Mozilla",
-    )
-
-
-def test_log_entry_is_hashable():
+def test_log_entry_is_hashable(create_entry):
 
     now = datetime.now()
-    entry = create_entry("GET", now)
+    entry = create_entry(now)
     assert hash(entry) == hash(entry)
 
 
-def test_log_entry_is_hashable__with_different_datetime_objects():
+def test_log_entry_is_hashable__with_different_datetime_objects(create_entry):
 
     now1 = datetime.now()
     now2 = deepcopy(now1)
-    entry1 = create_entry("GET", now1)
-    entry2 = create_entry("GET", now2)
+    entry1 = create_entry(now1)
+    entry2 = create_entry(now2)
     assert hash(entry1) == hash(entry2)
 
 
-def test_log_entries_create_different_hashes():
+def test_log_entries_create_different_hashes(create_entry):
     now = datetime.now()
 
-    entry1 = create_entry("GET", now)
-    entry2 = create_entry("POST", now)
+    entry1 = create_entry(now)
+    entry2 = create_entry(now, verb="POST")
     assert hash(entry1) != hash(entry2)
 
 
 @pytest.mark.usefixtures("db")
-def test_create_log_line(db):
+def test_create_log_line(db, create_entry):
 
     assert LogLine.query.count() == 0
     source_obj = get_or_create(db.session, LogSource, name=NGINX)
 
     now = datetime.now()
-    entry1 = create_entry("GET", now)
+    entry1 = create_entry(now)
 
     create_log_line(source_obj.id, entry1)
 
@@ -140,13 +135,13 @@ def test_create_log_line(db):
 
 
 @pytest.mark.usefixtures("db")
-def test_create_log_line__already_in_db_error(db):
+def test_create_log_line__already_in_db_error(db, create_entry):
 
     assert LogLine.query.count() == 0
     source_obj = get_or_create(db.session, LogSource, name=NGINX)
 
     now = datetime.now()
-    entry1 = create_entry("GET", now)
+    entry1 = create_entry(now)
 
     create_log_line(source_obj.id, entry1)
     assert LogLine.query.count() == 1
@@ -158,21 +153,148 @@ def test_create_log_line__already_in_db_error(db):
 
 
 @pytest.mark.usefixtures("db")
-def test_create_log_line__already_in_db_error_other_object(db):
+def test_create_log_line__already_in_db_error_other_object(db, create_entry):
 
     assert LogLine.query.count() == 0
     source_obj = get_or_create(db.session, LogSource, name=NGINX)
 
     now = datetime.now()
-    entry1 = create_entry("GET", now)
+    entry1 = create_entry(now)
 
     create_log_line(source_obj.id, entry1)
     assert LogLine.query.count() == 1
 
     # same data but different object
-    entry2 = create_entry("GET", now)
+    entry2 = create_entry(now)
 
     with pytest.raises(LogLineAlreadyInDb):
         create_log_line(source_obj.id, entry2)
 
     assert LogLine.query.count() == 1
+
+
+def test_hash_log_entry_is_stable_across_processes(create_entry):
+    """The digest must not depend on the salted builtin hash()"""
+    entry = create_entry(datetime.fromtimestamp(1481103283))
+
+    expected = "0b70a43fb98c5c6b47041af1ce33ed698557e98bd74b3e91a5b59e50b1133161"
+    assert hash_log_entry(entry) == expected
+
+
+def test_log_line_values__date_is_utc_date_of_timestamp(create_entry):
+    local = timezone(timedelta(hours=1))
+    entry = create_entry(datetime(2016, 12, 7, 0, 30, tzinfo=local))
+
+    values = log_line_values(1, entry)
+    assert values["date"] == date(2016, 12, 6)
+
+
+def test_hash_log_entry__different_entries(create_entry):
+    now = datetime.now()
+
+    entry1 = create_entry(now)
+    entry2 = create_entry(now, verb="POST")
+    assert hash_log_entry(entry1) != hash_log_entry(entry2)
+
+
+@pytest.mark.usefixtures("db")
+def test_insert_log_lines__skips_lines_already_in_db(db, create_entry):
+
+    source_obj = get_or_create(db.session, LogSource, name=NGINX)
+
+    now = datetime.now()
+    entries = [create_entry(now), create_entry(now, verb="POST")]
+
+    assert insert_log_lines(source_obj.id, entries) == 2
+    db.session.commit()
+
+    # one new line and one duplicate within the same batch
+    entries = [
+        create_entry(now),
+        create_entry(now, verb="PUT"),
+        create_entry(now, verb="PUT"),
+    ]
+
+    assert insert_log_lines(source_obj.id, entries) == 1
+    db.session.commit()
+
+    assert LogLine.query.count() == 3
+
+
+@pytest.mark.usefixtures("db")
+def test_insert_log_lines__updates_rollups(db, create_entry):
+
+    source_obj = get_or_create(db.session, LogSource, name=NGINX)
+
+    now = datetime(2016, 12, 7, 10, 34, 43)
+    entries = [create_entry(now), create_entry(now, verb="POST")]
+    insert_log_lines(source_obj.id, entries)
+
+    # the duplicate GET must not be counted twice
+    later = datetime(2016, 12, 7, 11, 2, 0)
+    entries = [create_entry(now), create_entry(later)]
+    insert_log_lines(source_obj.id, entries)
+    db.session.commit()
+
+    daily = {row.verb: row.num_lines for row in DailyLogCount.query.all()}
+    assert daily == {"GET": 2, "POST": 1}
+
+    hourly = HourlyLogCount.query.filter_by(verb="GET").order_by("hour").all()
+    assert [row.num_lines for row in hourly] == [1, 1]
+    assert hourly[0].hour == LogLine.query.first().hour
+    assert hourly[1].hour - hourly[0].hour == 3600
+    assert all(row.date == now.date() and row.code == 200 for row in hourly)
+
+
+@pytest.mark.usefixtures("db")
+def test_create_log_line__updates_rollups(db, create_entry):
+
+    source_obj = get_or_create(db.session, LogSource, name=NGINX)
+    create_log_line(source_obj.id, create_entry(datetime.now()))
+
+    daily = DailyLogCount.query.one()
+    assert (daily.verb, daily.num_lines) == ("GET", 1)
+    assert HourlyLogCount.query.one().num_lines == 1
+
+
+@pytest.mark.usefixtures("db")
+def test_save_log_to_database__already_in_db(db, create_entry):
+
+    entry = create_entry(datetime.now())
+
+    assert save_log_to_database(NGINX, entry) is True
+    assert save_log_to_database(NGINX, entry) is False
+
+    assert LogLine.query.count() == 1
+
+
+@pytest.mark.usefixtures("db")
+def test_rehash_log_lines(db, create_entry):
+
+    source_obj = get_or_create(db.session, LogSource, name=NGINX)
+    now = datetime.now()
+    entries = [create_entry(now, verb=verb) for verb in ("GET", "POST", "PUT")]
+
+    for legacy_hash, entry in enumerate(entries):
+        line = create_log_line(source_obj.id, entry)
+        line.update(hash_code=str(legacy_hash))
+
+    assert rehash_log_lines(chunk_size=2) == 3
+
+    hash_codes = sorted(line.hash_code for line in LogLine.query)
+    assert hash_codes == sorted(hash_log_entry(entry) for entry in entries)
+
+    # nothing left to do
+    assert rehash_log_lines(chunk_size=2) == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_save_log_batches(access_log_str):
+
+    lines = parse_nginx_logs(access_log_str) + [None]
+
+    assert save_log_batches(NGINX, iter(lines), batch_size=5) == 12
+    assert save_log_batches(NGINX, iter(lines), batch_size=5) == 0
+
+    assert LogSource.query.count() == 1
+    assert LogLine.query.count() == 12
@@ -0,0 +1,79 @@
+import pytest
+
+from nydata.log_parser import parse_and_save_nginx_logs
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.log import MODE_COPY
+from nydata.log_parser.models import LogLine
+from nydata.log_parser.parallel import (
+    parse_file_in_parallel,
+    parse_file_range,
+    split_file,
+)
+from nydata.log_parser.parser import parse_nginx_logs
+
+
+def test_split_file__ranges_end_at_line_breaks(test_access_log_path):
+
+    with open(test_access_log_path, "rb") as file_conn:
+        content = file_conn.read()
+
+    ranges = split_file(test_access_log_path, chunk_size=500)
+
+    assert len(ranges) > 1
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(content)
+
+    for (_, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+        assert content[end - 1 : end] == b"\n"
+
+
+def test_parse_file_range(test_access_log_path):
+
+    records, rejected = parse_file_range(NGINX, test_access_log_path, 0, 1)
+
+    assert rejected == []
+    assert len(records) == 1
+    assert records[0][0] == "77.179.66.156"
+
+
+def test_parse_file_range__counts_failed_lines(test_bad_log_path):
+
+    records, rejected = parse_file_range(NGINX, test_bad_log_path, 0, 10_000)
+
+    assert records == []
+    assert len(rejected) == 6
+    assert rejected[0][0] == 0
+
+
+def test_parse_file_in_parallel__keeps_file_order(test_access_log_path, access_log_str):
+
+    stats = {}
+    entries = list(
+        parse_file_in_parallel(
+            NGINX, test_access_log_path, workers=2, chunk_size_in_mb=0.0005, stats=stats
+        )
+    )
+
+    assert entries == parse_nginx_logs(access_log_str)
+    assert stats["failed"] == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__parallel(test_access_log_path):
+
+    saved = parse_and_save_nginx_logs(test_access_log_path, workers=2, chunk_mb=0.0005)
+    assert saved is True
+
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__parallel_copy(test_access_log_path):
+
+    saved = parse_and_save_nginx_logs(
+        test_access_log_path, mode=MODE_COPY, workers=2, chunk_mb=0.0005
+    )
+    assert saved is True
+
+    assert LogLine.query.count() == 12
@@ -0,0 +1,147 @@
+from datetime import date, datetime
+
+import pytest
+
+from nydata.error import DbError
+from nydata.log_parser.data import NGINX, LogEntry
+from nydata.log_parser.models import LogLine, save_log_batches
+from nydata.log_parser.parser.parser import parse_nginx_logs
+from nydata.log_parser.partitions import (
+    add_months,
+    create_log_partition,
+    drop_log_partitions,
+    is_partitioned,
+    list_log_partitions,
+    month_bounds,
+    partition_log_lines,
+    partition_name,
+)
+from nydata.log_parser.schema import log_line_date_filter
+
+
+@pytest.fixture
+def postgres(db):
+    if db.session.get_bind().dialect.name != "postgresql":
+        pytest.skip("Partitioning needs PostgreSQL")
+
+    return db
+
+
+def test_add_months():
+
+    assert add_months(date(2016, 12, 1), 1) == date(2017, 1, 1)
+    assert add_months(date(2016, 1, 1), -1) == date(2015, 12, 1)
+    assert add_months(date(2016, 2, 1), 13) == date(2017, 3, 1)
+
+
+def test_month_bounds():
+
+    assert month_bounds(date(2016, 12, 7)) == (1480550400, 1483228800)
+    assert partition_name(date(2016, 12, 7)) == "log_lines_y2016m12"
+
+
+@pytest.mark.usefixtures("db")
+def test_partition_log_lines__not_supported_by_sqlite(db):
+    if db.session.get_bind().dialect.name != "sqlite":
+        pytest.skip("Only sqlite has no partitioning")
+
+    assert is_partitioned() is False
+    with pytest.raises(DbError):
+        partition_log_lines()
+
+
+def test_partition_log_lines(postgres, access_log_str):
+
+    save_log_batches(NGINX, parse_nginx_logs(access_log_str))
+
+    assert partition_log_lines(months_ahead=1) >= 2
+    postgres.session.commit()
+
+    assert is_partitioned()
+    months = list_log_partitions()
+    assert date(2016, 12, 1) in months
+    assert LogLine.query.count() == 12
+
+    # duplicates are still skipped by the unique (hash_code, timestamp)
+    assert save_log_batches(NGINX, parse_nginx_logs(access_log_str)) == 0
+
+    # running it again only creates missing partitions
+    assert partition_log_lines(months_ahead=1) == 0
+    assert list_log_partitions() == months
+
+
+def test_partition_log_lines__date_range_is_pruned(postgres, access_log_str):
+
+    save_log_batches(NGINX, parse_nginx_logs(access_log_str))
+    partition_log_lines(months_ahead=0)
+    postgres.session.commit()
+
+    query = LogLine.query.filter(
+        *log_line_date_filter(date(2016, 12, 7), date(2016, 12, 7))
+    ).with_entities(LogLine.id)
+    statement = query.statement.compile(dialect=postgres.session.get_bind().dialect)
+
+    cursor = postgres.session.connection().connection.cursor()
+    cursor.execute(f"EXPLAIN {statement}", statement.params)
+    plan = "\n".join(row[0] for row in cursor.fetchall())
+
+    assert "log_lines_y2016m12" in plan
+    assert "log_lines_y2016m10" not in plan
+    assert query.count() == 9
+
+
+def count_logs(graphql_client, group_by: str, date_from: str, date_to: str):
+    query = f"""{{ log_counts (group_by: [{group_by}], date_from: "{date_from}",
+                              date_to: "{date_to}") {{ count }} }}"""
+    response = graphql_client.execute(query)
+    assert "errors" not in response, response["errors"]
+    return response["data"]["log_counts"]
+
+
+def test_drop_log_partitions(postgres, access_log_str, graphql_client):
+
+    save_log_batches(NGINX, parse_nginx_logs(access_log_str))
+    partition_log_lines(months_ahead=0)
+    postgres.session.commit()
+
+    start_of_december, _ = month_bounds(date(2016, 12, 1))
+    num_december = LogLine.query.filter(LogLine.timestamp >= start_of_december).count()
+
+    dropped = drop_log_partitions(date(2016, 12, 24))
+    postgres.session.commit()
+
+    assert "log_lines_y2016m10" in dropped
+    assert "log_lines_y2016m12" not in dropped
+    assert LogLine.query.count() == num_december
+
+    # the rollups of the dropped months are deleted as well
+    for group_by in ("DAY", "CODE", "VERB", "HOUR"):
+        assert count_logs(graphql_client, group_by, "2016-10-01", "2016-10-31") == []
+
+    counts = count_logs(graphql_client, "DAY", "2016-12-01", "2016-12-31")
+    assert sum(group["count"] for group in counts) == num_december
+
+
+def test_create_log_partition__moves_lines_from_default_partition(postgres):
+
+    partition_log_lines(months_ahead=0)
+    postgres.session.commit()
+
+    now = datetime(2030, 1, 2, 3, 4, 5)
+    entry = LogEntry("127.0.0.1", now, int(now.timestamp()), "GET", "/", 200, "curl")
+    assert save_log_batches(NGINX, [entry]) == 1
+
+    assert create_log_partition(date(2030, 1, 1)) is True
+    assert create_log_partition(date(2030, 1, 1)) is False
+    postgres.session.commit()
+
+    partition = "SELECT count(*) FROM log_lines_y2030m01"
+    assert postgres.session.execute(partition).scalar() == 1
+    assert LogLine.query.one().path == "/"
+
+
+@pytest.mark.usefixtures("db")
+def test_drop_log_partitions__error_if_not_partitioned():
+
+    with pytest.raises(DbError):
+        drop_log_partitions(date(2016, 12, 1))
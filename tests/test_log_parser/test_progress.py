@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+from nydata.log_parser import digest_log_by_line
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.models import LogLine
+from nydata.log_parser.progress import IngestProgress
+
+
+@pytest.fixture
+def ingest_log(caplog):
+    caplog.set_level(logging.DEBUG, logger="nydata.ingest")
+    return caplog
+
+
+def test_ingest_progress__samples_failed_lines(ingest_log):
+    progress = IngestProgress("access.log", interval=3600, error_samples=2)
+
+    for number in range(5):
+        progress.add()
+        progress.failed(f"bad line {number}")
+    progress.finish()
+
+    warnings = [record.getMessage() for record in ingest_log.records]
+    assert len(warnings) == 3
+    assert "bad line 1" in warnings[1]
+    assert "bad line 2" not in " ".join(warnings)
+
+    summary = ingest_log.records[-1]
+    assert summary.levelno == logging.WARNING
+    assert summary.fields["lines"] == 5
+    assert summary.fields["failed"] == 5
+    assert summary.fields["unlogged_failures"] == 3
+
+
+def test_ingest_progress__reports_every_interval(ingest_log):
+    progress = IngestProgress("access.log", interval=0)
+
+    progress.add(100)
+    progress.add(50)
+
+    assert [record.fields["lines"] for record in ingest_log.records] == [100, 150]
+    assert all(record.levelno == logging.INFO for record in ingest_log.records)
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_log_by_line__logs_a_sample_of_the_failed_lines(
+    tmp_path, access_log_str, ingest_log, capsys
+):
+    file_path = tmp_path / "access.log"
+    file_path.write_text(access_log_str.rstrip("\n") + "\n" + "not a log line\n" * 20)
+
+    assert digest_log_by_line(NGINX, str(file_path)) is False
+    assert LogLine.query.count() == 12
+
+    # 5 sampled lines and the summary
+    assert len(ingest_log.records) == 6
+    assert ingest_log.records[-1].fields["failed"] == 20
+
+    captured = capsys.readouterr()
+    assert "not a log line" not in captured.out + captured.err
+
+
+def test_ingest_logger__writes_through_the_app_logger(app):
+    ingest_logger = logging.getLogger("nydata.ingest")
+
+    # a handler of its own would write every message twice
+    assert not ingest_logger.handlers
+    assert ingest_logger.propagate
+    assert app.logger.handlers
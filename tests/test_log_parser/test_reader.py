@@ -0,0 +1,75 @@
+import tracemalloc
+from collections import deque
+
+import pytest
+
+from nydata.error import LogRegexPatternNotFound
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.parser import parse_nginx_logs
+from nydata.log_parser.parser.pattern import get_nginx_log_bytes_regex
+from nydata.log_parser.reader import match_mapped_file, parse_mapped_file
+
+
+def test_parse_mapped_file(test_access_log_path, access_log_str):
+
+    entries = list(parse_mapped_file(NGINX, test_access_log_path))
+
+    assert entries == parse_nginx_logs(access_log_str)
+
+
+def test_parse_mapped_file__counts_failed_lines(test_bad_log_path):
+
+    stats = {}
+    entries = list(parse_mapped_file(NGINX, test_bad_log_path, stats))
+
+    assert entries == []
+    assert stats["failed"] == 6
+
+
+def test_parse_mapped_file__empty_file(tmp_path):
+
+    empty_log = tmp_path / "empty.log"
+    empty_log.write_bytes(b"")
+
+    assert list(parse_mapped_file(NGINX, str(empty_log))) == []
+
+
+def test_parse_mapped_file__pattern_not_found(test_access_log_path):
+
+    with pytest.raises(LogRegexPatternNotFound):
+        list(parse_mapped_file("apache", test_access_log_path))
+
+
+def test_match_mapped_file__windows_line_breaks(tmp_path, log_line):
+
+    log_file = tmp_path / "access.log"
+    log_file.write_bytes(f"{log_line}\r\nnot a log line\r\n{log_line}".encode())
+
+    matches = [
+        (offset, matched and matched.group("ip"))
+        for offset, matched in match_mapped_file(
+            get_nginx_log_bytes_regex(), str(log_file)
+        )
+    ]
+
+    assert matches == [
+        (0, b"77.179.66.156"),
+        (len(log_line) + 2, None),
+        (len(log_line) + 18, b"77.179.66.156"),
+    ]
+
+
+def test_parse_mapped_file__memory_does_not_grow_with_file_size(tmp_path, log_line):
+
+    log_file = tmp_path / "access.log"
+    with open(log_file, "w") as file_conn:
+        for _ in range(50_000):
+            file_conn.write(log_line + "\n")
+
+    tracemalloc.start()
+    deque(parse_mapped_file(NGINX, str(log_file)), maxlen=0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the file has about 12 MB
+    assert peak < 2_000_000
@@ -0,0 +1,154 @@
+import re
+
+import pytest
+
+from nydata.log_parser import digest_log_by_line, parse_and_save_nginx_logs
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.log import MODE_COPY
+from nydata.log_parser.models import LogLine, RejectedLogLine
+from nydata.log_parser.rejects import (
+    REASON_NO_MATCH,
+    RejectSink,
+    parse_log_line_or_reason,
+    replay_rejected_lines,
+)
+from nydata.log_parser.tail import digest_new_lines
+
+
+@pytest.fixture
+def log_with_bad_lines(tmp_path, access_log_str) -> str:
+    """A bad line before and after the 12 lines of the sample access.log"""
+    file_path = tmp_path / "access.log"
+    file_path.write_text(
+        "bad first line\n" + access_log_str.rstrip("\n") + "\nbad last line\n"
+    )
+    return str(file_path)
+
+
+@pytest.fixture
+def log_with_bad_timestamp(tmp_path, access_log_str) -> str:
+    """The sample access.log with a corrupt $time_local in its 3rd line"""
+    lines = access_log_str.splitlines()
+    lines[2] = re.sub(r"\[\d+/\w+/", "[99/Foo/", lines[2])
+
+    file_path = tmp_path / "access.log"
+    file_path.write_text("\n".join(lines) + "\n")
+    return str(file_path)
+
+
+def rejected_lines():
+    return [
+        (reject.line, reject.byte_offset, reject.path, reject.reason)
+        for reject in RejectedLogLine.query.order_by(RejectedLogLine.byte_offset)
+    ]
+
+
+def expected_rejects(file_path: str):
+    with open(file_path, "rb") as file_conn:
+        content = file_conn.read()
+
+    last_offset = content.rindex(b"bad last line")
+    return [
+        ("bad first line", 0, file_path, REASON_NO_MATCH),
+        ("bad last line", last_offset, file_path, REASON_NO_MATCH),
+    ]
+
+
+@pytest.mark.usefixtures("db")
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"mode": MODE_COPY}, {"workers": 2, "chunk_mb": 0.001}],
+    ids=["batch", "copy", "parallel"],
+)
+def test_ingestion__quarantines_rejected_lines(log_with_bad_lines, options):
+
+    assert parse_and_save_nginx_logs(log_with_bad_lines, **options)
+
+    assert LogLine.query.count() == 12
+    assert rejected_lines() == expected_rejects(log_with_bad_lines)
+
+    # the same rejects are only stored once
+    parse_and_save_nginx_logs(log_with_bad_lines, **options)
+    assert RejectedLogLine.query.count() == 2
+
+
+@pytest.mark.usefixtures("db")
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"mode": MODE_COPY},
+        {"workers": 2, "chunk_mb": 0.001},
+        {"incremental": True},
+    ],
+    ids=["batch", "copy", "parallel", "incremental"],
+)
+def test_ingestion__quarantines_lines_which_fail_to_transform(
+    log_with_bad_timestamp, options
+):
+
+    assert parse_and_save_nginx_logs(log_with_bad_timestamp, **options)
+
+    assert LogLine.query.count() == 11
+    reject = RejectedLogLine.query.one()
+    assert "99/Foo/2016" in reject.line
+    assert reject.reason != REASON_NO_MATCH
+
+
+def test_parse_log_line_or_reason(log_line):
+
+    assert parse_log_line_or_reason(NGINX, "bad line") == (None, REASON_NO_MATCH)
+
+    log_entry, reason = parse_log_line_or_reason(NGINX, log_line)
+    assert log_entry is not None and reason is None
+
+    bad_time = log_line.replace("07/Dec/2016", "99/Foo/2016")
+    log_entry, reason = parse_log_line_or_reason(NGINX, bad_time)
+    assert log_entry is None and reason != REASON_NO_MATCH
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_log_by_line__quarantines_rejected_lines(log_with_bad_lines):
+
+    assert digest_log_by_line(NGINX, log_with_bad_lines) is False
+
+    assert LogLine.query.count() == 12
+    assert rejected_lines() == expected_rejects(log_with_bad_lines)
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__quarantines_rejected_lines(log_with_bad_lines):
+
+    assert digest_new_lines(NGINX, log_with_bad_lines) == 12
+
+    assert rejected_lines() == expected_rejects(log_with_bad_lines)
+
+
+@pytest.mark.usefixtures("db")
+def test_reject_sink__writes_in_batches(log_line):
+    rejects = RejectSink(NGINX, "access.log", batch_size=2)
+
+    rejects.add("bad line", 0)
+    assert RejectedLogLine.query.count() == 0
+
+    rejects.add(log_line.encode(), 9)
+    assert RejectedLogLine.query.count() == 2
+
+    rejects.add("another bad line", 200)
+    assert rejects.commit() == 3
+    assert RejectedLogLine.query.count() == 3
+
+
+@pytest.mark.usefixtures("db")
+def test_replay_rejected_lines(log_line):
+    rejects = RejectSink(NGINX, "access.log")
+    rejects.add("still a bad line", 0)
+    # e.g. rejected by an old pattern
+    rejects.add(log_line, 17)
+    rejects.commit()
+
+    assert replay_rejected_lines(NGINX, batch_size=1) == (1, 1)
+
+    assert LogLine.query.count() == 1
+    assert [reject.line for reject in RejectedLogLine.query] == ["still a bad line"]
+    assert replay_rejected_lines(NGINX) == (0, 0)
@@ -98,3 +98,299 @@ def test_query__dates_can_be_same_day(db_setup_test_nginx_12, graphql_client):
 
     agent = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_0) AppleWebKit/537.36"
     assert one_log["userAgent"].startswith(agent)
+
+
+datetime_query = """query logs($datetimeFrom: DateTime!, $datetimeTo: DateTime!) {
+                                logs (datetime_from: $datetimeFrom, datetime_to: $datetimeTo) {
+                                    timestamp
+                                }
+                            }"""
+
+
+@pytest.mark.usefixtures("db")
+def test_query__datetimes_select_minutes(db_setup_test_nginx_12, graphql_client):
+
+    variables = {
+        "datetimeFrom": "2016-12-07T10:43:00+01:00",
+        "datetimeTo": "2016-12-07T10:43:23+01:00",
+    }
+    response = graphql_client.execute(datetime_query, variables=variables)
+
+    assert "errors" not in response, response["errors"]
+
+    timestamps = sorted(log["timestamp"] for log in response["data"]["logs"])
+    assert timestamps == [1481103798, 1481103801, 1481103803]
+
+
+@pytest.mark.usefixtures("db")
+def test_query__naive_datetimes_are_utc(db_setup_test_nginx_12, graphql_client):
+
+    variables = {
+        "datetimeFrom": "2016-12-07T09:43:00",
+        "datetimeTo": "2016-12-07T09:44:00",
+    }
+    response = graphql_client.execute(datetime_query, variables=variables)
+
+    assert "errors" not in response, response["errors"]
+    assert len(response["data"]["logs"]) == 3
+
+
+def test_query_not_allowed__datetime_from_bigger_than_to(graphql_client):
+
+    variables = {
+        "datetimeFrom": "2016-12-07T10:00:00",
+        "datetimeTo": "2016-12-07T09:00:00",
+    }
+    response = graphql_client.execute(datetime_query, variables=variables)
+
+    error = response["errors"][0]
+    error_msg = (
+        "[!] Invalid query `datetime_from` always has to be smaller than `datetime_to`!"
+    )
+    assert error["message"] == error_msg
+
+
+def test_query_not_allowed__dates_or_datetimes_required(graphql_client):
+
+    response = graphql_client.execute("{ logs (date_from: \"2016-12-07\") { hostIP } }")
+
+    error = response["errors"][0]
+    assert error["message"].startswith("[!] Invalid query either `date_from`")
+
+
+connection_query = """query logsConnection($dateFrom: Date!, $dateTo: Date!, $first: Int, $after: String) {
+                                logs_connection (date_from: $dateFrom, date_to: $dateTo, first: $first, after: $after) {
+                                    pageInfo {
+                                        hasNextPage
+                                        hasPreviousPage
+                                        startCursor
+                                        endCursor
+                                    }
+                                    edges {
+                                        cursor
+                                        node {
+                                            timestamp
+                                        }
+                                    }
+                                }
+                            }"""
+
+
+@pytest.mark.usefixtures("db")
+def test_logs_connection__pages_through_all_lines(
+    db_setup_test_nginx_12, graphql_client
+):
+
+    variables = {"dateFrom": "2000-11-11", "dateTo": "2019-12-12", "first": 5}
+    timestamps, pages, after = [], 0, None
+
+    while True:
+        response = graphql_client.execute(
+            connection_query, variables={**variables, "after": after}
+        )
+        assert "errors" not in response, response["errors"]
+
+        connection = response["data"]["logs_connection"]
+        page_info = connection["pageInfo"]
+        assert page_info["hasPreviousPage"] is (after is not None)
+        assert page_info["endCursor"] == connection["edges"][-1]["cursor"]
+
+        timestamps += [edge["node"]["timestamp"] for edge in connection["edges"]]
+        pages += 1
+        after = page_info["endCursor"]
+
+        if not page_info["hasNextPage"]:
+            break
+
+    assert pages == 3
+    assert len(timestamps) == 12
+    assert timestamps == sorted(timestamps)
+
+
+@pytest.mark.usefixtures("db")
+def test_logs_connection__max_page_size(db_setup_test_nginx_12, graphql_client):
+    from nydata.log_parser.schema import MAX_PAGE_SIZE
+
+    variables = {"dateFrom": "2000-11-11", "dateTo": "2019-12-12"}
+    response = graphql_client.execute(
+        connection_query, variables={**variables, "first": MAX_PAGE_SIZE + 1}
+    )
+
+    assert "errors" in response
+    assert response["errors"][0]["message"].startswith("[!] `first` has to be")
+
+    response = graphql_client.execute(connection_query, variables=variables)
+    assert "errors" not in response, response["errors"]
+    assert len(response["data"]["logs_connection"]["edges"]) == 12
+
+
+def test_logs_connection__invalid_cursor(graphql_client):
+
+    variables = {"dateFrom": "2000-11-11", "dateTo": "2019-12-12", "after": "nope"}
+    response = graphql_client.execute(connection_query, variables=variables)
+
+    assert "errors" in response
+    assert response["errors"][0]["message"] == "[!] Invalid cursor `nope`!"
+
+
+counts_query = """query log_counts($groupBy: [LogGroupBy!]!, $dateFrom: Date!, $dateTo: Date!, $limit: Int) {
+                                log_counts (group_by: $groupBy, date_from: $dateFrom, date_to: $dateTo, limit: $limit) {
+                                    code
+                                    verb
+                                    day
+                                    hour
+                                    hostIP
+                                    count
+                                }
+                            }"""
+
+
+@pytest.mark.usefixtures("db")
+def test_log_counts__group_by_day(db_setup_test_nginx_12, graphql_client):
+
+    variables = {"groupBy": ["DAY"], "dateFrom": "2000-11-11", "dateTo": "2019-12-12"}
+    response = graphql_client.execute(counts_query, variables=variables)
+
+    assert "errors" not in response, response["errors"]
+
+    counts = response["data"]["log_counts"]
+    assert sum(group["count"] for group in counts) == 12
+    assert counts[0] == {
+        "code": None,
+        "verb": None,
+        "day": "2016-12-07",
+        "hour": None,
+        "hostIP": None,
+        "count": 9,
+    }
+
+
+@pytest.mark.usefixtures("db")
+def test_log_counts__group_by_several_columns(db_setup_test_nginx_12, graphql_client):
+
+    variables = {
+        "groupBy": ["HOST_IP", "CODE", "HOST_IP"],
+        "dateFrom": "2000-11-11",
+        "dateTo": "2019-12-12",
+        "limit": 2,
+    }
+    response = graphql_client.execute(counts_query, variables=variables)
+
+    assert "errors" not in response, response["errors"]
+
+    counts = response["data"]["log_counts"]
+    assert len(counts) == 2
+    assert counts[0] == {
+        "code": 404,
+        "verb": None,
+        "day": None,
+        "hour": None,
+        "hostIP": "77.179.66.156",
+        "count": 6,
+    }
+    assert counts[1]["count"] <= 6
+
+
+def test_log_counts__limit_is_enforced(graphql_client):
+    from nydata.log_parser.schema import MAX_GROUP_COUNT
+
+    variables = {
+        "groupBy": ["CODE"],
+        "dateFrom": "2000-11-11",
+        "dateTo": "2019-12-12",
+        "limit": MAX_GROUP_COUNT + 1,
+    }
+    response = graphql_client.execute(counts_query, variables=variables)
+
+    assert "errors" in response
+    assert response["errors"][0]["message"].startswith("[!] `limit` has to be")
+
+
+@pytest.mark.usefixtures("db")
+@pytest.mark.parametrize("group_by", [["CODE", "VERB"], ["HOUR", "CODE"]])
+def test_log_counts__rollups_match_log_lines(
+    db_setup_test_nginx_12, graphql_client, group_by
+):
+
+    variables = {"dateFrom": "2000-11-11", "dateTo": "2019-12-12"}
+    response = graphql_client.execute(
+        counts_query, variables={**variables, "groupBy": group_by}
+    )
+    assert "errors" not in response, response["errors"]
+    counts = response["data"]["log_counts"]
+
+    # grouping by PATH as well has to scan the log lines
+    response = graphql_client.execute(
+        counts_query, variables={**variables, "groupBy": group_by + ["PATH"]}
+    )
+    assert "errors" not in response, response["errors"]
+
+    expected = {}
+    for group in response["data"]["log_counts"]:
+        key = (group["code"], group["verb"], group["hour"])
+        expected[key] = expected.get(key, 0) + group["count"]
+
+    assert {(g["code"], g["verb"], g["hour"]): g["count"] for g in counts} == expected
+    assert sum(expected.values()) == 12
+
+
+def test_get_count_model():
+    from nydata.log_parser.models import DailyLogCount, HourlyLogCount, LogLine
+    from nydata.log_parser.schema import get_count_model
+
+    assert get_count_model(["code", "date"]) is DailyLogCount
+    assert get_count_model(["verb", "hour"]) is HourlyLogCount
+    assert get_count_model(["code", "path"]) is LogLine
+
+
+@pytest.mark.usefixtures("db")
+def test_logs__only_selected_columns_are_loaded(
+    db_setup_test_nginx_12, graphql_client, sql_statements
+):
+
+    query = """{ logs (date_from: "2016-12-07", date_to: "2016-12-07") {
+                    hostIP
+                    timestamp
+                } }"""
+    response = graphql_client.execute(query)
+
+    assert "errors" not in response, response["errors"]
+    assert len(response["data"]["logs"]) == 9
+
+    select = [sql for sql in sql_statements if "FROM log_lines" in sql][-1]
+    assert "user_agents" not in select
+    assert "request_paths" not in select
+    assert "hash_code" not in select
+
+
+@pytest.mark.usefixtures("db")
+def test_logs__fragments_select_dimension_values(
+    db_setup_test_nginx_12, graphql_client
+):
+
+    query = """{ logs (date_from: "2016-12-07", date_to: "2016-12-07") {
+                    ...request
+                    ... on Log { hour }
+                } }
+                fragment request on Log { path userAgent }"""
+    response = graphql_client.execute(query)
+
+    assert "errors" not in response, response["errors"]
+    log = response["data"]["logs"][0]
+
+    assert log["path"] == "/"
+    assert log["userAgent"].startswith("Mozilla/5.0")
+    assert log["hour"] == 1481101200
+
+
+def test_log_line_projection():
+    from nydata.log_parser.schema import log_line_projection
+
+    projection = log_line_projection(["hostIP", "__typename"])
+    assert projection == ("hostIP", "id", "timestamp")
+    assert log_line_projection(["hour", "logSourceId"]) == (
+        "id",
+        "log_source_id",
+        "timestamp",
+    )
+    assert log_line_projection(["userAgent"]) == ("id", "timestamp", "userAgent")
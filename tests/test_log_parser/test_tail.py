@@ -0,0 +1,138 @@
+import os
+from threading import Event
+
+import pytest
+
+from nydata.log_parser import parse_and_save_nginx_logs
+from nydata.log_parser.data import NGINX
+from nydata.log_parser.models import IngestCheckpoint, LogLine
+from nydata.log_parser.tail import digest_new_lines, read_complete_lines
+
+
+@pytest.fixture
+def access_log_lines(access_log_str):
+    """The lines of the sample access.log each with a line break"""
+    return [line + "\n" for line in access_log_str.splitlines()]
+
+
+@pytest.fixture
+def live_log(tmp_path):
+    """A log file which is still written to"""
+    return tmp_path / "access.log"
+
+
+def append(file_path, lines):
+    with open(file_path, "a") as file_conn:
+        file_conn.writelines(lines)
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__only_reads_appended_lines(live_log, access_log_lines):
+
+    append(live_log, access_log_lines[:5])
+    assert digest_new_lines(NGINX, str(live_log)) == 5
+
+    append(live_log, access_log_lines[5:])
+    assert digest_new_lines(NGINX, str(live_log)) == 7
+
+    assert digest_new_lines(NGINX, str(live_log)) == 0
+    assert LogLine.query.count() == 12
+
+    checkpoint = IngestCheckpoint.query.one()
+    assert checkpoint.path == str(live_log)
+    assert checkpoint.byte_offset == os.path.getsize(live_log)
+    assert checkpoint.inode == os.stat(live_log).st_ino
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__stops_after_the_current_batch(live_log, access_log_lines):
+    append(live_log, access_log_lines)
+
+    stop = Event()
+    stop.set()
+    assert digest_new_lines(NGINX, str(live_log), batch_size=5, stop=stop) == 5
+
+    assert digest_new_lines(NGINX, str(live_log), batch_size=5) == 7
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__skips_partially_written_line(live_log, access_log_lines):
+
+    append(live_log, access_log_lines[:2])
+    append(live_log, [access_log_lines[2][:20]])
+
+    assert digest_new_lines(NGINX, str(live_log)) == 2
+
+    append(live_log, [access_log_lines[2][20:]])
+    assert digest_new_lines(NGINX, str(live_log)) == 1
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__finishes_renamed_file(live_log, access_log_lines):
+
+    append(live_log, access_log_lines[:4])
+    digest_new_lines(NGINX, str(live_log))
+
+    # lines written after the last run but before logrotate
+    append(live_log, access_log_lines[4:5])
+    append(live_log, [access_log_lines[5].rstrip("\n")])
+    os.rename(live_log, f"{live_log}.1")
+    append(live_log, access_log_lines[6:])
+
+    assert digest_new_lines(NGINX, str(live_log)) == 8
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__finishes_copied_and_truncated_file(
+    live_log, access_log_lines
+):
+
+    append(live_log, access_log_lines[:4])
+    digest_new_lines(NGINX, str(live_log))
+
+    # logrotate with copytruncate keeps the inode
+    append(live_log, access_log_lines[4:6])
+    with open(live_log) as source, open(f"{live_log}.1", "w") as copy:
+        copy.write(source.read())
+    open(live_log, "w").close()
+    append(live_log, access_log_lines[6:])
+
+    assert digest_new_lines(NGINX, str(live_log)) == 8
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_digest_new_lines__truncated_without_rotated_file(live_log, access_log_lines):
+
+    append(live_log, access_log_lines[:6])
+    digest_new_lines(NGINX, str(live_log))
+
+    open(live_log, "w").close()
+    append(live_log, access_log_lines[6:])
+
+    assert digest_new_lines(NGINX, str(live_log)) == 6
+    assert LogLine.query.count() == 12
+
+
+def test_read_complete_lines(live_log, access_log_lines):
+
+    append(live_log, access_log_lines[:2])
+    first_line_length = len(access_log_lines[0].encode())
+
+    lines = list(read_complete_lines(str(live_log), first_line_length))
+
+    assert len(lines) == 1
+    assert lines[0][1] == os.path.getsize(live_log)
+
+
+@pytest.mark.usefixtures("db")
+def test_parse_and_save_nginx_log__incremental(test_access_log_path):
+
+    assert parse_and_save_nginx_logs(test_access_log_path, incremental=True)
+    assert parse_and_save_nginx_logs(test_access_log_path, incremental=True)
+
+    # the last line has no line break yet
+    assert LogLine.query.count() == 11
+    assert IngestCheckpoint.query.count() == 1
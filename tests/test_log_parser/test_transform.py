@@ -1,4 +1,14 @@
-from nydata.log_parser.parser.transform import transform_nginx
+from datetime import datetime, timedelta
+
+import pytest
+from dateutil import parser
+
+from nydata.log_parser.parser.transform import (
+    get_timezone,
+    parse_fixed_nginx_time,
+    parse_nginx_time,
+    transform_nginx,
+)
 
 
 def test_transformer_nginx_log():
@@ -34,3 +44,42 @@ def test_transformer_nginx_log():
     assert date.second == 33
 
     assert result.timestamp == 1477399773
+
+
+def test_parse_fixed_nginx_time():
+    date = parse_fixed_nginx_time("07/Dec/2016:10:34:43 -0130")
+
+    assert date == datetime(2016, 12, 7, 10, 34, 43, tzinfo=get_timezone("-0130"))
+    assert date.utcoffset() == -timedelta(hours=1, minutes=30)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "07/Dez/2016:10:34:43 +0100",
+        "7/Dec/2016:10:34:43 +0100",
+        "07/Dec/2016 10:34:43 +0100",
+        "07/Dec/2016:10:34:43 0100",
+        "07/Dec/2016:1a:34:43 +0100",
+        "",
+    ],
+)
+def test_parse_fixed_nginx_time__invalid_layout(value):
+    with pytest.raises(ValueError):
+        parse_fixed_nginx_time(value)
+
+
+def test_parse_nginx_time__matches_dateutil():
+    value = "25/Oct/2016:14:49:33 +0200"
+    assert parse_nginx_time(value) == parser.parse(value, fuzzy=True)
+
+
+def test_parse_nginx_time__falls_back_to_dateutil():
+    date = parse_nginx_time("2016-10-25 14:49:33 +0200")
+
+    assert date.hour == 14
+    assert int(date.timestamp()) == 1477399773
+
+
+def test_get_timezone__is_cached():
+    assert get_timezone("+0200") is get_timezone("+0200")
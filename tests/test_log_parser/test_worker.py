@@ -0,0 +1,46 @@
+from threading import Event
+
+import pytest
+
+from nydata.log_parser.models import LogLine
+from nydata.log_parser.worker import run_ingest_worker
+
+
+@pytest.fixture
+def live_log(tmp_path, access_log_str):
+    """A log file with the first 5 lines of the sample access.log"""
+    file_path = tmp_path / "access.log"
+    lines = [line + "\n" for line in access_log_str.splitlines()]
+    file_path.write_text("".join(lines[:5]))
+    return file_path, lines
+
+
+@pytest.mark.usefixtures("db")
+def test_run_ingest_worker__reads_appended_lines_every_poll(live_log):
+    file_path, lines = live_log
+
+    assert run_ingest_worker(str(file_path), 0, max_polls=2, stop=Event()) == 5
+
+    with open(file_path, "a") as file_conn:
+        file_conn.writelines(lines[5:])
+
+    assert run_ingest_worker(str(file_path), 0, max_polls=1, stop=Event()) == 7
+    assert LogLine.query.count() == 12
+
+
+@pytest.mark.usefixtures("db")
+def test_run_ingest_worker__survives_missing_file(tmp_path):
+
+    missing = str(tmp_path / "rotated.log")
+    assert run_ingest_worker(missing, 0, max_polls=3, stop=Event()) == 0
+
+
+@pytest.mark.usefixtures("db")
+def test_run_ingest_worker__stops_when_signalled(live_log):
+    file_path, _ = live_log
+
+    stop = Event()
+    stop.set()
+
+    assert run_ingest_worker(str(file_path), 0, stop=stop) == 0
+    assert LogLine.query.count() == 0